@@ -0,0 +1,130 @@
+import logging
+import threading
+
+# dlib's HOG detector finds faces down to roughly 80x80 pixels in the image it is
+# given; every upsample halves that, every downscale multiplies it.
+HOG_MIN_FACE = 80
+
+# Keeps recognition inside a latency budget by trading resolution for speed.
+# Each processed frame reports its capture-to-result time; the controller
+# keeps an EWMA of it and every `cooldown` frames steps one knob:
+#   over budget:  drop an upsample, then shrink the scale, then skip more frames
+#   well under:   skip fewer frames, then grow the scale, then add an upsample
+# Scale and upsample never go below what still detects a face of min_face_size
+# pixels in the captured frame; by default that is whatever the starting
+# settings detect, so adapting never loses faces the fixed settings would find.
+class AdaptiveController:
+    def __init__(self, target_latency_ms=150.0, target_fps=None, workers=1, min_face_size=None,
+                 scale=0.25, min_scale=0.15, max_scale=1.0, scale_step=0.8, detection_interval=1,
+                 max_interval=6, upsample=1, max_upsample=2, alpha=0.2, cooldown=10, headroom=0.6):
+        # A processed-frame rate target is a per-frame budget shared by the workers
+        if target_fps:
+            target_latency_ms = min(target_latency_ms, 1000.0 * workers / target_fps)
+        self.target = target_latency_ms / 1000.0
+        self.scale = scale
+        self.upsample = upsample
+        self.min_face_size = min_face_size or self.detectable_face_size()
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.scale_step = scale_step
+        self.max_interval = max_interval
+        self.max_upsample = max_upsample
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.headroom = headroom
+        self.lock = threading.Lock()
+        self.detection_interval = max(1, detection_interval)
+        self.ewma = None
+        self.faces = 0
+        self.smallest_face = None
+        self.since_change = 0
+        self.adjustments = 0
+        self.last_decision = 'initial'
+        self._meet_floor()
+
+    # Smallest face (captured-frame pixels) the detector still finds at these settings
+    def detectable_face_size(self, scale=None, upsample=None):
+        scale = self.scale if scale is None else scale
+        upsample = self.upsample if upsample is None else upsample
+        return HOG_MIN_FACE / (scale * 2 ** upsample)
+
+    def _meets_floor(self, scale, upsample):
+        return self.detectable_face_size(scale, upsample) <= self.min_face_size
+
+    def _meet_floor(self):
+        while not self._meets_floor(self.scale, self.upsample):
+            if self.scale < self.max_scale:
+                self.scale = min(self.max_scale, self.scale / self.scale_step)
+            elif self.upsample < self.max_upsample:
+                self.upsample += 1
+            else:
+                logging.warning(f"Faces of {self.min_face_size}px are below what the detector can find "
+                                f"(~{self.detectable_face_size():.0f}px at full settings)")
+                break
+
+    # (scale, detection_interval, upsample) for the next frame
+    def settings(self):
+        with self.lock:
+            return self.scale, self.detection_interval, self.upsample
+
+    # `face_sizes` are the heights of the faces found, in captured-frame pixels
+    def observe(self, seconds, face_sizes=()):
+        with self.lock:
+            self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+            self.faces = len(face_sizes)
+            if face_sizes:
+                self.smallest_face = min(face_sizes)
+            self.since_change += 1
+            if self.since_change < self.cooldown:
+                return
+            if self.ewma > self.target:
+                decision = self._degrade()
+            elif self.ewma < self.target * self.headroom:
+                decision = self._improve()
+            else:
+                return
+            if decision:
+                self.since_change = 0
+                self.adjustments += 1
+                self.last_decision = decision
+                logging.info(f"Adaptive control: {decision} (latency {self.ewma * 1000:.0f} ms, "
+                             f"budget {self.target * 1000:.0f} ms)")
+
+    def _degrade(self):
+        if self.upsample > 0 and self._meets_floor(self.scale, self.upsample - 1):
+            self.upsample -= 1
+            return f"upsample -> {self.upsample}"
+        scale = max(self.min_scale, self.scale * self.scale_step)
+        if scale < self.scale and self._meets_floor(scale, self.upsample):
+            self.scale = scale
+            return f"scale -> {scale:.2f}"
+        if self.detection_interval < self.max_interval:
+            self.detection_interval += 1
+            return f"detection interval -> {self.detection_interval}"
+        return None
+
+    # Resolution steps are only taken when the latency, scaled by the growth in
+    # detector pixels, is predicted to stay inside the budget; an upsample
+    # quadruples the work, so without this it would flap on and off.
+    def _improve(self):
+        if self.detection_interval > 1:
+            self.detection_interval -= 1
+            return f"detection interval -> {self.detection_interval}"
+        scale = min(self.max_scale, self.scale / self.scale_step)
+        if scale > self.scale and self.ewma * (scale / self.scale) ** 2 <= self.target:
+            self.scale = scale
+            return f"scale -> {scale:.2f}"
+        if self.upsample < self.max_upsample and self.ewma * 4 <= self.target:
+            self.upsample += 1
+            return f"upsample -> {self.upsample}"
+        return None
+
+    def snapshot(self):
+        with self.lock:
+            return {'scale': round(self.scale, 3), 'detection_interval': self.detection_interval,
+                    'upsample': self.upsample,
+                    'latency_ewma_ms': self.ewma * 1000 if self.ewma is not None else None,
+                    'budget_ms': self.target * 1000, 'faces': self.faces,
+                    'smallest_face_px': self.smallest_face,
+                    'detectable_face_px': round(self.detectable_face_size(), 1),
+                    'adjustments': self.adjustments, 'last_decision': self.last_decision}
@@ -0,0 +1,140 @@
+import argparse
+import csv
+import io
+import logging
+import os
+import tempfile
+
+from smartface_db import connect, day_start_ts, migrate
+
+COLUMNS = ('name', 'time', 'date', 'camera', 'event')
+FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', '.xlsx'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+CHUNK_SIZE = 5000
+
+# Every exporter pulls rows through one SQLite cursor in CHUNK_SIZE batches, so
+# memory use is bounded by the chunk size rather than the table size. Only CSV
+# streams straight through; XLSX and Parquet are finished in a temporary file
+# (see iter_export), so those need disk space for the whole export. The
+# filters are the dashboard's (smartface_db.query_attendance), so an export
+# holds exactly the rows the filtered dashboard pages through.
+def iter_attendance_chunks(conn, start_day=None, end_day=None, name=None, camera=None, chunk_size=CHUNK_SIZE):
+    clauses = []
+    params = []
+    if start_day:
+        clauses.append("ts >= ?")
+        params.append(day_start_ts(start_day))
+    if end_day:
+        clauses.append("ts < ?")
+        params.append(day_start_ts(end_day) + 86400)
+    if name:
+        clauses.append("name = ?")
+        params.append(name)
+    if camera:
+        clauses.append("camera = ?")
+        params.append(camera)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cursor = conn.execute(f"SELECT name, time, date, camera, event FROM attendance_log {where} ORDER BY ts, id", params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield rows
+
+def iter_csv(conn, start_day=None, end_day=None, name=None, camera=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for rows in iter_attendance_chunks(conn, start_day, end_day, name, camera):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def write_csv(path, conn, start_day=None, end_day=None, name=None, camera=None):
+    with open(path, 'w', newline='') as f:
+        for chunk in iter_csv(conn, start_day, end_day, name, camera):
+            f.write(chunk)
+
+def write_xlsx(path, conn, start_day=None, end_day=None, name=None, camera=None):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('attendance')
+    sheet.append(COLUMNS)
+    for rows in iter_attendance_chunks(conn, start_day, end_day, name, camera):
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+
+def write_parquet(path, conn, start_day=None, end_day=None, name=None, camera=None):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([(column, pa.string()) for column in COLUMNS])
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in iter_attendance_chunks(conn, start_day, end_day, name, camera):
+            writer.write_table(pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in rows], schema=schema))
+
+WRITERS = {'csv': write_csv, 'xlsx': write_xlsx, 'parquet': write_parquet}
+
+def export_attendance(path, fmt='xlsx', db_path='smartface.db', start_day=None, end_day=None, name=None,
+                      camera=None):
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    conn = connect(db_path)
+    try:
+        migrate(conn)
+        WRITERS[fmt](path, conn, start_day, end_day, name, camera)
+    finally:
+        conn.close()
+    logging.info(f"Attendance exported to {path}")
+    return path
+
+# Yields the export in pieces for a streaming HTTP response. CSV is produced on
+# the fly; XLSX and Parquet need a seekable file, so they are written to a
+# temporary file first and streamed back from disk.
+def iter_export(fmt, db_path='smartface.db', start_day=None, end_day=None, name=None, camera=None,
+                read_size=1 << 16):
+    if fmt == 'csv':
+        conn = connect(db_path)
+        try:
+            for chunk in iter_csv(conn, start_day, end_day, name, camera):
+                yield chunk.encode()
+        finally:
+            conn.close()
+        return
+    fd, path = tempfile.mkstemp(suffix=FORMATS[fmt][1])
+    os.close(fd)
+    try:
+        export_attendance(path, fmt, db_path, start_day, end_day, name, camera)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(read_size), b''):
+                yield chunk
+    finally:
+        os.remove(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export attendance records from smartface.db")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='xlsx')
+    parser.add_argument('--output', help="Output file (default: attendance_export.<format>)")
+    parser.add_argument('--start', help="First day to include, YYYY-MM-DD")
+    parser.add_argument('--end', help="Last day to include, YYYY-MM-DD")
+    parser.add_argument('--name', help="Only this person")
+    parser.add_argument('--camera', help="Only this camera")
+    parser.add_argument('--db', default='smartface.db')
+    args = parser.parse_args()
+    export_attendance(args.output or f"attendance_export.{args.format}", args.format, args.db, args.start, args.end,
+                      args.name, args.camera)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
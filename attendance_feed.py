@@ -0,0 +1,153 @@
+import collections
+import threading
+import time
+from multiprocessing import AuthenticationError
+
+from metrics import FEED_CLIENTS, FEED_EVENTS_DROPPED, throttled_log
+from smartface_db import attendance_since, get_database, latest_attendance_id
+
+# Sources return the attendance records written after `after_id` (oldest first,
+# as smartface_db.attendance_since), waiting up to `timeout` seconds for some.
+
+# Polls the attendance table; sees rows from any writer (service, multi_camera.py,
+# batch_recognition.py). The tail query is a primary-key range scan.
+class DatabaseTail:
+    def __init__(self, db_path='smartface.db', poll_interval=0.5):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+
+    def __call__(self, after_id, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            with get_database(self.db_path).connection() as conn:
+                records = attendance_since(conn, after_id)
+            if records or time.monotonic() >= deadline:
+                return records
+            time.sleep(self.poll_interval)
+
+# Long-polls the recognition service, which answers as soon as its attendance
+# sink commits a batch. Falls back to `fallback` while no service is running
+# or it cannot be reached (e.g. its key changed).
+class ServiceTail:
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.service = None
+
+    def __call__(self, after_id, timeout):
+        from recognition_service import connect
+
+        try:
+            if self.service is None:
+                self.service = connect()
+            return self.service.wait_attendance(after_id, timeout)
+        except (OSError, EOFError, AuthenticationError):
+            self.service = None
+            return self.fallback(after_id, timeout)
+
+# One client's pending events. The buffer is bounded: when a client reads
+# slower than attendance is written, its oldest events are dropped and counted
+# in `missed`, so the client knows to reload instead of showing a table with
+# holes. A slow client never blocks the feed or the other clients.
+class FeedClient:
+    def __init__(self, buffer_size):
+        self.cond = threading.Condition()
+        self.buffer = collections.deque()
+        self.buffer_size = buffer_size
+        self.missed = 0
+        self.closed = False
+
+    def put(self, record):
+        with self.cond:
+            if len(self.buffer) >= self.buffer_size:
+                self.buffer.popleft()
+                self.missed += 1
+                FEED_EVENTS_DROPPED.inc()
+            self.buffer.append(record)
+            self.cond.notify()
+
+    # -> (records, missed since the last call); empty after `timeout` seconds
+    def get(self, timeout):
+        with self.cond:
+            self.cond.wait_for(lambda: self.buffer or self.closed, timeout)
+            records, missed = list(self.buffer), self.missed
+            self.buffer.clear()
+            self.missed = 0
+        return records, missed
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+# Fans new attendance out to every subscribed client. One thread per process
+# tails the source while anyone is subscribed and copies each record into the
+# clients' buffers; subscribe() returns None once max_clients are connected, as
+# each streaming response holds a server thread for as long as it is open.
+class AttendanceFeed:
+    def __init__(self, source, buffer_size=256, max_clients=100, wait_timeout=15.0):
+        self.source = source
+        self.buffer_size = buffer_size
+        self.max_clients = max_clients
+        self.wait_timeout = wait_timeout
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.thread = None
+        self.last_id = None
+
+    def subscribe(self, start_id):
+        with self.lock:
+            if len(self.clients) >= self.max_clients:
+                return None
+            client = FeedClient(self.buffer_size)
+            self.clients.add(client)
+            FEED_CLIENTS.set(len(self.clients))
+            if self.thread is None:
+                self.last_id = start_id
+                self.thread = threading.Thread(target=self._run, name='attendance-feed', daemon=True)
+                self.thread.start()
+        return client
+
+    def full(self):
+        with self.lock:
+            return len(self.clients) >= self.max_clients
+
+    def unsubscribe(self, client):
+        client.close()
+        with self.lock:
+            self.clients.discard(client)
+            FEED_CLIENTS.set(len(self.clients))
+
+    def publish(self, records):
+        with self.lock:
+            clients = list(self.clients)
+        for record in records:
+            for client in clients:
+                client.put(record)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.clients:
+                    self.thread = None
+                    return
+                last_id = self.last_id
+            try:
+                records = self.source(last_id, self.wait_timeout)
+            except Exception as e:
+                throttled_log.error('attendance-feed', f"Attendance feed error: {e}")
+                time.sleep(1.0)
+                continue
+            if records:
+                with self.lock:
+                    self.last_id = records[-1]['id']
+                self.publish(records)
+
+def current_attendance_id(db_path='smartface.db'):
+    with get_database(db_path).connection() as conn:
+        return latest_attendance_id(conn)
+
+# Replay for a reconnecting client (EventSource sends Last-Event-ID): rows it
+# has not seen, up to `limit`; more than that and it should reload instead.
+def attendance_after(db_path, after_id, limit):
+    with get_database(db_path).connection() as conn:
+        return attendance_since(conn, after_id, limit)
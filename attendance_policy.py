@@ -0,0 +1,147 @@
+import abc
+import collections
+import os
+import threading
+
+from smartface_db import attendance_day, connect, last_attendance, migrate
+
+DEFAULT_POLICY = os.environ.get('SMARTFACE_DEDUP_POLICY', 'once_per_day')
+LRU_SIZE = 10000
+
+# Decides which sightings become attendance rows. check() is called for every
+# sighting and returns (event, dedup_key) for a row worth writing or None for a
+# duplicate, so duplicates are dropped in memory before they reach SQLite; once
+# the row is really buffered the caller reports it with commit(), so a row that
+# is dropped later (full buffer, closed sink) does not count as logged. The
+# last logged sighting of each person is kept in an LRU; on a miss (first
+# sighting since start, or evicted) it is read back from the attendance table,
+# so a restart does not re-log anyone. dedup_key is stored with the row under
+# UNIQUE (person_id, dedup_key), which catches what the in-memory check cannot
+# see: other processes writing the same person at the same moment.
+class DedupPolicy(abc.ABC):
+    def __init__(self, db_path='smartface.db', lru_size=LRU_SIZE):
+        self.db_path = db_path
+        self.lru_size = lru_size
+        self.lock = threading.Lock()
+        self.recent = collections.OrderedDict()
+        self.conn = None
+        self.suppressed = 0
+
+    def _lookup(self, name):
+        if self.db_path is None:
+            return None
+        if self.conn is None:
+            self.conn = connect(self.db_path)
+            migrate(self.conn)
+        return last_attendance(self.conn, name)
+
+    # -> (ts, day, event, rows that day) of the last logged sighting, or None
+    def _last(self, name):
+        if name in self.recent:
+            self.recent.move_to_end(name)
+            return self.recent[name]
+        last = self._lookup(name)
+        self._remember(name, last)
+        return last
+
+    def _remember(self, name, state):
+        self.recent[name] = state
+        self.recent.move_to_end(name)
+        while len(self.recent) > self.lru_size:
+            self.recent.popitem(last=False)
+
+    def check(self, name, ts, camera='default'):
+        with self.lock:
+            decision = self.decide(self._last(name), ts, attendance_day(ts), camera)
+            if decision is None:
+                self.suppressed += 1
+            return decision
+
+    def commit(self, name, ts, decision):
+        day = attendance_day(ts)
+        with self.lock:
+            last = self._last(name)
+            count = last[3] + 1 if last is not None and last[1] == day else 1
+            self._remember(name, (ts, day, decision[0], count))
+
+    # check() and commit() in one step, for callers that always keep the row
+    def admit(self, name, ts, camera='default'):
+        decision = self.check(name, ts, camera)
+        if decision is not None:
+            self.commit(name, ts, decision)
+        return decision
+
+    @abc.abstractmethod
+    def decide(self, last, ts, day, camera):
+        pass
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+# One 'entry' row per person per day (the behaviour before policies existed)
+class OncePerDayPolicy(DedupPolicy):
+    name = 'once_per_day'
+
+    def decide(self, last, ts, day, camera):
+        if last is not None and last[1] == day:
+            return None
+        return 'entry', day
+
+# At most one row per person every `seconds`. The key is the cooldown bucket:
+# two admitted rows are at least `seconds` apart, so they never share one.
+class CooldownPolicy(DedupPolicy):
+    name = 'cooldown'
+
+    def __init__(self, seconds=600, **kwargs):
+        super().__init__(**kwargs)
+        self.seconds = seconds
+
+    def decide(self, last, ts, day, camera):
+        if last is not None and ts - last[0] < self.seconds:
+            return None
+        return 'entry', f"cooldown:{int(ts // self.seconds)}"
+
+# Alternating entry and exit rows. Sightings on exit_cameras are exits, others
+# entries; with no exit cameras (one door) a person seen again after min_gap
+# seconds toggles between the two. A repeat of the last event, or anything
+# within min_gap of it, is a duplicate. The key numbers the person's events of
+# the day.
+class EntryExitPolicy(DedupPolicy):
+    name = 'entry_exit'
+
+    def __init__(self, exit_cameras=(), min_gap=300, **kwargs):
+        super().__init__(**kwargs)
+        self.exit_cameras = set(exit_cameras)
+        self.min_gap = min_gap
+
+    def decide(self, last, ts, day, camera):
+        today = last is not None and last[1] == day
+        last_event = last[2] if today else 'exit'
+        if self.exit_cameras:
+            event = 'exit' if camera in self.exit_cameras else 'entry'
+        else:
+            event = 'exit' if last_event == 'entry' else 'entry'
+        if event == last_event or (today and ts - last[0] < self.min_gap):
+            return None
+        return event, f"{day}#{last[3] + 1 if today else 1}"
+
+POLICIES = {policy.name: policy for policy in (OncePerDayPolicy, CooldownPolicy, EntryExitPolicy)}
+
+# Spec strings, as used by SMARTFACE_DEDUP_POLICY and --dedup options:
+#   once_per_day
+#   cooldown:600                 (seconds)
+#   entry_exit                   (one door, toggles; min_gap 300 s)
+#   entry_exit:exit-cam,cam3     (exits on the listed cameras)
+def make_policy(spec=None, db_path='smartface.db'):
+    spec = spec or DEFAULT_POLICY
+    kind, _, argument = spec.partition(':')
+    if kind not in POLICIES:
+        raise ValueError(f"Unknown dedup policy: {kind} (choose from {', '.join(POLICIES)})")
+    if kind == 'cooldown':
+        return CooldownPolicy(float(argument) if argument else 600, db_path=db_path)
+    if kind == 'entry_exit':
+        return EntryExitPolicy([camera for camera in argument.split(',') if camera], db_path=db_path)
+    return OncePerDayPolicy(db_path=db_path)
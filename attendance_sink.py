@@ -0,0 +1,140 @@
+import atexit
+import logging
+import sqlite3
+import threading
+import time
+
+from attendance_policy import make_policy
+from metrics import (ATTENDANCE_DROPPED, ATTENDANCE_PENDING, ATTENDANCE_SUPPRESSED, ATTENDANCE_WRITTEN,
+                     DB_WRITE_LATENCY, throttled_log)
+from smartface_db import connect, insert_attendance, migrate, now_ts
+
+# Buffers attendance rows and writes them from one background thread that owns a
+# single long-lived WAL-mode connection. Rows are flushed with executemany once
+# batch_size rows are pending or flush_interval seconds have passed, whichever
+# comes first; flush() blocks until everything recorded so far is committed and
+# close() (also registered with atexit) drains the buffer before stopping.
+# Every sighting goes through the dedup policy first (default from
+# SMARTFACE_DEDUP_POLICY, once per day), so repeats never reach the buffer.
+class AttendanceSink:
+    def __init__(self, db_path='smartface.db', batch_size=100, flush_interval=1.0,
+                 max_pending=10000, on_write=None, policy=None):
+        self.db_path = db_path
+        self.policy = policy or make_policy(db_path=db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.on_write = on_write
+        self.cond = threading.Condition()
+        self.pending = []
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.flush_requested = False
+        self.closed = False
+        self.thread = threading.Thread(target=self._writer_loop, name='attendance-sink', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # Returns True when the sighting was buffered as a new attendance row. The
+    # policy only learns about the row once it is in the buffer, so a dropped
+    # row does not suppress the person's later sightings.
+    def record(self, name, ts=None, camera='default'):
+        ts = now_ts() if ts is None else ts
+        with self.cond:
+            if self.closed:
+                ATTENDANCE_DROPPED.labels('closed').inc()
+                logging.error(f"Attendance sink closed; dropped record for {name}")
+                return False
+            decision = self.policy.check(name, ts, camera)
+            if decision is None:
+                ATTENDANCE_SUPPRESSED.labels(self.policy.name).inc()
+                return False
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                ATTENDANCE_DROPPED.labels('buffer_full').inc()
+                throttled_log.error('attendance-buffer-full', f"Attendance buffer full; dropped record for {name}")
+                return False
+            self.pending.append((name, ts, camera) + decision)
+            self.policy.commit(name, ts, decision)
+            ATTENDANCE_PENDING.inc()
+            self.recorded += 1
+            if len(self.pending) >= self.batch_size:
+                self.cond.notify_all()
+        return True
+
+    def pending_count(self):
+        with self.cond:
+            return len(self.pending)
+
+    def flush(self, timeout=10):
+        with self.cond:
+            target = self.recorded
+            self.flush_requested = True
+            self.cond.notify_all()
+            return self.cond.wait_for(lambda: self.written >= target or not self.thread.is_alive(), timeout)
+
+    def close(self, timeout=10):
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+        self.policy.close()
+        atexit.unregister(self.close)
+        logging.info(f"Attendance sink closed after writing {self.written} records")
+
+    def _connect(self):
+        conn = connect(self.db_path)
+        migrate(conn)
+        return conn
+
+    def _writer_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                with self.cond:
+                    deadline = time.monotonic() + self.flush_interval
+                    self.cond.wait_for(lambda: self.closed or self.flush_requested
+                                       or len(self.pending) >= self.batch_size,
+                                       max(0.0, deadline - time.monotonic()))
+                    batch, self.pending = self.pending, []
+                    ATTENDANCE_PENDING.dec(len(batch))
+                    self.flush_requested = False
+                    closing = self.closed
+                if batch:
+                    self._write(conn, batch)
+                with self.cond:
+                    self.written += len(batch)
+                    self.cond.notify_all()
+                if closing:
+                    with self.cond:
+                        if not self.pending:
+                            break
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        start = time.perf_counter()
+        for attempt in range(3):
+            try:
+                with conn:
+                    inserted = insert_attendance(conn, batch)
+                ATTENDANCE_WRITTEN.labels('inserted').inc(inserted)
+                ATTENDANCE_WRITTEN.labels('duplicate').inc(len(batch) - inserted)
+                logging.info(f"Attendance marked for {', '.join(row[0] for row in batch)} "
+                             f"({len(batch) - inserted} already recorded)")
+                break
+            except sqlite3.OperationalError as e:
+                logging.warning(f"Attendance write failed ({e}), attempt {attempt + 1}/3")
+                time.sleep(0.1 * (attempt + 1))
+            except sqlite3.DatabaseError as e:
+                logging.error(f"Database error: {e}")
+                break
+        else:
+            ATTENDANCE_DROPPED.labels('write_failed').inc(len(batch))
+            logging.error(f"Dropped {len(batch)} attendance records after repeated write failures")
+        DB_WRITE_LATENCY.observe(time.perf_counter() - start)
+        if self.on_write:
+            self.on_write(time.perf_counter() - start, len(batch))
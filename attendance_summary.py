@@ -0,0 +1,148 @@
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta
+
+from smartface_db import DB_PATH, get_database, rebuild_attendance_rollups
+
+# HH:MM, zero-padded: SQLite's date functions return NULL for '9:00', which
+# would silently count nobody as late. Raises ValueError for anything else.
+def clock_time(value):
+    return datetime.strptime(value, '%H:%M').strftime('%H:%M')
+
+LATE_AFTER = clock_time(os.environ.get('SMARTFACE_LATE_AFTER', '09:00'))
+# Days people_summary covers when no start day is given
+PEOPLE_SUMMARY_DAYS = 31
+
+# Reports answered from the rollup tables of schema version 5 (attendance_daily,
+# one row per person and day, and attendance_day_totals, one row per day), so
+# their cost depends on the days and people asked about, not on how many
+# sightings were logged. A person is late on a day when their first sighting is
+# after late_after (local HH:MM).
+def _range(column, start_day, end_day):
+    clauses, params = [], []
+    if start_day:
+        clauses.append(f"{column} >= ?")
+        params.append(start_day)
+    if end_day:
+        clauses.append(f"{column} <= ?")
+        params.append(end_day)
+    return clauses, params
+
+def _where(clauses):
+    return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+# Late if first_ts is after late_after on that (local) day
+def _late_sql(alias='d'):
+    return f"{alias}.first_ts > CAST(strftime('%s', {alias}.day || ' ' || ?, 'utc') AS INTEGER)"
+
+def _clock(ts):
+    return datetime.fromtimestamp(ts).strftime("%H:%M:%S")
+
+# Headcount, events and late arrivals per day, newest first
+def day_summary(conn, start_day=None, end_day=None, late_after=LATE_AFTER, limit=31):
+    late_after = clock_time(late_after)
+    clauses, params = _range('t.day', start_day, end_day)
+    rows = conn.execute(f'''SELECT t.day, t.people, t.events,
+                                   (SELECT COUNT(*) FROM attendance_daily d
+                                    WHERE d.day = t.day AND {_late_sql()}) AS late
+                            FROM attendance_day_totals t
+                            {_where(clauses)}
+                            ORDER BY t.day DESC
+                            LIMIT ?''', [late_after] + params + [limit])
+    return [{'day': day, 'people': people, 'events': events, 'late': late} for day, people, events, late in rows]
+
+# Distinct people, person-days and events per ISO week, keyed by its Monday
+# (a week crossing the new year stays one week, unlike strftime's %W)
+def week_summary(conn, start_day=None, end_day=None, limit=12):
+    clauses, params = _range('day', start_day, end_day)
+    rows = conn.execute(f'''SELECT date(day, '-6 days', 'weekday 1') AS week, MIN(day), MAX(day),
+                                   COUNT(DISTINCT person_id), COUNT(*), SUM(events)
+                            FROM attendance_daily
+                            {_where(clauses)}
+                            GROUP BY week
+                            ORDER BY week DESC
+                            LIMIT ?''', params + [limit])
+    return [{'week': week, 'first_day': first_day, 'last_day': last_day, 'people': people,
+             'person_days': person_days, 'events': events}
+            for week, first_day, last_day, people, person_days, events in rows]
+
+# Per person over the range: days present, days late, first and last sighting.
+# Without a start day the range is the last `days` days up to end_day (or the
+# latest day with attendance), so the scan of attendance_daily is bounded by
+# days x people rather than growing with the whole history.
+def people_summary(conn, start_day=None, end_day=None, late_after=LATE_AFTER, days=PEOPLE_SUMMARY_DAYS):
+    late_after = clock_time(late_after)
+    if not start_day:
+        last_day = end_day or conn.execute("SELECT MAX(day) FROM attendance_day_totals").fetchone()[0]
+        if last_day is None:
+            return []
+        start_day = (datetime.strptime(last_day, '%Y-%m-%d') - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    clauses, params = _range('d.day', start_day, end_day)
+    rows = conn.execute(f'''SELECT p.name, COUNT(*), SUM({_late_sql()}), MIN(d.first_ts), MAX(d.last_ts),
+                                   SUM(d.events)
+                            FROM attendance_daily d JOIN people p ON p.id = d.person_id
+                            {_where(clauses)}
+                            GROUP BY d.person_id
+                            ORDER BY p.name''', [late_after] + params)
+    return [{'name': name, 'days': days, 'late': late, 'first_seen': datetime.fromtimestamp(first_ts).isoformat(' '),
+             'last_seen': datetime.fromtimestamp(last_ts).isoformat(' '), 'events': events}
+            for name, days, late, first_ts, last_ts, events in rows]
+
+# One person's days, newest first: first/last sighting and whether they were late
+def person_days(conn, name, start_day=None, end_day=None, late_after=LATE_AFTER, limit=31):
+    late_after = clock_time(late_after)
+    clauses, params = _range('d.day', start_day, end_day)
+    clauses.insert(0, "d.person_id = (SELECT id FROM people WHERE name = ?)")
+    rows = conn.execute(f'''SELECT d.day, d.first_ts, d.last_ts, d.events, d.entries, d.exits, {_late_sql()}
+                            FROM attendance_daily d
+                            {_where(clauses)}
+                            ORDER BY d.day DESC
+                            LIMIT ?''', [late_after, name] + params + [limit])
+    return [{'day': day, 'first_seen': _clock(first_ts), 'last_seen': _clock(last_ts), 'events': events,
+             'entries': entries, 'exits': exits, 'late': bool(late)}
+            for day, first_ts, last_ts, events, entries, exits, late in rows]
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Attendance rollups: rebuild them or print a summary")
+    parser.add_argument('--db', default=DB_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = commands.add_parser('rebuild', help="Recompute the rollups from the attendance rows")
+    rebuild_parser.add_argument('--start', help="First day to rebuild (YYYY-MM-DD)")
+    rebuild_parser.add_argument('--end', help="Last day to rebuild (YYYY-MM-DD)")
+    show_parser = commands.add_parser('show', help="Print per-day, per-week or per-person summaries")
+    show_parser.add_argument('view', choices=('days', 'weeks', 'people', 'person'))
+    show_parser.add_argument('--name', help="Person, for the 'person' view")
+    show_parser.add_argument('--start')
+    show_parser.add_argument('--end')
+    show_parser.add_argument('--late-after', type=clock_time, default=LATE_AFTER, help="HH:MM")
+    args = parser.parse_args()
+
+    database = get_database(args.db)
+    if args.command == 'rebuild':
+        with database.transaction() as conn:
+            rows = rebuild_attendance_rollups(conn, args.start, args.end)
+        logging.info(f"Rebuilt {rows} person-day rollups")
+        return
+    if args.view == 'person' and not args.name:
+        parser.error("the 'person' view needs --name")
+    with database.connection() as conn:
+        if args.view == 'days':
+            rows = day_summary(conn, args.start, args.end, args.late_after)
+        elif args.view == 'weeks':
+            rows = week_summary(conn, args.start, args.end)
+        elif args.view == 'people':
+            rows = people_summary(conn, args.start, args.end, args.late_after)
+        else:
+            rows = person_days(conn, args.name, args.start, args.end, args.late_after)
+    if not rows:
+        print("No attendance in range")
+        return
+    columns = list(rows[0])
+    print('  '.join(f"{column:>12}" for column in columns))
+    for row in rows:
+        print('  '.join(f"{str(row[column]):>12}" for column in columns))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import collections
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import LOGIN_ATTEMPTS, LOGIN_LATENCY, throttled_log
+from smartface_db import get_database, migrate
+
+# Password hashes in the users table come in two formats: werkzeug's
+# 'pbkdf2:sha256:...' strings (web_app.py) and bcrypt hashes (streamlit_app.py,
+# stored as bytes). bcrypt is only imported when a bcrypt hash is met.
+def hash_password(password, scheme='pbkdf2'):
+    if scheme == 'bcrypt':
+        import bcrypt
+
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    return generate_password_hash(password, method='pbkdf2:sha256')
+
+def check_password(stored, password):
+    if isinstance(stored, bytes) or stored.startswith('$2'):
+        import bcrypt
+
+        stored = stored if isinstance(stored, bytes) else stored.encode()
+        return bcrypt.checkpw(password.encode(), stored)
+    return check_password_hash(stored, password)
+
+# The users table itself comes from the schema migrations (version 4). The
+# default admin password is hashed only when the admin row is missing (hashing
+# it on every start cost a full pbkdf2 round for nothing).
+def init_users_table(conn, admin_password='admin123', scheme='pbkdf2'):
+    migrate(conn)
+    if conn.execute("SELECT 1 FROM users WHERE username = 'admin'").fetchone() is None:
+        conn.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                     ('admin', hash_password(admin_password, scheme), 'admin'))
+    conn.commit()
+
+# In-memory token buckets, one per key (client IP or username): each holds up to
+# `burst` tokens and refills at `rate` tokens per second. Idle buckets that have
+# refilled completely are dropped once more than max_keys are tracked.
+class RateLimiter:
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def _tokens(self, key, now):
+        tokens, updated = self.buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    # Takes a token if one is left; -> whether one was
+    def allow(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            tokens = self._tokens(key, now)
+            allowed = tokens >= 1
+            self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self._prune(now)
+            return allowed
+
+    # Whether a token is left, without taking it
+    def available(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return self._tokens(key, now) >= 1
+
+    def _prune(self, now):
+        for key, (tokens, updated) in list(self.buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.burst:
+                del self.buckets[key]
+
+# Login checks for the web apps. Users are read through the shared connection
+# pool and cached for cache_ttl seconds (unknown names too, so a flood of made-up
+# usernames does not reach SQLite). Password checks run on a small thread pool:
+# pbkdf2 and bcrypt release the GIL, so hash_workers bounds the CPU spent on
+# hashing no matter how many requests arrive, and once max_pending checks are
+# queued further logins are refused as 'busy' instead of piling up. Attempts
+# are rate limited per client IP before any hashing happens. Failed attempts
+# are also limited per (username, client IP): only failures use up that bucket,
+# and it is per client, so someone guessing at 'admin' from one address neither
+# locks the real admin out nor gets more guesses by cycling usernames.
+# User lookups are cached in an LRU of at most cache_size names.
+#
+# authenticate() returns (result, role) with result one of 'ok', 'invalid',
+# 'rate_limited' or 'busy'.
+class AuthService:
+    def __init__(self, db_path='smartface.db', scheme='pbkdf2', hash_workers=2, max_pending=32,
+                 ip_rate=(1.0, 20), user_rate=(0.2, 5), cache_ttl=60.0, cache_size=10000, check_timeout=10.0):
+        self.db_path = db_path
+        self.scheme = scheme
+        self.database = get_database(db_path)
+        with self.database.connection() as conn:
+            init_users_table(conn, scheme=scheme)
+        self.executor = ThreadPoolExecutor(hash_workers, thread_name_prefix='password-hash')
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.ip_limiter = RateLimiter(*ip_rate)
+        self.user_limiter = RateLimiter(*user_rate)
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.check_timeout = check_timeout
+        self.cache_lock = threading.Lock()
+        self.cache = collections.OrderedDict()
+
+    # -> (password_hash, role), or None for an unknown user
+    def lookup(self, username):
+        now = time.monotonic()
+        with self.cache_lock:
+            entry = self.cache.get(username)
+            if entry is not None and now - entry[1] < self.cache_ttl:
+                return entry[0]
+        user = self.database.query_one("SELECT password_hash, role FROM users WHERE username = ?", (username,))
+        with self.cache_lock:
+            self.cache[username] = (user, now)
+            self.cache.move_to_end(username)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return user
+
+    def invalidate(self, username=None):
+        with self.cache_lock:
+            if username is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(username, None)
+
+    def _run_bounded(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            return None
+        try:
+            future = self.executor.submit(fn, *args)
+        except RuntimeError:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def authenticate(self, username, password, ip=None):
+        start = time.perf_counter()
+        result, role = self._authenticate(username, password, ip)
+        LOGIN_ATTEMPTS.labels(result).inc()
+        LOGIN_LATENCY.observe(time.perf_counter() - start)
+        return result, role
+
+    def _authenticate(self, username, password, ip):
+        if ip is not None and not self.ip_limiter.allow(ip):
+            throttled_log.warning(f"login-ip-{ip}", f"Login rate limit hit for {ip}")
+            return 'rate_limited', None
+        user_key = (username, ip) if ip is not None else username
+        if not self.user_limiter.available(user_key):
+            throttled_log.warning(f"login-user-{username}", f"Login rate limit hit for user {username}")
+            return 'rate_limited', None
+        user = self.lookup(username)
+        if user is None:
+            self.user_limiter.allow(user_key)
+            return 'invalid', None
+        future = self._run_bounded(check_password, user[0], password)
+        if future is None:
+            throttled_log.warning('login-busy', "Password check queue full; refusing login")
+            return 'busy', None
+        try:
+            valid = future.result(self.check_timeout)
+        except FutureTimeout:
+            return 'busy', None
+        except ValueError as e:
+            logging.error(f"Unreadable password hash for {username}: {e}")
+            return 'invalid', None
+        if not valid:
+            self.user_limiter.allow(user_key)
+            return 'invalid', None
+        return 'ok', user[1] or 'user'
+
+    # Returns False when the username is taken; hashing runs on the same pool
+    def register(self, username, password, role='user'):
+        future = self._run_bounded(hash_password, password, self.scheme)
+        password_hash = future.result() if future is not None else hash_password(password, self.scheme)
+        try:
+            self.database.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                                  (username, password_hash, role))
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            self.invalidate(username)
+        return True
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,280 @@
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import cv2
+import face_recognition
+
+from face_recognition_live import load_known_faces
+from attendance_policy import make_policy
+from gallery_index import build_gallery_index
+from recognition_pipeline import recognize_frame
+from smartface_db import connect, insert_attendance, migrate
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.webm')
+# Beyond this many frames between samples, seeking is cheaper than grab()ing through
+SEEK_THRESHOLD = 60
+
+# ---------------------- Worker process ----------------------
+_worker = {}
+
+def _init_worker(images_path, scale, tolerance, confidence_threshold):
+    known_face_encodings, known_face_names = load_known_faces(images_path)
+    _worker['matcher'] = build_gallery_index(known_face_encodings, known_face_names)
+    _worker['options'] = dict(scale=scale, tolerance=tolerance, confidence_threshold=confidence_threshold)
+
+def _recognize(frame):
+    return recognize_frame(frame, _worker['matcher'], **_worker['options'])
+
+# Keeps the first sighting of each person in a unit; the dedup policy would
+# suppress the later ones anyway, this just keeps them off the wire.
+def _first_sightings(sightings):
+    first = {}
+    for name, ts in sightings:
+        if name != "Unknown" and (name not in first or ts < first[name]):
+            first[name] = ts
+    return list(first.items())
+
+def process_video_unit(task):
+    source, unit, start_frame, end_frame, every, base_ts, fps = task
+    cap = cv2.VideoCapture(source)
+    sightings, frames, faces = [], 0, 0
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        for index in range(start_frame, end_frame, every):
+            if every >= SEEK_THRESHOLD and index != start_frame:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            locations, names, _ = _recognize(frame)
+            frames += 1
+            faces += len(locations)
+            sightings += [(name, base_ts + index / fps) for name in names]
+            if every < SEEK_THRESHOLD:
+                for _ in range(every - 1):
+                    if not cap.grab():
+                        break
+    finally:
+        cap.release()
+    return [(source, unit, _first_sightings(sightings), frames, faces)]
+
+def process_image_batch(task):
+    results = []
+    for source, ts in task:
+        try:
+            frame = cv2.cvtColor(face_recognition.load_image_file(source), cv2.COLOR_RGB2BGR)
+            locations, names, _ = _recognize(frame)
+        except Exception as e:
+            logging.error(f"Failed to process {source}: {e}")
+            locations, names = [], []
+        results.append((source, 0, _first_sightings((name, ts) for name in names), 1, len(locations)))
+    return results
+
+# ---------------------- Work planning ----------------------
+def image_timestamp(path):
+    try:
+        from PIL import Image
+        with Image.open(path) as image:
+            taken = image.getexif().get(36867) or image.getexif().get(306)  # DateTimeOriginal, DateTime
+        if taken:
+            return datetime.strptime(taken, "%Y:%m:%d %H:%M:%S").timestamp()
+    except Exception:
+        pass
+    return os.path.getmtime(path)
+
+def plan_video(path, every, segment, start_time=None):
+    cap = cv2.VideoCapture(path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+    if frame_count <= 0:
+        logging.error(f"Could not read frame count of {path}")
+        return []
+    # Without an explicit start, assume the file was last written when recording ended
+    base_ts = start_time if start_time is not None else os.path.getmtime(path) - frame_count / fps
+    span = every * segment
+    return [(path, unit, unit * span, min((unit + 1) * span, frame_count), every, base_ts, fps)
+            for unit in range((frame_count + span - 1) // span)]
+
+# Sorted by time so that unit order is time order, like the units of a video
+def plan_images(paths, batch):
+    entries = sorted(((path, image_timestamp(path)) for path in paths), key=lambda entry: (entry[1], entry[0]))
+    return [entries[i:i + batch] for i in range(0, len(entries), batch)]
+
+def collect_inputs(inputs):
+    videos, images = [], []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for file in sorted(files):
+                    path = os.path.abspath(os.path.join(root, file))
+                    if file.lower().endswith(IMAGE_EXTENSIONS):
+                        images.append(path)
+                    elif file.lower().endswith(VIDEO_EXTENSIONS):
+                        videos.append(path)
+        elif item.lower().endswith(IMAGE_EXTENSIONS):
+            images.append(os.path.abspath(item))
+        else:
+            videos.append(os.path.abspath(item))
+    return videos, images
+
+# ---------------------- Ordered commit ----------------------
+# Units finish in any order, but the dedup policy must see sightings in time
+# order (a cooldown that admitted 10:30 first would drop 09:00). Finished units
+# are held back until every earlier unit is in; a failed unit stops the later
+# units of its stream from being committed, so a retry never lands behind them.
+class UnitOrder:
+    def __init__(self, streams):
+        self.streams = streams
+        self.finished = {}
+        self.next = 0
+        self.blocked = set()
+
+    # -> ([(index, results)] ready to commit in unit order, units held back for the next run)
+    def done(self, index, results):
+        self.finished[index] = results
+        ready, deferred = [], 0
+        while self.next in self.finished:
+            index, results = self.next, self.finished.pop(self.next)
+            stream = self.streams[index]
+            self.next += 1
+            if results is None:
+                self.blocked.add(stream)
+            elif stream in self.blocked:
+                deferred += 1
+            else:
+                ready.append((index, results))
+        return ready, deferred
+
+def commit_units(conn, policy, results, camera=None, sampling=(None, None)):
+    totals = {'frames': 0, 'faces': 0, 'inserted': 0, 'units': 0}
+    for source, unit, sightings, frames, faces in results:
+        label = camera or os.path.basename(source)
+        rows = []
+        for name, ts in sorted(sightings, key=lambda sighting: sighting[1]):
+            decision = policy.admit(name, ts, label)
+            if decision is not None:
+                rows.append((name, ts, label) + decision)
+        with conn:
+            totals['inserted'] += insert_attendance(conn, rows)
+            conn.execute("INSERT OR REPLACE INTO batch_progress (source, unit, frames, faces, every, segment) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (source, unit, frames, faces) + sampling)
+        totals['frames'] += frames
+        totals['faces'] += faces
+        totals['units'] += 1
+    return totals
+
+# ---------------------- Main ----------------------
+def run_batch(inputs, db_path='smartface.db', images_path='images', every=5, segment=200, batch=32,
+              workers=None, camera=None, start_time=None, scale=0.25, tolerance=0.6, confidence_threshold=0.6,
+              dedup=None):
+    conn = connect(db_path)
+    migrate(conn)
+    policy = make_policy(dedup, db_path)
+    progress = {(source, unit): settings for source, unit, *settings in
+                conn.execute("SELECT source, unit, every, segment FROM batch_progress")}
+    done = set(progress)
+
+    # Populate the encoding cache once here so the workers only read it
+    load_known_faces(images_path)
+
+    videos, images = collect_inputs(inputs)
+    # Units are frame ranges derived from every and segment; resuming a video
+    # with other values would skip or repeat frames
+    for path in videos:
+        used = {tuple(settings) for (source, _), settings in progress.items() if source == path}
+        if used - {(every, segment), (None, None)}:
+            conn.close()
+            policy.close()
+            raise ValueError(f"{path} was partly processed with --every/--segment {sorted(used - {(None, None)})}, "
+                             f"not {every}/{segment}; resume with those or clear its batch_progress rows")
+        if (None, None) in used:
+            logging.warning(f"{path} was partly processed before sampling settings were recorded; "
+                            f"resuming assumes --every {every} --segment {segment}")
+    tasks = []
+    for path in videos:
+        tasks += [(process_video_unit, task) for task in plan_video(path, every, segment, start_time)
+                  if (task[0], task[1]) not in done]
+    pending_images = [path for path in images if (path, 0) not in done]
+    tasks += [(process_image_batch, task) for task in plan_images(pending_images, batch)]
+    logging.info(f"{len(videos)} videos, {len(images)} images: {len(tasks)} work units queued, "
+                 f"{len(done)} completed in earlier runs")
+
+    totals = {'frames': 0, 'faces': 0, 'inserted': 0, 'units': 0, 'failed': 0, 'deferred': 0}
+    # Each video is its own stream; photos are one stream ordered by time
+    order = UnitOrder([task[0] if fn is process_video_unit else None for fn, task in tasks])
+    start = time.perf_counter()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(images_path, scale, tolerance, confidence_threshold))
+    try:
+        futures = {executor.submit(fn, task): index for index, (fn, task) in enumerate(tasks)}
+        for future in as_completed(futures):
+            index = futures[future]
+            # A failed unit stays unmarked, so the next run retries it
+            try:
+                results = future.result()
+            except Exception as e:
+                fn, task = tasks[index]
+                unit = (f"{task[0]} unit {task[1]}" if fn is process_video_unit
+                        else f"{len(task)} images from {task[0][0]}")
+                logging.error(f"Work unit failed ({unit}): {e}")
+                totals['failed'] += 1
+                results = None
+            ready, deferred = order.done(index, results)
+            totals['deferred'] += deferred
+            for index, results in ready:
+                sampling = (every, segment) if tasks[index][0] is process_video_unit else (None, None)
+                for key, value in commit_units(conn, policy, results, camera, sampling).items():
+                    totals[key] += value
+            elapsed = time.perf_counter() - start
+            logging.info(f"{totals['units']} units done: {totals['frames'] / elapsed:.1f} frames/s, "
+                         f"{totals['faces'] / elapsed:.1f} faces/s")
+    except KeyboardInterrupt:
+        logging.warning("Interrupted; completed units are saved and will be skipped on the next run")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        policy.close()
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Processed {totals['frames']} frames with {totals['faces']} faces in {elapsed:.1f}s "
+                 f"({totals['frames'] / max(elapsed, 1e-9):.1f} frames/s, "
+                 f"{totals['faces'] / max(elapsed, 1e-9):.1f} faces/s); "
+                 f"{totals['inserted']} attendance rows added"
+                 + (f"; {totals['failed']} work units failed and will be retried" if totals['failed'] else "")
+                 + (f"; {totals['deferred']} later units held back behind them" if totals['deferred'] else ""))
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Back-fill attendance from recorded videos and photo folders")
+    parser.add_argument('inputs', nargs='+', help="Video files, image files or directories")
+    parser.add_argument('--every', type=int, default=5, help="Process every Nth video frame")
+    parser.add_argument('--segment', type=int, default=200, help="Processed frames per video work unit")
+    parser.add_argument('--batch', type=int, default=32, help="Images per work unit")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--camera', help="Camera label for the rows (default: file name)")
+    parser.add_argument('--start-time', help="Recording start for videos, 'YYYY-MM-DD HH:MM:SS' local time")
+    parser.add_argument('--scale', type=float, default=0.25)
+    parser.add_argument('--dedup', help="Dedup policy, e.g. once_per_day, cooldown:600, entry_exit "
+                                        "(default: SMARTFACE_DEDUP_POLICY or once_per_day)")
+    parser.add_argument('--db', default='smartface.db')
+    parser.add_argument('--images', default='images')
+    args = parser.parse_args()
+    start_time = datetime.strptime(args.start_time, "%Y-%m-%d %H:%M:%S").timestamp() if args.start_time else None
+    try:
+        run_batch(args.inputs, db_path=args.db, images_path=args.images, every=max(1, args.every),
+                  segment=args.segment, batch=args.batch, workers=args.workers, camera=args.camera,
+                  start_time=start_time, scale=args.scale, dedup=args.dedup)
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import logging
+
+import cv2
+
+from face_detectors import DETECTORS, make_detector
+from face_tracker import iou
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def read_clip(path, scale, max_frames=None):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {path}")
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale) if scale != 1 else frame
+        frames.append(cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB))
+    cap.release()
+    return frames
+
+def run_detector(name, frames, upsample):
+    detector = make_detector(name)
+    return [detector.detect(frame, upsample) for frame in frames], detector.stats.snapshot()
+
+# Share of reference faces that the backend also found (IoU >= 0.5)
+def recall(reference, found):
+    total = sum(len(boxes) for boxes in reference)
+    if total == 0:
+        return 1.0
+    hits = sum(sum(1 for box in boxes if any(iou(box, other) >= 0.5 for other in candidates))
+               for boxes, candidates in zip(reference, found))
+    return hits / total
+
+def main():
+    parser = argparse.ArgumentParser(description="Detector time and agreement of each backend on a recorded clip")
+    parser.add_argument('clip', help="Recorded video from the camera being tuned")
+    parser.add_argument('--detectors', nargs='+', choices=DETECTORS, default=['hog', 'cascade'])
+    parser.add_argument('--scale', type=float, default=0.25, help="Same downscale as the live pipeline")
+    parser.add_argument('--upsample', type=int, default=1)
+    parser.add_argument('--frames', type=int, default=None, help="Only use the first N frames")
+    args = parser.parse_args()
+
+    frames = read_clip(args.clip, args.scale, args.frames)
+    logging.info(f"Loaded {len(frames)} frames from {args.clip}")
+    # Full dlib HOG on every frame is the baseline the other backends are measured against
+    reference, baseline = run_detector('hog', frames, args.upsample)
+
+    print(f"{'detector':>9} {'ms/frame':>9} {'saved':>7} {'skipped':>8} {'full':>6} {'rois':>6} {'recall':>7}")
+    for name in args.detectors:
+        found, stats = (reference, baseline) if name == 'hog' else run_detector(name, frames, args.upsample)
+        saved = 1 - stats['detector_ms'] / baseline['detector_ms'] if baseline['detector_ms'] else 0.0
+        print(f"{name:>9} {stats['ms_per_frame']:>9.2f} {saved:>7.1%} {stats['skipped']:>8} "
+              f"{stats['full_frames']:>6} {stats['roi_calls']:>6} {recall(reference, found):>7.3f}")
+
+if __name__ == '__main__':
+    main()
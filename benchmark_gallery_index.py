@@ -0,0 +1,74 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from face_matcher import ENCODING_SIZE, FaceMatcher
+from gallery_index import IVFIndex
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Synthetic 128-d gallery shaped roughly like dlib encodings: unit-norm vectors
+# drawn around a few hundred cluster centres, queried with noisy copies of
+# random gallery entries so that the true nearest neighbour is known.
+def synthetic_gallery(size, num_queries, clusters=256, noise=0.03, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, ENCODING_SIZE)).astype(np.float32)
+    gallery = centres[rng.integers(0, clusters, size)] + rng.normal(scale=0.6, size=(size, ENCODING_SIZE)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    targets = rng.integers(0, size, num_queries)
+    queries = gallery[targets] + rng.normal(scale=noise, size=(num_queries, ENCODING_SIZE)).astype(np.float32)
+    return gallery, queries
+
+def timed_match(index, queries, batch_size=32):
+    best = np.empty(len(queries), dtype=np.intp)
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        best[offset:offset + batch_size] = index.match(queries[offset:offset + batch_size])[0]
+    return best, (time.perf_counter() - start) * 1000 / len(queries)
+
+def benchmark_size(size, num_queries, nprobes, nlist=None):
+    gallery, queries = synthetic_gallery(size, num_queries)
+    names = [f"person_{i}" for i in range(size)]
+
+    brute = FaceMatcher(gallery, names)
+    truth, brute_ms = timed_match(brute, queries)
+    results = [{'size': size, 'index': 'brute', 'nprobe': None, 'recall_at_1': 1.0, 'ms_per_query': brute_ms}]
+
+    start = time.perf_counter()
+    ivf = IVFIndex.build(gallery, names, nlist=nlist)
+    build_s = time.perf_counter() - start
+    for nprobe in nprobes:
+        ivf.nprobe = nprobe
+        found, ivf_ms = timed_match(ivf, queries)
+        results.append({'size': size, 'index': 'ivf', 'nprobe': nprobe, 'nlist': ivf.nlist,
+                        'recall_at_1': float(np.mean(found == truth)), 'ms_per_query': ivf_ms,
+                        'build_s': build_s})
+
+    # Round-trip through disk to check persistence keeps the same answers
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'gallery_index.npz')
+        ivf.save(path)
+        reloaded = IVFIndex.load(path)
+        assert reloaded.identify(queries[:32])[0] == ivf.identify(queries[:32])[0]
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@1 and latency of the IVF gallery index versus brute force")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--nlist', type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"{'size':>9} {'index':>6} {'nlist':>6} {'nprobe':>6} {'recall@1':>9} {'ms/query':>9}")
+    for size in args.sizes:
+        for row in benchmark_size(size, args.queries, args.nprobe, args.nlist):
+            print(f"{row['size']:>9} {row['index']:>6} {row.get('nlist', ''):>6} {row['nprobe'] or '':>6} "
+                  f"{row['recall_at_1']:>9.3f} {row['ms_per_query']:>9.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from attendance_summary import day_summary, people_summary
+from benchmark_gallery_index import synthetic_gallery
+from gallery_index import build_gallery_index
+from smartface_db import connect, encode_cursor, insert_attendance, migrate, query_attendance
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Headless timings of the hot paths, written as JSON so two runs (e.g. before and
+# after a change) can be compared with `benchmark_suite.py compare`. Every result
+# carries its unit and which direction is better; timings report the median and
+# p95 over `repeat` runs after one warm-up run.
+def measure(fn, repeat=10, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'unit': 'ms', 'better': 'lower', 'median': float(np.median(samples)),
+            'p95': float(np.percentile(samples, 95)), 'min': float(np.min(samples)), 'runs': repeat}
+
+def synthetic_frames(count=4, shape=(720, 1280, 3), scale=0.25, seed=0):
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    frames = [rng.integers(0, 256, shape, dtype=np.uint8) for _ in range(count)]
+    # The pipeline detects on a downscaled RGB copy, so time the same input
+    return [cv2.cvtColor(cv2.resize(frame, (0, 0), fx=scale, fy=scale), cv2.COLOR_BGR2RGB) for frame in frames]
+
+def enrolment_images(images_path, limit=8):
+    import face_recognition
+
+    if not os.path.isdir(images_path):
+        return []
+    paths = sorted(os.path.join(images_path, f) for f in os.listdir(images_path)
+                   if f.lower().endswith(('.jpg', '.jpeg', '.png')))[:limit]
+    return [face_recognition.load_image_file(path) for path in paths]
+
+def bench_detection(results, images_path, repeat):
+    import face_recognition
+
+    frames = synthetic_frames()
+    results['face_locations.synthetic_frame'] = measure(
+        lambda: [face_recognition.face_locations(frame) for frame in frames], repeat)
+    results['face_locations.synthetic_frame']['per'] = f"{len(frames)} frames"
+    images = enrolment_images(images_path)
+    if not images:
+        logging.warning(f"No images in {images_path}; skipping face_locations/face_encodings on real faces")
+        return
+    results['face_locations.images'] = measure(
+        lambda: [face_recognition.face_locations(image) for image in images], repeat)
+    results['face_locations.images']['per'] = f"{len(images)} images"
+    locations = [face_recognition.face_locations(image) for image in images]
+    faces = sum(len(boxes) for boxes in locations)
+    results['face_encodings.images'] = measure(
+        lambda: [face_recognition.face_encodings(image, boxes) for image, boxes in zip(images, locations)], repeat)
+    results['face_encodings.images']['per'] = f"{faces} faces"
+
+def bench_matching(results, gallery_sizes, repeat, batch_size=8):
+    for size in gallery_sizes:
+        gallery, queries = synthetic_gallery(size, batch_size)
+        index = build_gallery_index(gallery, [f"person_{i}" for i in range(size)])
+        key = f"match.{type(index).__name__}.{size}"
+        results[key] = measure(lambda: index.match(queries), repeat)
+        results[key]['per'] = f"{batch_size} faces"
+
+def populate_attendance(conn, people=200, days=100, batch_size=100, camera_count=4):
+    base = datetime(2024, 1, 1).timestamp()
+    rows = [(f"person_{p}", base + day * 86400 + 8 * 3600 + p * 7, f"camera_{p % camera_count}")
+            for day in range(days) for p in range(people)]
+    start = time.perf_counter()
+    for offset in range(0, len(rows), batch_size):
+        with conn:
+            insert_attendance(conn, rows[offset:offset + batch_size])
+    return len(rows), time.perf_counter() - start
+
+def bench_storage(results, rows_people=200, rows_days=100, repeat=10):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = connect(os.path.join(tmp, 'bench.db'))
+        migrate(conn)
+        # Same batch size and connection settings as AttendanceSink
+        count, seconds = populate_attendance(conn, rows_people, rows_days)
+        results['attendance.insert_throughput'] = {'unit': 'rows/s', 'better': 'higher',
+                                                   'median': count / seconds, 'runs': 1, 'per': f"{count} rows"}
+
+        results['dashboard.first_page'] = measure(lambda: query_attendance(conn, limit=50), repeat)
+        results['dashboard.name_filter'] = measure(lambda: query_attendance(conn, name='person_7', limit=50), repeat)
+        results['dashboard.camera_filter'] = measure(lambda: query_attendance(conn, camera='camera_1', limit=50),
+                                                     repeat)
+        deep_cursor = encode_cursor(query_attendance(conn, limit=10000)[0][-1])
+        results['dashboard.deep_page'] = measure(lambda: query_attendance(conn, before=deep_cursor, limit=50), repeat)
+        results['summary.days'] = measure(lambda: day_summary(conn, limit=31), repeat)
+        results['summary.people'] = measure(lambda: people_summary(conn), repeat)
+        conn.close()
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+SUITES = ('detection', 'matching', 'storage')
+
+def run(output, suites=SUITES, images_path='images', gallery_sizes=(100, 1000, 10000, 100000), repeat=10):
+    results = {}
+    if 'detection' in suites:
+        bench_detection(results, images_path, repeat)
+    if 'matching' in suites:
+        bench_matching(results, gallery_sizes, repeat)
+    if 'storage' in suites:
+        bench_storage(results, repeat=repeat)
+    report = {'meta': {'created': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                       'python': platform.python_version(), 'numpy': np.__version__,
+                       'machine': platform.machine(), 'processor': platform.processor() or platform.machine(),
+                       'cpus': os.cpu_count(), 'suites': list(suites)},
+               'results': results}
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for key, result in sorted(results.items()):
+        print(f"{key:<40} {result['median']:>12.3f} {result['unit']:<6} {result.get('per', '')}")
+    logging.info(f"Results written to {output}")
+    return report
+
+# Returns (rows, regressions); a regression is a result that got worse by more
+# than `threshold` (a fraction of the baseline median). Timing changes smaller
+# than min_delta_ms are treated as noise.
+def compare(baseline, candidate, threshold=0.10, min_delta_ms=0.05):
+    rows, regressions = [], []
+    for key in sorted(set(baseline['results']) | set(candidate['results'])):
+        old, new = baseline['results'].get(key), candidate['results'].get(key)
+        if old is None or new is None:
+            rows.append((key, old and old['median'], new and new['median'], None, 'missing'))
+            continue
+        change = (new['median'] - old['median']) / old['median'] if old['median'] else 0.0
+        worse = change > threshold if old['better'] == 'lower' else change < -threshold
+        better = change < -threshold if old['better'] == 'lower' else change > threshold
+        if old['unit'] == 'ms' and abs(new['median'] - old['median']) < min_delta_ms:
+            worse = better = False
+        status = 'REGRESSION' if worse else 'improved' if better else 'ok'
+        rows.append((key, old['median'], new['median'], change, status))
+        if worse:
+            regressions.append(key)
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection, encoding, matching and storage hot paths")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="Run the benchmarks and write a JSON report")
+    run_parser.add_argument('--output', default='benchmark_results.json')
+    run_parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    run_parser.add_argument('--images', default='images')
+    run_parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    run_parser.add_argument('--repeat', type=int, default=10)
+    compare_parser = commands.add_parser('compare', help="Compare two JSON reports and flag regressions")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help="Allowed slowdown, as a fraction")
+    compare_parser.add_argument('--min-delta-ms', type=float, default=0.05, help="Ignore smaller timing changes")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args.output, args.suites, args.images, args.gallery_sizes, args.repeat)
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline['meta'].get('machine') != candidate['meta'].get('machine') or \
+            baseline['meta'].get('cpus') != candidate['meta'].get('cpus'):
+        logging.warning("Reports come from different machines; timings are not directly comparable")
+    rows, regressions = compare(baseline, candidate, args.threshold, args.min_delta_ms)
+    print(f"{'benchmark':<40} {'baseline':>12} {'candidate':>12} {'change':>8}  status")
+    for key, old, new, change, status in rows:
+        print(f"{key:<40} {old if old is not None else float('nan'):>12.3f} "
+              f"{new if new is not None else float('nan'):>12.3f} "
+              f"{'' if change is None else f'{change:+.1%}':>8}  {status}")
+    if regressions:
+        logging.error(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
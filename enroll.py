@@ -0,0 +1,70 @@
+import argparse
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from face_cache import IMAGE_EXTENSIONS, MAX_TEMPLATES, sync_encoding_cache
+from smartface_db import connect
+
+# Enrols (or re-enrols) everything under images/: photos directly in the folder
+# are one identity each, sub-folders images/<name>/ hold several photos of one
+# person. Decode + detect + encode run in a process pool; unchanged photos are
+# skipped via the encoding cache and all results land in smartface.db in one
+# transaction.
+def enroll(images_path='images', db_path='smartface.db', extensions=IMAGE_EXTENSIONS, workers=None,
+           model='hog', chunksize=4):
+    if not os.path.isdir(images_path):
+        raise FileNotFoundError(f"Images folder {images_path} not found")
+
+    start = time.perf_counter()
+    conn = connect(db_path)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            map_fn = lambda fn, jobs: executor.map(fn, jobs, chunksize=chunksize)
+            selected, report = sync_encoding_cache(conn, images_path, extensions, model=model, map_fn=map_fn)
+        wanted = {image_path for image_path, _ in selected}
+        templates = Counter(name for path, name in conn.execute(
+            "SELECT path, name FROM face_encodings WHERE encoding IS NOT NULL") if path in wanted)
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    statuses = Counter(status for _, _, status, _ in report)
+    logging.info(f"{len(selected)} photos of {len({name for _, name in selected})} people: "
+                 f"{len(report)} encoded in {elapsed:.1f}s ({len(report) / max(elapsed, 1e-9):.1f} photos/s), "
+                 f"{len(selected) - len(report)} unchanged")
+    logging.info(f"{statuses['ok']} ok, {statuses['multiple_faces']} with multiple faces, "
+                 f"{statuses['low_quality']} low quality, {statuses['no_face']} without a face, "
+                 f"{statuses['error']} unreadable")
+    for image_path, name, status, detail in report:
+        if status == 'no_face':
+            logging.warning(f"No face: {image_path}")
+        elif status == 'multiple_faces':
+            logging.warning(f"{detail} faces: {image_path} (largest enrolled for {name})")
+        elif status == 'low_quality':
+            logging.warning(f"Low quality: {image_path} (score {detail:.2f}; small, blurred or turned away)")
+        elif status == 'error':
+            logging.warning(f"Unreadable: {image_path}: {detail}")
+    missing = sorted({name for _, name in selected} - set(templates))
+    for name in missing:
+        logging.warning(f"Not enrolled: {name} has no usable photo")
+    compacted = sorted(name for name, count in templates.items() if count > MAX_TEMPLATES)
+    if compacted:
+        logging.info(f"{len(compacted)} people have more than {MAX_TEMPLATES} photos; "
+                     f"the live gallery keeps their {MAX_TEMPLATES} best, most varied ones")
+    return report, templates
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode enrolment photos in parallel into the gallery store")
+    parser.add_argument('--images', default='images', help="Photos, or one sub-folder of photos per person")
+    parser.add_argument('--db', default='smartface.db')
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--model', choices=('hog', 'cnn'), default='hog', help="Face detector used for enrolment")
+    args = parser.parse_args()
+    enroll(args.images, args.db, workers=args.workers, model=args.model)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
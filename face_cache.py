@@ -0,0 +1,365 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from smartface_db import connect
+
+ENCODING_SIZE = 128
+ENCODING_DTYPE = np.float64
+# Snapshots hold the matchers' own dtype, so FaceMatcher and IVFIndex use the
+# memory-mapped array as it is instead of converting a copy on every start
+SNAPSHOT_DTYPE = np.float32
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Template quality (0..1) is the product of three scores, each 1 when ideal:
+# face height against GOOD_FACE_HEIGHT pixels, sharpness as the Laplacian
+# variance of the face crop against SHARP_VARIANCE, and a frontal pose from the
+# eye and nose landmarks. Templates below MIN_QUALITY are dropped from the
+# gallery unless they are all a person has; at most MAX_TEMPLATES are kept.
+GOOD_FACE_HEIGHT = 120
+SHARP_VARIANCE = 100.0
+MIN_QUALITY = 0.2
+MAX_TEMPLATES = 5
+
+# face_recognition (dlib and its models) and cv2 are imported where they are
+# used: a start-up whose gallery snapshot is current never needs them here.
+
+# Encodings are cached in smartface.db keyed by image path. A row is reused as-is
+# while the file's mtime and size are unchanged; if they changed but the content
+# hash still matches, only the stat fields are refreshed. Images without a face
+# are stored with a NULL encoding so they are not re-encoded on every start.
+# `faces` is the number of faces the detector found (several means the largest
+# one was enrolled) and `quality` the enrolled face's face_quality score.
+def init_encoding_cache(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS face_encodings
+                    (path TEXT PRIMARY KEY, name TEXT, mtime REAL, size INTEGER,
+                     sha1 TEXT, encoding BLOB, faces INTEGER, quality REAL)''')
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(face_encodings)")]
+    if 'faces' not in columns:
+        conn.execute("ALTER TABLE face_encodings ADD COLUMN faces INTEGER")
+    if 'quality' not in columns:
+        conn.execute("ALTER TABLE face_encodings ADD COLUMN quality REAL")
+    conn.commit()
+
+def file_sha1(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Yaw is estimated from how far the nose tip sits off the midpoint between the
+# eyes (in eye distances, ~0.5 is a profile), roll from the tilt of the eye line.
+def pose_score(landmarks):
+    left_eye = np.mean(landmarks['left_eye'], axis=0)
+    right_eye = np.mean(landmarks['right_eye'], axis=0)
+    nose = np.mean(landmarks['nose_tip'], axis=0)
+    eye_line = right_eye - left_eye
+    eye_distance = np.linalg.norm(eye_line)
+    if eye_distance < 1e-6:
+        return 0.0
+    yaw = abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance
+    roll = abs(np.arctan2(eye_line[1], abs(eye_line[0])))
+    return max(0.0, 1 - 2 * yaw) * max(0.0, 1 - roll / (np.pi / 4))
+
+# Quality of the face at `box` (top, right, bottom, left) in an RGB image
+def face_quality(image, box, landmarks=None):
+    import cv2
+
+    top, right, bottom, left = box
+    crop = image[max(top, 0):bottom, max(left, 0):right]
+    if crop.size == 0:
+        return 0.0
+    size = min(1.0, (bottom - top) / GOOD_FACE_HEIGHT)
+    sharpness = min(1.0, cv2.Laplacian(cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY), cv2.CV_64F).var() / SHARP_VARIANCE)
+    pose = pose_score(landmarks) if landmarks else 1.0
+    return round(float(size * sharpness * pose), 4)
+
+# Returns (encoding or None, number of faces found, quality). With several faces
+# the largest one is encoded, since enrolment photos are framed on their subject.
+def encode_image(image_path, model='hog'):
+    import face_recognition
+
+    image = face_recognition.load_image_file(image_path)
+    locations = face_recognition.face_locations(image, model=model)
+    if not locations:
+        return None, 0, 0.0
+    largest = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+    encoding = face_recognition.face_encodings(image, [largest])[0]
+    landmarks = face_recognition.face_landmarks(image, [largest], model='small')
+    quality = face_quality(image, largest, landmarks[0] if landmarks else None)
+    return np.asarray(encoding, dtype=ENCODING_DTYPE), len(locations), quality
+
+# Picklable worker for process pools: never raises, unreadable files come back
+# with the error message instead.
+def encode_image_job(job):
+    image_path, model = job
+    try:
+        encoding, faces, quality = encode_image(image_path, model)
+        return image_path, encoding, faces, quality, None
+    except Exception as e:
+        return image_path, None, 0, 0.0, str(e)
+
+# Identities are either a photo directly in images/ (name = file stem) or a
+# sub-folder images/<name>/ holding several photos of the same person.
+def scan_images(images_path, extensions):
+    entries = []
+    for entry in sorted(os.listdir(images_path)):
+        path = os.path.join(images_path, entry)
+        if os.path.isdir(path):
+            entries += [(os.path.join(path, image_file), entry) for image_file in sorted(os.listdir(path))
+                        if image_file.lower().endswith(extensions)]
+        elif entry.lower().endswith(extensions):
+            entries.append((path, os.path.splitext(entry)[0]))
+    return entries
+
+# Cheap fingerprint of the enrolment photos (paths, sizes, mtimes) and the
+# detector model for callers that cache a gallery and need to know when
+# images/ changed.
+def gallery_signature(images_path='images', extensions=IMAGE_EXTENSIONS, model='hog'):
+    if not os.path.isdir(images_path):
+        return ''
+    digest = hashlib.sha1(f"{model}\n".encode())
+    for image_path, name in scan_images(images_path, extensions):
+        stat = os.stat(image_path)
+        digest.update(f"{image_path}\0{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+# Detect + encode for an uploaded image (encoded file bytes), picklable for
+# process pools. Returns (locations, encodings, seconds) at full-image scale.
+def encode_image_bytes(data, scale=0.25):
+    import cv2
+    import face_recognition
+
+    start = time.perf_counter()
+    image = face_recognition.load_image_file(io.BytesIO(data))
+    small_image = cv2.resize(image, (0, 0), fx=scale, fy=scale) if scale != 1 else image
+    locations = face_recognition.face_locations(small_image)
+    encodings = face_recognition.face_encodings(small_image, locations)
+    inverse = 1 / scale
+    locations = [tuple(int(v * inverse) for v in location) for location in locations]
+    encodings = [np.asarray(encoding, dtype=ENCODING_DTYPE) for encoding in encodings]
+    return locations, encodings, time.perf_counter() - start
+
+# Brings the face_encodings rows for images_path up to date and returns the
+# selected (path, name) entries plus a report of what was (re-)encoded this run.
+# `map_fn` runs encode_image_job over the images that need it; pass a process
+# pool's map to spread decode + detect + encode over several cores. All changes
+# are written in a single transaction. Rows cached before quality scoring existed
+# are re-encoded once to get their score.
+def sync_encoding_cache(conn, images_path='images', extensions=IMAGE_EXTENSIONS, model='hog', map_fn=map):
+    init_encoding_cache(conn)
+    cached = {row[0]: row[1:] for row in
+              conn.execute("SELECT path, mtime, size, sha1, quality FROM face_encodings")}
+
+    selected = scan_images(images_path, extensions)
+    pending = []
+    refreshed = []
+    for image_path, name in selected:
+        stat = os.stat(image_path)
+        entry = cached.get(image_path)
+        if entry and entry[3] is None:
+            entry = None
+        if entry and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+            continue
+        digest = file_sha1(image_path)
+        if entry and entry[2] == digest:
+            refreshed.append((stat.st_mtime, stat.st_size, image_path))
+            continue
+        pending.append((image_path, name, stat, digest))
+
+    names = {image_path: name for image_path, name, _, _ in pending}
+    stats = {image_path: (stat, digest) for image_path, _, stat, digest in pending}
+    upserts = []
+    report = []
+    for image_path, encoding, faces, quality, error in map_fn(encode_image_job, [(path, model) for path, _, _, _ in pending]):
+        name = names[image_path]
+        if error is not None:
+            logging.error(f"Could not read {image_path}: {error}")
+            report.append((image_path, name, 'error', error))
+            continue
+        stat, digest = stats[image_path]
+        if encoding is None:
+            logging.warning(f"No face encodings found in {image_path}")
+            report.append((image_path, name, 'no_face', None))
+        elif faces > 1:
+            logging.warning(f"{faces} faces found in {image_path}; enrolled the largest")
+            report.append((image_path, name, 'multiple_faces', faces))
+        elif quality < MIN_QUALITY:
+            logging.warning(f"Low quality face ({quality:.2f}) in {image_path}")
+            report.append((image_path, name, 'low_quality', quality))
+        else:
+            logging.info(f"Loaded face encoding for {name}")
+            report.append((image_path, name, 'ok', None))
+        upserts.append((image_path, name, stat.st_mtime, stat.st_size, digest,
+                        encoding.tobytes() if encoding is not None else None, faces, quality))
+
+    # Rows for photos under images_path that are no longer on disk are dropped;
+    # other extensions are left alone for callers that load them
+    prefix = os.path.join(images_path, '')
+    stale = [(path,) for path in cached if path.startswith(prefix) and not os.path.isfile(path)]
+
+    if upserts or refreshed or stale:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO face_encodings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", upserts)
+            conn.executemany("UPDATE face_encodings SET mtime = ?, size = ? WHERE path = ?", refreshed)
+            conn.executemany("DELETE FROM face_encodings WHERE path = ?", stale)
+    return selected, report
+
+# Collapses several templates per identity into their mean, renormalised to the
+# average template length so distances stay on the usual 0.6 tolerance scale.
+def average_templates(encodings, names):
+    order = {}
+    for index, name in enumerate(names):
+        order.setdefault(name, []).append(index)
+    if len(order) == len(names):
+        return encodings, names
+    averaged = np.empty((len(order), ENCODING_SIZE), dtype=ENCODING_DTYPE)
+    for row, indices in enumerate(order.values()):
+        group = encodings[indices]
+        mean = group.mean(axis=0)
+        averaged[row] = mean * (np.linalg.norm(group, axis=1).mean() / max(np.linalg.norm(mean), 1e-12))
+    return averaged, list(order)
+
+# Compacts one person's templates to at most max_templates representative ones
+# and returns the indices kept. Templates under min_quality go first (unless none
+# is better); the rest are picked by quality-weighted farthest-point selection:
+# start from the best template, then repeatedly add the one maximising
+# quality x distance to the nearest already kept, so the kept set covers the
+# person's appearances (glasses, lighting, angles) instead of near-duplicates of
+# one photo. Matching cost then grows with people, not with photos.
+def select_templates(encodings, qualities, max_templates=MAX_TEMPLATES, min_quality=MIN_QUALITY):
+    qualities = np.asarray(qualities, dtype=np.float64)
+    order = np.argsort(-qualities, kind='stable')
+    usable = [int(i) for i in order if qualities[i] >= min_quality] or [int(order[0])]
+    if len(usable) <= max_templates:
+        return sorted(usable)
+    chosen = [usable[0]]
+    rest = np.array(usable[1:])
+    nearest = np.linalg.norm(encodings[rest] - encodings[usable[0]], axis=1)
+    while len(chosen) < max_templates:
+        pick = int(np.argmax(nearest * qualities[rest]))
+        chosen.append(int(rest[pick]))
+        rest = np.delete(rest, pick)
+        nearest = np.minimum(np.delete(nearest, pick), np.linalg.norm(encodings[rest] - encodings[chosen[-1]], axis=1))
+    return sorted(chosen)
+
+def compact_templates(encodings, names, qualities, max_templates=MAX_TEMPLATES, min_quality=MIN_QUALITY):
+    groups = {}
+    for index, name in enumerate(names):
+        groups.setdefault(name, []).append(index)
+    keep = []
+    for indices in groups.values():
+        indices = np.array(indices)
+        keep += indices[select_templates(encodings[indices], qualities[indices], max_templates, min_quality)].tolist()
+    keep.sort()
+    return encodings[keep], [names[i] for i in keep]
+
+# Prebuilt gallery snapshot: the selected encodings as a raw .npy array next to
+# the database plus a .json with the names and the gallery_signature they were
+# built from. While the signature still matches (no image added, removed or
+# touched) start-up memory-maps the array instead of opening the encoding cache,
+# which takes milliseconds and imports neither dlib nor OpenCV. The file names
+# include a hash of the options, so galleries loaded differently do not collide.
+def snapshot_paths(images_path, extensions, db_path, templates):
+    key = hashlib.sha1(f"{os.path.abspath(images_path)}\0{sorted(extensions)}\0{templates}".encode()).hexdigest()[:12]
+    base = os.path.join(os.path.dirname(os.path.abspath(db_path)), f"smartface_gallery_{key}")
+    return base + '.npy', base + '.json'
+
+def load_gallery_snapshot(paths, signature):
+    array_path, meta_path = paths
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('signature') != signature:
+            return None
+        encodings = np.load(array_path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if encodings.shape != (len(meta['names']), ENCODING_SIZE) or encodings.dtype != SNAPSHOT_DTYPE:
+        logging.warning(f"Gallery snapshot {array_path} does not match its names; rebuilding it")
+        return None
+    return encodings, meta['names']
+
+# Written to temporary files and renamed, so a reader never sees half a snapshot
+def save_gallery_snapshot(paths, signature, encodings, names):
+    array_path, meta_path = paths
+    try:
+        with open(array_path + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(encodings, dtype=SNAPSHOT_DTYPE))
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'signature': signature, 'names': list(names)}, f)
+        os.replace(array_path + '.tmp', array_path)
+        os.replace(meta_path + '.tmp', meta_path)
+    except OSError as e:
+        logging.warning(f"Could not write gallery snapshot {array_path}: {e}")
+
+# templates='best' keeps up to max_templates good, varied rows per person (see
+# select_templates); 'all' keeps one gallery row per photo; 'mean' keeps one
+# averaged row per person. With several rows a person matches on their closest.
+def load_known_faces_cached(images_path='images', extensions=IMAGE_EXTENSIONS, db_path='smartface.db',
+                            templates='best', max_templates=MAX_TEMPLATES, snapshot=True, model='hog'):
+    if not os.path.exists(images_path):
+        logging.error(f"Images folder {images_path} not found")
+        return np.empty((0, ENCODING_SIZE), dtype=SNAPSHOT_DTYPE), []
+
+    if snapshot:
+        start = time.perf_counter()
+        paths = snapshot_paths(images_path, extensions, db_path,
+                               f"best{max_templates}:{MIN_QUALITY}" if templates == 'best' else templates)
+        signature = gallery_signature(images_path, extensions, model)
+        loaded = load_gallery_snapshot(paths, signature)
+        if loaded is not None:
+            logging.info(f"Loaded {len(loaded[1])} face encodings from snapshot "
+                         f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return loaded
+
+    conn = connect(db_path)
+    try:
+        selected, report = sync_encoding_cache(conn, images_path, extensions, model)
+        wanted = {image_path for image_path, _ in selected}
+        rows = [row for row in conn.execute(
+                    "SELECT path, name, encoding, quality FROM face_encodings "
+                    "WHERE encoding IS NOT NULL ORDER BY path")
+                if row[0] in wanted]
+    except sqlite3.DatabaseError as e:
+        logging.error(f"Encoding cache error: {e}")
+        raise
+    finally:
+        conn.close()
+
+    known_face_names = [row[1] for row in rows]
+    known_face_encodings = np.frombuffer(b''.join(row[2] for row in rows),
+                                         dtype=ENCODING_DTYPE).reshape(-1, ENCODING_SIZE)
+    if templates == 'best':
+        qualities = np.array([MIN_QUALITY if row[3] is None else row[3] for row in rows], dtype=np.float64)
+        known_face_encodings, known_face_names = compact_templates(known_face_encodings, known_face_names,
+                                                                   qualities, max_templates)
+        if len(known_face_names) < len(rows):
+            logging.info(f"Kept {len(known_face_names)} of {len(rows)} templates "
+                         f"(at most {max_templates} per person)")
+    elif templates == 'mean':
+        known_face_encodings, known_face_names = average_templates(known_face_encodings, known_face_names)
+    # Same dtype as the snapshot path, so callers see one kind of array
+    known_face_encodings = known_face_encodings.astype(SNAPSHOT_DTYPE)
+    logging.info(f"Loaded {len(known_face_names)} face encodings of {len(set(known_face_names))} people "
+                 f"({len(report)} encoded, {len(selected) - len(report)} from cache)")
+    # A photo that could not be read is retried on the next start, which a
+    # snapshot under the unchanged signature would prevent
+    failed = sum(status == 'error' for _, _, status, _ in report)
+    if snapshot and failed:
+        logging.warning(f"Not saving a gallery snapshot: {failed} images could not be read")
+    elif snapshot:
+        save_gallery_snapshot(paths, signature, known_face_encodings, known_face_names)
+        # Hand back the mapped snapshot, as later starts do, so that
+        # build_gallery_index can keep its IVF lists next to it from now on
+        loaded = load_gallery_snapshot(paths, signature)
+        if loaded is not None:
+            return loaded
+    return known_face_encodings, known_face_names
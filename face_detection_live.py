@@ -1,8 +1,17 @@
+import argparse
+
 import cv2
-import dlib
 
-# Initialize Dlib face detector
-detector = dlib.get_frontal_face_detector()
+from face_detectors import DETECTORS, make_detector
+
+parser = argparse.ArgumentParser(description="Live face detection preview")
+parser.add_argument('--detector', choices=DETECTORS, default='hog')
+parser.add_argument('--scale', type=float, default=1.0, help="Detect on a downscaled copy of each frame")
+args = parser.parse_args()
+
+# The cascade backend only runs dlib where something moved and a cascade found a
+# face-like region, instead of the full detector on every full-resolution frame
+detector = make_detector(args.detector)
 
 # Open webcam
 cap = cv2.VideoCapture(0)  # Changed to index 0
@@ -16,17 +25,18 @@ while True:
         print("Error: Failed to capture frame")
         break
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    faces = detector(gray)
+    small_frame = cv2.resize(frame, (0, 0), fx=args.scale, fy=args.scale) if args.scale != 1 else frame
+    faces = detector.detect(cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB), upsample=0)
 
-    for face in faces:
-        x, y, w, h = face.left(), face.top(), face.width(), face.height()
-        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    for top, right, bottom, left in faces:
+        top, right, bottom, left = (int(v / args.scale) for v in (top, right, bottom, left))
+        cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
 
     cv2.imshow('Dlib Face Detection', frame)
 
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
+print(f"Detector: {detector.stats.snapshot()}")
 cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+cv2.destroyAllWindows()
@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+DETECTORS = ('hog', 'cnn', 'cascade')
+
+# Counts detector calls and the time spent in them (seconds in, milliseconds out).
+class DetectorStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.full_frames = 0
+        self.roi_calls = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    def record(self, seconds, full=False, rois=0, skipped=False):
+        with self.lock:
+            self.frames += 1
+            self.full_frames += full
+            self.roi_calls += rois
+            self.skipped += skipped
+            self.seconds += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return {'frames': self.frames, 'full_frames': self.full_frames, 'roi_calls': self.roi_calls,
+                    'skipped': self.skipped, 'detector_ms': self.seconds * 1000,
+                    'ms_per_frame': self.seconds * 1000 / self.frames if self.frames else 0.0}
+
+# The plain dlib detectors used so far: the full HOG pyramid (or the CNN) on
+# every frame. Boxes are face_recognition locations (top, right, bottom, left).
+class DlibDetector:
+    def __init__(self, model='hog'):
+        self.model = model
+        self.stats = DetectorStats()
+
+    def locate(self, rgb_frame, upsample=1):
+        import face_recognition
+
+        return face_recognition.face_locations(rgb_frame, number_of_times_to_upsample=upsample, model=self.model)
+
+    def detect(self, rgb_frame, upsample=1, seq=None, camera='default'):
+        start = time.perf_counter()
+        locations = self.locate(rgb_frame, upsample)
+        self.stats.record(time.perf_counter() - start, full=True)
+        return locations
+
+# OpenCV 5 moved the cascade classifiers out of the main package; without them
+# the cascade stage falls back to motion regions only.
+def load_cascade(kind='haar', path=None):
+    if not hasattr(cv2, 'CascadeClassifier'):
+        logging.warning("This OpenCV build has no CascadeClassifier; using motion regions only")
+        return None
+    if path is None:
+        name = ('haarcascade_frontalface_default.xml' if kind == 'haar'
+                else 'lbpcascade_frontalface_improved.xml')
+        path = os.path.join(cv2.data.haarcascades, name)
+    cascade = cv2.CascadeClassifier(path)
+    if cascade.empty():
+        logging.warning(f"Could not load {kind} cascade from {path}; using motion regions only")
+        return None
+    return cascade
+
+def _clip_box(box, shape):
+    top, right, bottom, left = box
+    return max(0, top), min(shape[1], right), min(shape[0], bottom), max(0, left)
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[3] < b[1] and b[3] < a[1]
+
+# Merges overlapping boxes until none overlap
+def _merge_boxes(boxes):
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                if _overlaps(boxes[i], boxes[j]):
+                    a, b = boxes[i], boxes.pop(j)
+                    boxes[i] = (min(a[0], b[0]), max(a[1], b[1]), max(a[2], b[2]), min(a[3], b[3]))
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes
+
+# Cheap front stage for a dlib detector on a fixed camera:
+#   1. difference a small blurred grey copy of the frame against the previous one;
+#      if nothing moved, the previous faces are returned without running dlib
+#   2. run an OpenCV Haar/LBP cascade inside the moving regions to find candidates
+#      (with no cascade available, the moving regions themselves are candidates)
+#   3. run the dlib detector only on the candidate regions, padded by roi_margin
+# Faces from the previous frame outside the moving regions are kept as they are.
+# Every refresh_interval frames, and whenever the frame size changes, the full
+# frame goes through dlib so that nothing the cascade missed stays missed.
+#
+# The motion reference and last faces are kept per camera. Pool workers can
+# finish frames out of order, so state is only updated by a frame newer (by its
+# capture `seq`) than the one that last set it; an older frame is still
+# detected against the current state but leaves it alone.
+class CameraState:
+    def __init__(self):
+        self.previous = None
+        self.shape = None
+        self.seq = -1
+        self.faces = []
+        self.faces_seq = -1
+        self.since_full = 0
+
+class CascadeDetector:
+    def __init__(self, base=None, cascade='haar', cascade_path=None, motion_width=160, motion_threshold=25,
+                 min_motion_area=0.002, roi_margin=0.5, min_roi=96, refresh_interval=30):
+        self.base = base or DlibDetector('hog')
+        self.cascade = load_cascade(cascade, cascade_path) if cascade else None
+        self.motion_width = motion_width
+        self.motion_threshold = motion_threshold
+        self.min_motion_area = min_motion_area
+        self.roi_margin = roi_margin
+        self.min_roi = min_roi
+        self.refresh_interval = refresh_interval
+        self.stats = DetectorStats()
+        self.lock = threading.Lock()
+        self.cameras = {}
+
+    def _motion_regions(self, thumb, previous, shape):
+        diff = cv2.absdiff(thumb, previous)
+        _, mask = cv2.threshold(diff, self.motion_threshold, 255, cv2.THRESH_BINARY)
+        mask = cv2.dilate(mask, None, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        factor = shape[1] / float(thumb.shape[1])
+        min_area = self.min_motion_area * thumb.shape[0] * thumb.shape[1]
+        regions = []
+        for contour in contours:
+            if cv2.contourArea(contour) < min_area:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            regions.append(_clip_box((int(y * factor), int((x + w) * factor),
+                                      int((y + h) * factor), int(x * factor)), shape))
+        return regions
+
+    def _candidates(self, gray, regions):
+        if self.cascade is None:
+            return regions
+        candidates = []
+        for top, right, bottom, left in regions:
+            found = self.cascade.detectMultiScale(gray[top:bottom, left:right], scaleFactor=1.2, minNeighbors=3)
+            candidates += [(top + y, left + x + w, top + y + h, left + x) for x, y, w, h in found]
+        return candidates
+
+    def _pad(self, box, shape):
+        top, right, bottom, left = box
+        pad = int(max(bottom - top, right - left) * self.roi_margin)
+        grow_y = max(pad, (self.min_roi - (bottom - top)) // 2)
+        grow_x = max(pad, (self.min_roi - (right - left)) // 2)
+        return _clip_box((top - grow_y, right + grow_x, bottom + grow_y, left - grow_x), shape)
+
+    def detect(self, rgb_frame, upsample=1, seq=None, camera='default'):
+        start = time.perf_counter()
+        shape = rgb_frame.shape[:2]
+        gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        height = max(1, int(shape[0] * self.motion_width / shape[1]))
+        thumb = cv2.GaussianBlur(cv2.resize(gray, (self.motion_width, height)), (5, 5), 0)
+
+        with self.lock:
+            state = self.cameras.setdefault(camera, CameraState())
+            # Callers that detect frames one by one need not number them
+            seq = state.seq + 1 if seq is None else seq
+            full = (state.previous is None or state.shape != shape or state.since_full >= self.refresh_interval)
+            regions = [] if full else self._motion_regions(thumb, state.previous, shape)
+            if seq > state.seq:
+                state.previous = thumb
+                state.shape = shape
+                state.seq = seq
+                state.since_full = 0 if full else state.since_full + 1
+            previous_faces = state.faces
+
+        if full:
+            faces = self.base.locate(rgb_frame, upsample)
+            rois = []
+        elif not regions:
+            self.stats.record(time.perf_counter() - start, skipped=True)
+            return list(previous_faces)
+        else:
+            rois = _merge_boxes(self._pad(box, shape) for box in self._candidates(gray, regions))
+            faces = [face for face in previous_faces if not any(_overlaps(face, region) for region in regions)]
+            for top, right, bottom, left in rois:
+                # dlib wants a contiguous image; a ROI slice is a strided view
+                found = self.base.locate(np.ascontiguousarray(rgb_frame[top:bottom, left:right]), upsample)
+                faces += [(top + t, left + r, top + b, left + l) for t, r, b, l in found]
+
+        with self.lock:
+            if seq > state.faces_seq:
+                state.faces = faces
+                state.faces_seq = seq
+        self.stats.record(time.perf_counter() - start, full=full, rois=len(rois))
+        return faces
+
+# Importing face_recognition loads the dlib models and the first detector call
+# builds the HOG pyramid; start-up runs this on a thread while the camera opens.
+def warm_up_models(model='hog'):
+    import face_recognition
+
+    face_recognition.face_locations(np.zeros((120, 160, 3), dtype=np.uint8), model=model)
+
+def make_detector(name='hog', **options):
+    if name == 'hog':
+        return DlibDetector('hog')
+    if name == 'cnn':
+        return DlibDetector('cnn')
+    if name == 'cascade':
+        return CascadeDetector(**options)
+    raise ValueError(f"Unknown detector: {name} (choose from {', '.join(DETECTORS)})")
@@ -0,0 +1,86 @@
+import numpy as np
+
+ENCODING_SIZE = 128
+
+# Holds the gallery as one contiguous float32 (N, 128) matrix (a float32 array,
+# such as a memory-mapped gallery snapshot, is used as is) with precomputed
+# squared norms, so all faces of a frame are matched with a single matrix product:
+#   |q - g|^2 = |q|^2 + |g|^2 - 2 q.g
+# A person may have several templates (rows); `labels` maps each row to an
+# identity number so scores are aggregated per identity, not per template.
+class FaceMatcher:
+    def __init__(self, encodings, names):
+        self.names = list(names)
+        self.gallery = np.ascontiguousarray(
+            np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE))
+        self.sq_norms = np.einsum('ij,ij->i', self.gallery, self.gallery)
+        if len(self.names) != len(self.gallery):
+            raise ValueError(f"Got {len(self.gallery)} encodings for {len(self.names)} names")
+        self.identities = {}
+        self.labels = self._labels(self.names)
+
+    def _labels(self, names):
+        return np.array([self.identities.setdefault(name, len(self.identities)) for name in names], dtype=np.intp)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, encodings, names):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        names = list(names)
+        if len(names) != len(encodings):
+            raise ValueError(f"Got {len(encodings)} encodings for {len(names)} names")
+        self.names.extend(names)
+        self.labels = np.concatenate([self.labels, self._labels(names)])
+        self.gallery = np.ascontiguousarray(np.concatenate([self.gallery, encodings]))
+        self.sq_norms = np.concatenate([self.sq_norms, np.einsum('ij,ij->i', encodings, encodings)])
+
+    # Removes every template stored under the given identity; returns how many.
+    def remove(self, name):
+        keep = np.array([n != name for n in self.names], dtype=bool)
+        removed = len(self.names) - int(keep.sum())
+        if removed:
+            self.names = [n for n in self.names if n != name]
+            self.labels = self.labels[keep]
+            self.gallery = np.ascontiguousarray(self.gallery[keep])
+            self.sq_norms = self.sq_norms[keep]
+        return removed
+
+    def distances(self, face_encodings):
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+        d2 = queries @ self.gallery.T
+        d2 *= -2.0
+        d2 += q_norms[:, None]
+        d2 += self.sq_norms[None, :]
+        np.maximum(d2, 0.0, out=d2)
+        return np.sqrt(d2, out=d2)
+
+    # Returns, for every face, the index of the closest gallery entry, its distance
+    # and the margin to the closest entry of any other identity (inf when there is
+    # none). An identity's score is its best template, so a second photo of the
+    # same person never counts as the runner-up and never shrinks the margin.
+    def match(self, face_encodings):
+        num_faces = len(face_encodings)
+        best_indices = np.full(num_faces, -1, dtype=np.intp)
+        best_distances = np.full(num_faces, np.inf, dtype=np.float32)
+        margins = np.full(num_faces, np.inf, dtype=np.float32)
+        if num_faces == 0 or len(self) == 0:
+            return best_indices, best_distances, margins
+
+        distances = self.distances(face_encodings)
+        rows = np.arange(num_faces)
+        best_indices[:] = np.argmin(distances, axis=1)
+        best_distances[:] = distances[rows, best_indices]
+        if len(self.identities) > 1:
+            # Mask the best identity's own templates, then take the runner-up
+            own = self.labels[None, :] == self.labels[best_indices][:, None]
+            distances[own] = np.inf
+            margins[:] = distances.min(axis=1) - best_distances
+        return best_indices, best_distances, margins
+
+    # Convenience wrapper: name per face, "Unknown" above the tolerance.
+    def identify(self, face_encodings, tolerance=0.6):
+        best_indices, best_distances, _ = self.match(face_encodings)
+        return [self.names[index] if distance <= tolerance else "Unknown"
+                for index, distance in zip(best_indices, best_distances)], best_distances
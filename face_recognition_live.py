@@ -1,67 +1,76 @@
 import cv2
-import face_recognition
-import numpy as np
+import json
 import sqlite3
-import pandas as pd
-from datetime import datetime
-import os
 import logging
+import sys
+import threading
 import time
-
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+from adaptive_control import AdaptiveController
+from attendance_export import export_attendance
+from face_cache import IMAGE_EXTENSIONS, load_known_faces_cached
+from face_detectors import make_detector, warm_up_models
+from face_tracker import FaceTracker
+from gallery_index import build_gallery_index
+from recognition_pipeline import RecognitionPipeline
+from smartface_db import init_db
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# PIL logs every EXIF tag of every image it opens at DEBUG
+logging.getLogger('PIL').setLevel(logging.INFO)
 
 def init_attendance_db():
     try:
-        conn = sqlite3.connect('smartface.db', check_same_thread=False)
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS attendance
-                     (name TEXT, time TEXT, date TEXT)''')
-        conn.commit()
+        init_db('smartface.db')
         logging.info("Attendance table initialized")
     except sqlite3.DatabaseError as e:
         logging.error(f"Database error: {e}")
         raise
-    finally:
-        conn.close()
 
 def load_known_faces(images_path='images'):
-    known_face_encodings = []
-    known_face_names = []
-    if not os.path.exists(images_path):
-        logging.error(f"Images folder {images_path} not found")
-        return [], []
-    for image_file in os.listdir(images_path):
-        if image_file.endswith('.jpg'):
-            image_path = os.path.join(images_path, image_file)
-            image = face_recognition.load_image_file(image_path)
-            encodings = face_recognition.face_encodings(image)
-            if encodings:
-                known_face_encodings.append(encodings[0])
-                known_face_names.append(os.path.splitext(image_file)[0])
-                logging.info(f"Loaded face encoding for {known_face_names[-1]}")
-            else:
-                logging.warning(f"No face encodings found in {image_file}")
-    return known_face_encodings, known_face_names
+    return load_known_faces_cached(images_path, extensions=IMAGE_EXTENSIONS)
 
 def export_to_excel():
     try:
-        conn = sqlite3.connect('smartface.db')
-        df = pd.read_sql_query("SELECT * FROM attendance", conn)
-        conn.close()
-        df.to_excel('attendance_export.xlsx', index=False)
-        logging.info("Attendance exported to attendance_export.xlsx")
+        export_attendance('attendance_export.xlsx', 'xlsx')
     except Exception as e:
         logging.error(f"Excel export error: {e}")
 
-def run_face_recognition():
-    init_attendance_db()
-    known_face_encodings, known_face_names = load_known_faces()
-    if not known_face_encodings:
-        logging.error("No known faces loaded. Exiting.")
-        return
+# Capture backends worth trying on this platform, most likely first. The one that
+# worked last time for an index is cached in CAMERA_BACKEND_CACHE and tried before
+# the others, so a normal start opens the camera on the first attempt.
+CAMERA_BACKEND_CACHE = '.camera_backend.json'
+
+def camera_backends():
+    if sys.platform == 'darwin':
+        names = ['CAP_AVFOUNDATION', 'CAP_ANY']
+    elif sys.platform.startswith('win'):
+        names = ['CAP_DSHOW', 'CAP_MSMF', 'CAP_ANY']
+    else:
+        names = ['CAP_V4L2', 'CAP_ANY']
+    return [(getattr(cv2, name), name) for name in names if hasattr(cv2, name)]
 
-    webcam_index = 0
-    backends = [(cv2.CAP_AVFOUNDATION, "CAP_AVFOUNDATION"), (cv2.CAP_ANY, "CAP_ANY"), (cv2.CAP_V4L2, "CAP_V4L2")]
+def _load_backend_cache():
+    try:
+        with open(CAMERA_BACKEND_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_backend_cache(webcam_index, backend_name):
+    cache = _load_backend_cache()
+    if cache.get(str(webcam_index)) == backend_name:
+        return
+    cache[str(webcam_index)] = backend_name
+    try:
+        with open(CAMERA_BACKEND_CACHE, 'w') as f:
+            json.dump(cache, f)
+    except OSError as e:
+        logging.warning(f"Could not cache camera backend: {e}")
+
+def open_camera(webcam_index=0, warmup_timeout=3.0):
+    backends = camera_backends()
+    cached = _load_backend_cache().get(str(webcam_index))
+    backends.sort(key=lambda backend: backend[1] != cached)
     cap = None
     for backend, backend_name in backends:
         logging.info(f"Trying webcam at index {webcam_index} with {backend_name}")
@@ -73,96 +82,109 @@ def run_face_recognition():
         cap.release()
     else:
         logging.error(f"Could not open webcam at index {webcam_index}. Check permissions or hardware.")
-        return
+        return None
 
     # Set webcam resolution to improve quality
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-    time.sleep(2)  # Stabilize camera
 
-    retries = 5
-    for attempt in range(retries):
+    # Poll for the first frame instead of sleeping a fixed time; most cameras
+    # deliver one well within the first few hundred milliseconds.
+    deadline = time.monotonic() + warmup_timeout
+    while time.monotonic() < deadline:
         ret, frame = cap.read()
         if ret:
             logging.info("Successfully read frame")
-            break
-        logging.warning(f"Failed to read frame, attempt {attempt + 1}/{retries}")
-        time.sleep(1)
-    else:
-        logging.error(f"Failed to read frames after {retries} attempts. Exiting.")
-        cap.release()
+            _save_backend_cache(webcam_index, backend_name)
+            return cap
+        time.sleep(0.05)
+    logging.error(f"No frame from the webcam within {warmup_timeout:.0f}s. Exiting.")
+    cap.release()
+    return None
+
+# Time from process start to each start-up step, logged as one report once the
+# first frame has been through detection and matching.
+class StartupTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = []
+
+    def mark(self, step):
+        self.steps.append((step, time.perf_counter() - self.start))
+
+    def report(self):
+        previous = 0.0
+        lines = []
+        for step, elapsed in self.steps:
+            lines.append(f"  {step:<24} {elapsed * 1000:8.1f} ms  (+{(elapsed - previous) * 1000:.1f})")
+            previous = elapsed
+        logging.info("Start-up times:\n" + "\n".join(lines))
+
+def run_face_recognition(recognition_workers=2, target_latency_ms=150.0, min_face_size=None, detector='hog'):
+    timer = StartupTimer()
+    # dlib loads its models while the database, gallery and camera are set up
+    warm_up = threading.Thread(target=warm_up_models, args=('cnn' if detector == 'cnn' else 'hog',),
+                               name='model-warm-up', daemon=True)
+    warm_up.start()
+    init_attendance_db()
+    timer.mark('database')
+    known_face_encodings, known_face_names = load_known_faces()
+    timer.mark('gallery')
+    if len(known_face_encodings) == 0:
+        logging.error("No known faces loaded. Exiting.")
         return
 
-    confidence_threshold = 0.6  # Lowered from 0.85
-    recognized_faces = set()
-    process_this_frame = True
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            logging.error("Failed to read frame from webcam")
-            break
-
-        small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-
-        if process_this_frame:
-            face_locations = face_recognition.face_locations(rgb_small_frame)
-            face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-            logging.info(f"Detected {len(face_locations)} faces")
-
-            for face_encoding in face_encodings:
-                matches = face_recognition.compare_faces(known_face_encodings, face_encoding)
-                name = "Unknown"
-                face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
-                if len(face_distances) > 0:
-                    best_match_index = np.argmin(face_distances)
-                    confidence = 1 - face_distances[best_match_index]
-                    logging.info(f"Best match confidence: {confidence:.2f} for {known_face_names[best_match_index]}")
-                    if matches[best_match_index] and confidence >= confidence_threshold:
-                        name = known_face_names[best_match_index]
-                        logging.info(f"Recognized {name} with confidence {confidence:.2f}")
-
-                        if name not in recognized_faces:
-                            recognized_faces.add(name)
-                            current_time = datetime.now().strftime("%H:%M:%S")
-                            current_date = datetime.now().strftime("%Y-%m-%d")
-                            try:
-                                conn = sqlite3.connect('smartface.db', check_same_thread=False)
-                                c = conn.cursor()
-                                c.execute("INSERT INTO attendance (name, time, date) VALUES (?, ?, ?)",
-                                          (name, current_time, current_date))
-                                conn.commit()
-                                logging.info(f"Attendance marked for {name}")
-                                c.execute("SELECT * FROM attendance WHERE name = ?", (name,))
-                                logging.info(f"Verified record: {c.fetchall()}")
-                            except sqlite3.DatabaseError as e:
-                                logging.error(f"Database error: {e}")
-                            finally:
-                                conn.close()
-
-        process_this_frame = not process_this_frame
-
-        for (top, right, bottom, left) in face_locations:
-            top *= 4
-            right *= 4
-            bottom *= 4
-            left *= 4
-            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-            cv2.putText(frame, f"Attendance Marked: {name}", (left, top - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-        cv2.putText(frame, f"Attendees: {len(recognized_faces)}", (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        cv2.imshow('Face Recognition', frame)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    cap = open_camera(0)
+    timer.mark('camera')
+    if cap is None:
+        return
 
-    cap.release()
-    cv2.destroyAllWindows()
+    matcher = build_gallery_index(known_face_encodings, known_face_names)
+    pipeline = RecognitionPipeline(cap, matcher, workers=recognition_workers,
+                                   tolerance=0.6,  # Same default as face_recognition.compare_faces
+                                   confidence_threshold=0.6,  # Lowered from 0.85
+                                   tracker=FaceTracker(), detector=make_detector(detector),
+                                   # Starts at the old fixed settings (1/4 scale, every other frame)
+                                   controller=AdaptiveController(target_latency_ms, workers=recognition_workers,
+                                                                 min_face_size=min_face_size, scale=0.25,
+                                                                 detection_interval=2))
+    pipeline.start()
+    warm_up.join()
+    timer.mark('models')
+
+    frame_seq = 0
+    try:
+        while pipeline.running:
+            frame_seq, frame = pipeline.wait_frame(frame_seq)
+            if frame is None:
+                continue
+            frame = frame.copy()
+
+            result = pipeline.latest_result()
+            if timer is not None and result.seq > 0:
+                timer.mark('first frame processed')
+                timer.report()
+                timer = None
+            for (top, right, bottom, left), name in zip(result.locations, result.names):
+                cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+                cv2.putText(frame, f"Attendance Marked: {name}", (left, top - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+            cv2.putText(frame, f"Attendees: {len(pipeline.recognized_faces)}", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            scale, interval, upsample = pipeline.controller.settings()
+            cv2.putText(frame, f"Scale {scale:.2f}  every {interval} frames  upsample {upsample}", (10, 60),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+            cv2.imshow('Face Recognition', frame)
+
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        pipeline.stop()
+        cap.release()
+        cv2.destroyAllWindows()
     export_to_excel()
-    logging.info(f"Recognition ended. Total attendees: {len(recognized_faces)}")
+    logging.info(f"Recognition ended. Total attendees: {len(pipeline.recognized_faces)}")
 
 if __name__ == '__main__':
     run_face_recognition()
\ No newline at end of file
@@ -0,0 +1,97 @@
+import itertools
+
+# Boxes are face_recognition locations: (top, right, bottom, left)
+def iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    if inter == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return inter / float(area_a + area_b - inter)
+
+class Track:
+    def __init__(self, track_id, box, frame):
+        self.id = track_id
+        self.box = box
+        self.name = "Unknown"
+        self.distance = None
+        self.streak = 0
+        self.confirmed = False
+        self.misses = 0
+        self.last_seen = frame
+        self.last_encoded = None
+
+# IoU tracker over detector output. Tracks keep their identity across frames, so
+# faces only need to be encoded while a track is new or unconfirmed; a confirmed
+# track is re-verified every `reverify_interval` frames, and a track that has not
+# matched anyone is retried every `unknown_retry` frames rather than every frame.
+# A track is confirmed once the same known name has matched `confirm_hits` times
+# in a row.
+class FaceTracker:
+    def __init__(self, iou_threshold=0.3, max_misses=2, confirm_hits=2,
+                 reverify_interval=50, unknown_retry=5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.confirm_hits = confirm_hits
+        self.reverify_interval = reverify_interval
+        self.unknown_retry = unknown_retry
+        self.tracks = []
+        self.frame = 0
+        self.ids = itertools.count(1)
+
+    # Associates this frame's detections with existing tracks (greedy, best IoU
+    # first), starts tracks for unmatched detections and drops tracks missed for
+    # more than max_misses detection rounds. Returns the live tracks.
+    def update(self, boxes, frame):
+        self.frame = frame
+        pairs = sorted(((iou(track.box, box), t, b) for t, track in enumerate(self.tracks)
+                        for b, box in enumerate(boxes)), reverse=True)
+        matched_tracks, matched_boxes = set(), set()
+        for overlap, t, b in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            matched_tracks.add(t)
+            matched_boxes.add(b)
+            track = self.tracks[t]
+            track.box = boxes[b]
+            track.misses = 0
+            track.last_seen = frame
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+        for b, box in enumerate(boxes):
+            if b not in matched_boxes:
+                self.tracks.append(Track(next(self.ids), box, frame))
+        return [track for track in self.tracks if track.misses == 0]
+
+    def needs_encoding(self, track):
+        if track.last_encoded is None:
+            return True
+        age = self.frame - track.last_encoded
+        if track.confirmed:
+            return age >= self.reverify_interval
+        if track.name == "Unknown":
+            return age >= self.unknown_retry
+        return True
+
+    # Records a match result for the track. Returns True when this result newly
+    # confirms a known identity.
+    def assign(self, track, name, distance):
+        track.last_encoded = self.frame
+        track.distance = distance
+        if name != "Unknown" and name == track.name:
+            track.streak += 1
+        else:
+            track.streak = 1 if name != "Unknown" else 0
+            track.confirmed = False
+        track.name = name
+        if not track.confirmed and name != "Unknown" and track.streak >= self.confirm_hits:
+            track.confirmed = True
+            return True
+        return False
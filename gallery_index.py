@@ -0,0 +1,251 @@
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from face_matcher import ENCODING_SIZE, FaceMatcher
+
+# Galleries below this size are matched by brute force; the IVF index only pays
+# off once scanning every entry dominates the per-frame cost.
+IVF_MIN_GALLERY_SIZE = 10000
+
+def _sq_norms(vectors):
+    return np.einsum('ij,ij->i', vectors, vectors)
+
+def _nearest_centroids(vectors, centroids, centroid_norms, k=1, chunk_size=65536):
+    # Chunked so that assigning a 1M gallery does not build a 1M x nlist matrix at once
+    result = np.empty((len(vectors), k), dtype=np.intp)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        d2 = centroid_norms[None, :] - 2.0 * (chunk @ centroids.T)
+        if k == 1:
+            result[start:start + chunk_size, 0] = np.argmin(d2, axis=1)
+        else:
+            nearest = np.argpartition(d2, k - 1, axis=1)[:, :k]
+            rows = np.arange(len(chunk))[:, None]
+            order = np.argsort(d2[rows, nearest], axis=1)
+            result[start:start + chunk_size] = nearest[rows, order]
+    return result
+
+def train_kmeans(vectors, nlist, iterations=20, max_points_per_centroid=256, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    # Every centroid is seeded from a distinct vector
+    nlist = min(nlist, len(vectors))
+    if len(vectors) > nlist * max_points_per_centroid:
+        vectors = vectors[rng.choice(len(vectors), nlist * max_points_per_centroid, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_centroids(vectors, centroids, _sq_norms(centroids))[:, 0]
+        counts = np.bincount(assignment, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters from random points so every list stays usable
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+# Inverted-file index: the gallery is partitioned into nlist k-means cells and a
+# query only scans the nprobe cells with the nearest centroids. nprobe is the
+# recall/latency knob; nprobe == nlist degenerates to brute force.
+# Exposes the same match()/identify()/names interface as FaceMatcher, including
+# its per-identity margins (`labels` maps face ids to identity numbers).
+class IVFIndex:
+    def __init__(self, centroids, nprobe=8):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.centroid_norms = _sq_norms(self.centroids)
+        self.nprobe = nprobe
+        self.names = []
+        self.active = 0
+        self.name_ids = {}
+        self.identities = {}
+        self.labels = np.empty(0, dtype=np.intp)
+        self.id_lists = np.empty(0, dtype=np.intp)
+        self.list_ids = [np.empty(0, dtype=np.intp) for _ in range(len(self.centroids))]
+        self.list_vectors = [np.empty((0, ENCODING_SIZE), dtype=np.float32) for _ in range(len(self.centroids))]
+        self.list_norms = [np.empty(0, dtype=np.float32) for _ in range(len(self.centroids))]
+
+    @classmethod
+    def build(cls, encodings, names, nlist=None, nprobe=8, iterations=20):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if len(encodings) == 0:
+            raise ValueError("Cannot train an IVF index on an empty gallery")
+        if nlist is None:
+            nlist = int(4 * np.sqrt(len(encodings)))
+        # A small gallery cannot fill more lists than it has entries
+        nlist = max(1, min(nlist, len(encodings)))
+        start = time.perf_counter()
+        index = cls(train_kmeans(encodings, nlist, iterations=iterations), nprobe=nprobe)
+        index.add(encodings, names)
+        logging.info(f"Built IVF index over {len(encodings)} encodings with {nlist} lists "
+                     f"in {time.perf_counter() - start:.2f}s")
+        return index
+
+    def __len__(self):
+        return self.active
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def add(self, encodings, names):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        names = list(names)
+        if len(names) != len(encodings):
+            raise ValueError(f"Got {len(encodings)} encodings for {len(names)} names")
+        if not names:
+            return
+        ids = np.arange(len(self.names), len(self.names) + len(names))
+        self.names.extend(names)
+        self.active += len(names)
+        for face_id, name in zip(ids, names):
+            self.name_ids.setdefault(name, []).append(face_id)
+        self.labels = np.concatenate([self.labels, [self.identities.setdefault(name, len(self.identities))
+                                                    for name in names]]).astype(np.intp)
+        assignment = _nearest_centroids(encodings, self.centroids, self.centroid_norms)[:, 0]
+        self.id_lists = np.concatenate([self.id_lists, assignment])
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(self.nlist + 1))
+        for list_no in np.flatnonzero(np.diff(bounds)):
+            members = order[bounds[list_no]:bounds[list_no + 1]]
+            vectors = encodings[members]
+            self.list_ids[list_no] = np.concatenate([self.list_ids[list_no], ids[members]])
+            self.list_vectors[list_no] = np.concatenate([self.list_vectors[list_no], vectors])
+            self.list_norms[list_no] = np.concatenate([self.list_norms[list_no], _sq_norms(vectors)])
+
+    # Removes every template stored under the given identity; returns how many.
+    def remove(self, name):
+        ids = np.array(self.name_ids.pop(name, []), dtype=np.intp)
+        for list_no in np.unique(self.id_lists[ids]):
+            keep = ~np.isin(self.list_ids[list_no], ids)
+            self.list_ids[list_no] = self.list_ids[list_no][keep]
+            self.list_vectors[list_no] = self.list_vectors[list_no][keep]
+            self.list_norms[list_no] = self.list_norms[list_no][keep]
+        for face_id in ids:
+            self.names[face_id] = None
+        self.active -= len(ids)
+        return len(ids)
+
+    def match(self, face_encodings):
+        num_faces = len(face_encodings)
+        best_indices = np.full(num_faces, -1, dtype=np.intp)
+        best_distances = np.full(num_faces, np.inf, dtype=np.float32)
+        margins = np.full(num_faces, np.inf, dtype=np.float32)
+        if num_faces == 0 or self.active == 0:
+            return best_indices, best_distances, margins
+
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        nprobe = max(1, min(self.nprobe, self.nlist))
+        probes = _nearest_centroids(queries, self.centroids, self.centroid_norms, k=nprobe)
+        q_norms = _sq_norms(queries)
+        for i, query in enumerate(queries):
+            lists = [list_no for list_no in probes[i] if len(self.list_ids[list_no])]
+            if not lists:
+                continue
+            ids = np.concatenate([self.list_ids[list_no] for list_no in lists])
+            vectors = np.concatenate([self.list_vectors[list_no] for list_no in lists])
+            norms = np.concatenate([self.list_norms[list_no] for list_no in lists])
+            d2 = norms - 2.0 * (vectors @ query) + q_norms[i]
+            distances = np.sqrt(np.maximum(d2, 0.0))
+            best = np.argmin(distances)
+            best_indices[i] = ids[best]
+            best_distances[i] = distances[best]
+            labels = self.labels[ids]
+            others = distances[labels != labels[best]]
+            if len(others):
+                margins[i] = others.min() - distances[best]
+        return best_indices, best_distances, margins
+
+    def identify(self, face_encodings, tolerance=0.6):
+        best_indices, best_distances, _ = self.match(face_encodings)
+        return [self.names[index] if distance <= tolerance else "Unknown"
+                for index, distance in zip(best_indices, best_distances)], best_distances
+
+    # Saved compacted: removed entries are dropped and ids renumbered. Written
+    # to a temporary file and renamed, so a reader never sees half an index.
+    # `signature` records what the index was built from; load() refuses any other.
+    def save(self, path, signature=''):
+        ids = np.concatenate(self.list_ids)
+        names = np.array([self.names[i] for i in ids], dtype=str)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f,
+                     centroids=self.centroids,
+                     vectors=np.concatenate(self.list_vectors),
+                     list_sizes=np.array([len(ids) for ids in self.list_ids], dtype=np.int64),
+                     names=names,
+                     nprobe=np.array(self.nprobe),
+                     signature=np.array(signature))
+        os.replace(path + '.tmp', path)
+        logging.info(f"Saved IVF index with {len(names)} entries to {path}")
+
+    @classmethod
+    def load(cls, path, nprobe=None, signature=None):
+        with np.load(path, allow_pickle=False) as data:
+            if signature is not None and str(data['signature']) != signature:
+                raise ValueError(f"IVF index {path} was built from another gallery")
+            index = cls(data['centroids'], nprobe=int(data['nprobe']) if nprobe is None else nprobe)
+            vectors = data['vectors']
+            index.names = data['names'].tolist()
+            offsets = np.concatenate([[0], np.cumsum(data['list_sizes'])])
+        index.active = len(index.names)
+        for face_id, name in enumerate(index.names):
+            index.name_ids.setdefault(name, []).append(face_id)
+        index.labels = np.array([index.identities.setdefault(name, len(index.identities)) for name in index.names],
+                                dtype=np.intp)
+        index.id_lists = np.repeat(np.arange(index.nlist), np.diff(offsets))
+        for list_no in range(index.nlist):
+            start, end = offsets[list_no], offsets[list_no + 1]
+            index.list_ids[list_no] = np.arange(start, end, dtype=np.intp)
+            index.list_vectors[list_no] = np.ascontiguousarray(vectors[start:end])
+            index.list_norms[list_no] = _sq_norms(index.list_vectors[list_no])
+        logging.info(f"Loaded IVF index with {index.active} entries from {path}")
+        return index
+
+# A gallery memory-mapped from a face_cache snapshot (smartface_gallery_<key>.npy)
+# keeps its trained IVF index next to it as smartface_gallery_<key>.ivf.npz,
+# under the snapshot's signature plus the gallery size and nlist, so a restart
+# with unchanged photos loads the lists instead of re-running k-means.
+# -> (index path, signature), or (None, None) for galleries built in memory
+def snapshot_index_cache(encodings, names, nlist):
+    filename = getattr(encodings, 'filename', None) if isinstance(encodings, np.memmap) else None
+    if not filename:
+        return None, None
+    base = os.path.splitext(filename)[0]
+    try:
+        with open(base + '.json') as f:
+            signature = json.load(f).get('signature')
+    except (OSError, ValueError):
+        return None, None
+    return base + '.ivf.npz', f"{signature}:{len(names)}:{nlist}"
+
+def _cached_ivf_index(encodings, names, nprobe, nlist):
+    path, signature = snapshot_index_cache(encodings, names, nlist)
+    if path is not None:
+        try:
+            return IVFIndex.load(path, nprobe=nprobe, signature=signature)
+        except (OSError, ValueError, KeyError):
+            pass
+    index = IVFIndex.build(encodings, names, nlist=nlist, nprobe=nprobe)
+    if path is not None:
+        try:
+            index.save(path, signature)
+        except OSError as e:
+            logging.warning(f"Could not write IVF index {path}: {e}")
+    return index
+
+# Single entry point for whatever load_known_faces returned. kind is 'brute',
+# 'ivf' or 'auto' (IVF only for galleries of IVF_MIN_GALLERY_SIZE or more). An
+# empty gallery is always brute force, as there is nothing to train lists on.
+def build_gallery_index(encodings, names, kind='auto', nprobe=8, nlist=None):
+    if kind == 'auto':
+        kind = 'ivf' if len(names) >= IVF_MIN_GALLERY_SIZE else 'brute'
+    if kind == 'brute' or len(names) == 0:
+        return FaceMatcher(encodings, names)
+    if kind == 'ivf':
+        return _cached_ivf_index(encodings, names, nprobe, nlist)
+    raise ValueError(f"Unknown gallery index kind: {kind}")
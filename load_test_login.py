@@ -0,0 +1,106 @@
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from auth_service import AuthService, check_password
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Login latency under a burst of concurrent logins, e.g. everyone arriving at
+# 9:00. By default the auth service is driven in-process against a temporary
+# database, next to the old per-request path (new connection + inline hash
+# check) for comparison. With --url the logins go to a running web_app instead;
+# its per-IP limit then applies, since every request comes from this machine.
+def percentiles(samples):
+    samples = np.array(samples) * 1000
+    return {'p50': np.percentile(samples, 50), 'p95': np.percentile(samples, 95),
+            'p99': np.percentile(samples, 99), 'max': samples.max()}
+
+def burst(fn, requests, concurrency):
+    def timed(i):
+        start = time.perf_counter()
+        result = fn(i)
+        return result, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        outcomes = list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - start
+    counts = {}
+    for result, _ in outcomes:
+        counts[result] = counts.get(result, 0) + 1
+    return percentiles([seconds for _, seconds in outcomes]), counts, elapsed
+
+def report(label, stats, counts, elapsed, requests):
+    print(f"{label:<12} p50 {stats['p50']:8.1f} ms  p95 {stats['p95']:8.1f} ms  p99 {stats['p99']:8.1f} ms  "
+          f"max {stats['max']:8.1f} ms  {requests / elapsed:6.1f} logins/s  {counts}")
+
+def run_in_process(users, requests, concurrency, hash_workers, scheme):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'smartface.db')
+        # Limits out of the way: this measures hashing and lookups, not rejections
+        auth = AuthService(db_path, scheme=scheme, hash_workers=hash_workers, max_pending=requests,
+                           ip_rate=(1000.0, requests), user_rate=(1000.0, requests))
+        logging.info(f"Registering {users} users")
+        with ThreadPoolExecutor(hash_workers) as pool:
+            list(pool.map(lambda i: auth.register(f"user{i}", f"password{i}"), range(users)))
+
+        def old_login(i):
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            user = conn.execute("SELECT password_hash, role FROM users WHERE username = ?",
+                                (f"user{i % users}",)).fetchone()
+            conn.close()
+            return 'ok' if user and check_password(user[0], f"password{i % users}") else 'invalid'
+
+        def new_login(i):
+            return auth.authenticate(f"user{i % users}", f"password{i % users}", ip=f"10.0.0.{i % users}")[0]
+
+        report('inline', *burst(old_login, requests, concurrency), requests)
+        report('auth service', *burst(new_login, requests, concurrency), requests)
+        auth.close()
+
+def run_http(url, username, password, requests, concurrency):
+    data = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args):
+            return None
+
+    opener = urllib.request.build_opener(NoRedirect)
+
+    def login(_):
+        try:
+            return opener.open(url, data, timeout=60).status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    report('http', *burst(login, requests, concurrency), requests)
+
+def main():
+    parser = argparse.ArgumentParser(description="Login latency (p50/p95/p99) under concurrent logins")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--hash-workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--scheme', choices=('pbkdf2', 'bcrypt'), default='pbkdf2')
+    parser.add_argument('--url', help="Login URL of a running web_app, e.g. http://127.0.0.1:8000/login")
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    args = parser.parse_args()
+
+    if args.url:
+        run_http(args.url, args.username, args.password, args.requests, args.concurrency)
+    else:
+        run_in_process(args.users, args.requests, args.concurrency, args.hash_workers, args.scheme)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+import bisect
+import logging
+import threading
+import time
+
+# Minimal in-process metrics in the Prometheus text exposition format, so
+# /metrics can be scraped without adding prometheus_client as a dependency.
+# Metrics are created once at import time in the module that owns them; label
+# children are created on first use and are cheap to update from hot paths.
+# Metrics without any samples are left out, so the web app can append the
+# recognition service's output to its own without repeating a metric.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Value:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+        self.function = None
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    # The value is read from fn() at scrape time, e.g. a queue's current size
+    def set_function(self, fn):
+        self.function = fn
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception:
+                return float('nan')
+        with self.lock:
+            return self.value
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield bound, cumulative
+        yield 'sum', total
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+        (registry or REGISTRY).register(self)
+
+    def _new_child(self):
+        return _Value()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        with self.lock:
+            child = self.children.get(values)
+            if child is None:
+                child = self.children[values] = self._new_child()
+            return child
+
+    def remove(self, *values):
+        with self.lock:
+            self.children.pop(tuple(str(value) for value in values), None)
+
+    # Unlabelled metrics are used directly: COUNTER.inc()
+    def __getattr__(self, attr):
+        if attr in ('inc', 'dec', 'set', 'set_function', 'observe', 'get'):
+            return getattr(self.labels(), attr)
+        raise AttributeError(attr)
+
+    def render(self):
+        with self.lock:
+            children = sorted(self.children.items())
+        if not children:
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in children:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}")
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _Histogram(self.buckets)
+
+    def render(self):
+        with self.lock:
+            children = sorted(self.children.items())
+        if not children:
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, child in children:
+            count = 0
+            for bound, value in child.samples():
+                if bound == 'sum':
+                    lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {value!r}")
+                    continue
+                count = value
+                le = (('le', _format_value(bound)),)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {value}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.metrics[metric.name] = metric
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+# Recognition pipeline
+STAGE_LATENCY = Histogram('smartface_stage_latency_seconds', "Latency of one recognition pipeline stage",
+                          ('camera', 'stage'))
+FRAMES_PROCESSED = Counter('smartface_frames_processed_total', "Frames that went through detection",
+                           ('camera',))
+FRAMES_DROPPED = Counter('smartface_frames_dropped_total', "Frames overwritten before a worker picked them up",
+                         ('camera',))
+FRAMES_SKIPPED = Counter('smartface_frames_skipped_total', "Frames skipped by the per-camera FPS cap",
+                         ('camera',))
+FACES_DETECTED = Counter('smartface_faces_detected_total', "Faces found by the detector", ('camera',))
+RECOGNITIONS = Counter('smartface_recognitions_total', "Known people recognized for the first time in a session",
+                       ('camera',))
+FRAME_QUEUE_DEPTH = Gauge('smartface_frame_queue_depth', "Frames waiting for a recognition worker", ('camera',))
+# Attendance writes
+DB_WRITE_LATENCY = Histogram('smartface_db_write_seconds', "Time to commit one batch of attendance rows")
+ATTENDANCE_WRITTEN = Counter('smartface_attendance_rows_total', "Attendance rows written", ('result',))
+ATTENDANCE_PENDING = Gauge('smartface_attendance_pending', "Attendance rows buffered in memory")
+ATTENDANCE_SUPPRESSED = Counter('smartface_attendance_suppressed_total',
+                                "Sightings dropped as duplicates by the dedup policy", ('policy',))
+ATTENDANCE_DROPPED = Counter('smartface_attendance_dropped_total', "Attendance rows dropped", ('reason',))
+# Live attendance feed (server-sent events)
+FEED_CLIENTS = Gauge('smartface_feed_clients', "Clients connected to the live attendance feed")
+FEED_EVENTS_DROPPED = Counter('smartface_feed_events_dropped_total',
+                              "Attendance events dropped from a slow feed client's buffer")
+# Logins
+LOGIN_ATTEMPTS = Counter('smartface_login_attempts_total', "Login attempts by outcome", ('result',))
+LOGIN_LATENCY = Histogram('smartface_login_seconds', "Time to answer one login attempt")
+
+# Standalone exporter for processes without Flask (the recognition service,
+# multi_camera.py): serves REGISTRY on http://host:port/metrics. http.server is
+# imported only here, as most processes never start the exporter.
+def start_metrics_server(port, host='127.0.0.1'):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logging.info(f"Metrics available on http://{host}:{port}/metrics")
+    return server
+
+# Logs at most one message per `interval` seconds for each key and reports how
+# many were suppressed in between; used instead of logging once per frame.
+class ThrottledLog:
+    def __init__(self, interval=10.0):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last = {}
+        self.suppressed = {}
+
+    def log(self, level, key, message):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last.get(key, float('-inf')) < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.last[key] = now
+            suppressed = self.suppressed.pop(key, 0)
+        if suppressed:
+            message = f"{message} ({suppressed} similar messages suppressed)"
+        logging.log(level, message)
+        return True
+
+    def error(self, key, message):
+        return self.log(logging.ERROR, key, message)
+
+    def warning(self, key, message):
+        return self.log(logging.WARNING, key, message)
+
+throttled_log = ThrottledLog()
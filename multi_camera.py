@@ -0,0 +1,137 @@
+import argparse
+import logging
+import time
+
+import cv2
+
+from attendance_policy import make_policy
+from attendance_sink import AttendanceSink
+from camera_config import load_camera_config, resolve_camera
+from face_recognition_live import init_attendance_db, load_known_faces, open_camera
+from face_detectors import DETECTORS, make_detector
+from face_tracker import FaceTracker
+from metrics import start_metrics_server
+from gallery_index import build_gallery_index
+from recognition_pipeline import RecognitionPipeline, SharedWorkerPool
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Video files decode far faster than real time; pace them to their own frame
+# rate so they behave like the live camera they are standing in for.
+class PacedCapture:
+    def __init__(self, cap):
+        self.cap = cap
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self.next_frame = time.perf_counter()
+
+    def read(self):
+        delay = self.next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_frame = max(self.next_frame + self.frame_interval, time.perf_counter())
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+# A source is a device index ("0"), a video file or a stream URL (rtsp://, http://).
+def open_source(source):
+    if str(source).isdigit():
+        return open_camera(int(source))
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        # Stream URLs may carry credentials; only their scheme is logged
+        logging.error(f"Could not open {source.split('://')[0] + ' stream' if '://' in source else source}")
+        return None
+    if '://' in source:
+        return cap
+    return PacedCapture(cap)
+
+# Runs N cameras in one process: one capture thread and latest-frame slot per
+# camera, one gallery, one attendance sink and one worker pool shared by all, so
+# each extra camera only costs its frame buffers.
+class MultiCameraServer:
+    def __init__(self, matcher, sink, workers=4, max_fps=None, detection_interval=1, detector='hog'):
+        self.matcher = matcher
+        self.sink = sink
+        self.pool = SharedWorkerPool(workers)
+        self.max_fps = max_fps
+        self.detection_interval = detection_interval
+        self.detector = detector
+        self.pipelines = {}
+
+    def add_source(self, source, camera=None):
+        camera = camera or str(source)
+        cap = open_source(source)
+        if cap is None:
+            return False
+        self.pipelines[camera] = RecognitionPipeline(cap, self.matcher, sink=self.sink, pool=self.pool,
+                                                     camera=camera, max_fps=self.max_fps,
+                                                     tracker=FaceTracker(), detector=make_detector(self.detector),
+                                                     detection_interval=self.detection_interval).start()
+        return True
+
+    @property
+    def running(self):
+        return any(pipeline.running for pipeline in self.pipelines.values())
+
+    def status(self):
+        return {camera: pipeline.stats_snapshot() for camera, pipeline in self.pipelines.items()}
+
+    def stop(self):
+        for pipeline in self.pipelines.values():
+            pipeline.stop()
+            pipeline.cap.release()
+        self.pool.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Recognize faces from several cameras in one process")
+    parser.add_argument('--source', action='append', required=True,
+                        help="Device index, camera name from cameras.json, video file or stream URL; "
+                             "repeat for more cameras")
+    parser.add_argument('--workers', type=int, default=4, help="Shared detection/encoding threads")
+    parser.add_argument('--max-fps', type=float, default=5.0, help="Frames per second processed per camera")
+    parser.add_argument('--detection-interval', type=int, default=1)
+    parser.add_argument('--detector', choices=DETECTORS, default='hog',
+                        help="'cascade' only runs dlib where motion and a Haar cascade found candidates")
+    parser.add_argument('--status-interval', type=float, default=10.0)
+    parser.add_argument('--dedup', help="Dedup policy, e.g. once_per_day, cooldown:600, entry_exit:exit-cam")
+    parser.add_argument('--metrics-port', type=int, default=None, help="Serve Prometheus metrics on this port")
+    args = parser.parse_args()
+
+    init_attendance_db()
+    known_face_encodings, known_face_names = load_known_faces()
+    if len(known_face_encodings) == 0:
+        logging.error("No known faces loaded. Exiting.")
+        return
+
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    sink = AttendanceSink('smartface.db', policy=make_policy(args.dedup))
+    server = MultiCameraServer(build_gallery_index(known_face_encodings, known_face_names), sink,
+                               workers=args.workers, max_fps=args.max_fps,
+                               detection_interval=args.detection_interval, detector=args.detector)
+    cameras = load_camera_config()
+    for i, source in enumerate(args.source):
+        # Files and URLs given on the command line are labelled by position
+        if source.isdigit() or source in cameras:
+            camera, configured = resolve_camera(source, cameras)
+            server.add_source(configured, camera)
+        else:
+            server.add_source(source, camera=f"source{i}")
+    try:
+        while server.running:
+            time.sleep(args.status_interval)
+            for camera, stats in server.status().items():
+                logging.info(f"Camera {camera}: end-to-end {stats['end_to_end']['mean_ms']:.1f} ms, "
+                             f"{stats['end_to_end']['count']} processed, {stats['frames_dropped']} dropped, "
+                             f"{stats['frames_skipped']} skipped by FPS cap")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        sink.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+import collections
+import logging
+import queue
+import threading
+import time
+
+import cv2
+
+from attendance_sink import AttendanceSink
+from face_detectors import make_detector
+from metrics import (FACES_DETECTED, FRAME_QUEUE_DEPTH, FRAMES_DROPPED, FRAMES_PROCESSED, FRAMES_SKIPPED,
+                     RECOGNITIONS, STAGE_LATENCY, throttled_log)
+
+FrameResult = collections.namedtuple('FrameResult', ['seq', 'captured_at', 'locations', 'names', 'distances'])
+
+# Names (or "Unknown") and distances for a batch of encodings, applying the same
+# acceptance rule as the original live loop: within compare_faces' tolerance
+# and a confidence (1 - distance) of at least confidence_threshold.
+def identify_faces(matcher, face_encodings, tolerance=0.6, confidence_threshold=0.6):
+    best_indices, best_distances, _ = matcher.match(face_encodings)
+    names = []
+    for best_match_index, best_distance in zip(best_indices, best_distances):
+        name = "Unknown"
+        if best_match_index >= 0 and best_distance <= tolerance and 1 - best_distance >= confidence_threshold:
+            name = matcher.names[best_match_index]
+        names.append(name)
+    return names, list(best_distances)
+
+# One-shot detect + encode + identify on a BGR frame, for callers without a pipeline.
+def recognize_frame(frame, matcher, scale=0.25, tolerance=0.6, confidence_threshold=0.6):
+    import face_recognition
+
+    small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale) if scale != 1 else frame
+    rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    face_locations = face_recognition.face_locations(rgb_small_frame)
+    face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+    names, distances = identify_faces(matcher, face_encodings, tolerance, confidence_threshold)
+    return face_locations, names, distances
+
+# Thread-safe latency counter for one pipeline stage (seconds in, milliseconds out).
+# With a histogram (a metrics label child) every sample is also exported.
+class LatencyStats:
+    def __init__(self, histogram=None):
+        self.histogram = histogram
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            self.max = max(self.max, seconds)
+        if self.histogram is not None:
+            self.histogram.observe(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            mean = self.total / self.count if self.count else 0.0
+            return {'count': self.count, 'mean_ms': mean * 1000,
+                    'last_ms': self.last * 1000, 'max_ms': self.max * 1000}
+
+# Bounded queue that never blocks the producer. When full it either discards the
+# oldest queued item ('drop_oldest', used for frames: stale frames are worthless)
+# or the item being offered ('drop_newest'); on_drop is called for every drop.
+class DropQueue:
+    def __init__(self, maxsize, policy='drop_oldest', on_drop=None):
+        if policy not in ('drop_oldest', 'drop_newest'):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.queue = queue.Queue(maxsize)
+        self.policy = policy
+        self.on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                if self.on_drop:
+                    self.on_drop()
+                if self.policy == 'drop_newest':
+                    return False
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+    def qsize(self):
+        return self.queue.qsize()
+
+# capture thread -> frames (DropQueue) -> detect/encode/match workers -> latest result
+#                                                        \-> AttendanceSink (batched writer thread)
+# The display loop never waits on recognition: it shows the newest captured frame
+# with whatever the newest finished result is. Only every detection_interval-th
+# frame is sent to the workers; with a FaceTracker, faces are encoded only for
+# tracks that are new, unconfirmed or due for re-verification. With an
+# AdaptiveController, scale, detection interval and upsample come from the
+# controller instead of the fixed arguments and follow the measured latency.
+# `detector` is a face_detectors backend (default: dlib HOG on every frame).
+class RecognitionPipeline:
+    def __init__(self, cap, matcher, db_path='smartface.db', workers=2, scale=0.25,
+                 tolerance=0.6, confidence_threshold=0.6, sink=None, tracker=None, detection_interval=1,
+                 pool=None, camera='default', max_fps=None, controller=None,
+                 detector=None):
+        self.cap = cap
+        self.camera = camera
+        self.matcher = matcher
+        self.db_path = db_path
+        self.scale = scale
+        self.tolerance = tolerance
+        self.confidence_threshold = confidence_threshold
+        self.tracker = tracker
+        self.controller = controller
+        self.detector = detector or make_detector('hog')
+        self.tracker_lock = threading.Lock()
+        self.detection_interval = max(1, detection_interval)
+        self.min_dispatch_interval = 1.0 / max_fps if max_fps else 0.0
+        self.last_dispatch = 0.0
+        self.frames_skipped = 0
+        self.pool = pool
+        # With a shared pool the queue is this camera's single latest-frame slot
+        self.frames = DropQueue(1 if pool else max(1, workers), policy='drop_oldest',
+                                on_drop=FRAMES_DROPPED.labels(camera).inc)
+        # db_write is exported by the sink itself, once per batch
+        self.stats = {stage: LatencyStats(STAGE_LATENCY.labels(camera, stage) if stage != 'db_write' else None)
+                      for stage in ('capture', 'detect', 'encode', 'match', 'db_write', 'end_to_end')}
+        self.owns_sink = sink is None
+        self.sink = sink or AttendanceSink(db_path, on_write=lambda seconds, rows: self.stats['db_write'].record(seconds))
+        self.recognized_faces = set()
+        self.stop_event = threading.Event()
+        self.frame_cond = threading.Condition()
+        self.frame_seq = 0
+        self.frame = None
+        self.result_lock = threading.Lock()
+        self.result = FrameResult(0, 0.0, [], [], [])
+        self.threads = [threading.Thread(target=self._capture_loop, name='capture', daemon=True)]
+        if pool is None:
+            self.threads += [threading.Thread(target=self._worker_loop, name=f'recognition-{i}', daemon=True)
+                             for i in range(workers)]
+
+    def start(self):
+        FRAME_QUEUE_DEPTH.labels(self.camera).set_function(self.frames.qsize)
+        if self.pool is not None:
+            self.pool.add(self)
+        for thread in self.threads:
+            thread.start()
+        workers = f"shared pool of {self.pool.size}" if self.pool else len(self.threads) - 1
+        logging.info(f"Recognition pipeline for camera {self.camera} started with {workers} workers")
+        return self
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        with self.frame_cond:
+            self.frame_cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        if self.pool is not None:
+            self.pool.remove(self)
+        FRAME_QUEUE_DEPTH.remove(self.camera)
+        if self.owns_sink:
+            self.sink.close()
+        else:
+            self.sink.flush()
+        logging.info(f"Recognition pipeline stopped: {self.stats_snapshot()}")
+
+    @property
+    def running(self):
+        return not self.stop_event.is_set()
+
+    # Blocks until a frame newer than last_seq is captured; returns (seq, frame),
+    # or (last_seq, None) on timeout or shutdown.
+    def wait_frame(self, last_seq, timeout=1.0):
+        with self.frame_cond:
+            self.frame_cond.wait_for(lambda: self.frame_seq > last_seq or self.stop_event.is_set(), timeout)
+            if self.frame_seq > last_seq:
+                return self.frame_seq, self.frame
+        return last_seq, None
+
+    def latest_result(self):
+        with self.result_lock:
+            return self.result
+
+    def stats_snapshot(self):
+        snapshot = {stage: stats.snapshot() for stage, stats in self.stats.items()}
+        snapshot['frames_dropped'] = self.frames.dropped
+        snapshot['frames_skipped'] = self.frames_skipped
+        snapshot['attendance_dropped'] = self.sink.dropped
+        snapshot['attendance_pending'] = self.sink.pending_count()
+        snapshot['detector'] = self.detector.stats.snapshot()
+        if self.controller is not None:
+            snapshot['adaptive'] = self.controller.snapshot()
+        return snapshot
+
+    # (scale, detection_interval, upsample) for the next frame
+    def _settings(self):
+        if self.controller is not None:
+            return self.controller.settings()
+        return self.scale, self.detection_interval, 1
+
+    def _capture_loop(self):
+        while not self.stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                logging.error(f"Failed to read frame from camera {self.camera}")
+                self.stop_event.set()
+                break
+            captured_at = time.perf_counter()
+            self.stats['capture'].record(captured_at - start)
+            with self.frame_cond:
+                self.frame_seq += 1
+                self.frame = frame
+                seq = self.frame_seq
+                self.frame_cond.notify_all()
+            if seq % self._settings()[1] != 0:
+                continue
+            if captured_at - self.last_dispatch < self.min_dispatch_interval:
+                self.frames_skipped += 1
+                FRAMES_SKIPPED.labels(self.camera).inc()
+                continue
+            self.last_dispatch = captured_at
+            self.frames.put((seq, captured_at, frame))
+            if self.pool is not None:
+                self.pool.notify()
+        with self.frame_cond:
+            self.frame_cond.notify_all()
+
+    def _worker_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                seq, captured_at, frame = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._process(seq, captured_at, frame)
+            except Exception as e:
+                throttled_log.error(f"worker-{self.camera}", f"Recognition worker error on camera {self.camera}: {e}")
+
+    def _identify(self, matcher, face_encodings):
+        return identify_faces(matcher, face_encodings, self.tolerance, self.confidence_threshold)
+
+    def _process(self, seq, captured_at, frame):
+        # Imported here so the heavy dlib import can overlap camera start-up
+        import face_recognition
+
+        matcher = self.matcher
+        scale, _, upsample = self._settings()
+        small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale) if scale != 1 else frame
+        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+
+        start = time.perf_counter()
+        small_locations = self.detector.detect(rgb_small_frame, upsample, seq=seq, camera=self.camera)
+        detected = time.perf_counter()
+        self.stats['detect'].record(detected - start)
+        FRAMES_PROCESSED.labels(self.camera).inc()
+        FACES_DETECTED.labels(self.camera).inc(len(small_locations))
+        # Sampled instead of per-frame, so a busy camera does not flood the log
+        throttled_log.log(logging.DEBUG, f"detect-{self.camera}",
+                          f"Camera {self.camera}: {len(small_locations)} faces in frame {seq}")
+        # Results and tracks are kept in captured-frame coordinates, so they stay
+        # comparable when the controller changes the scale between frames
+        inverse = 1 / scale
+        face_locations = [tuple(int(v * inverse) for v in location) for location in small_locations]
+
+        if self.tracker is None:
+            face_encodings = face_recognition.face_encodings(rgb_small_frame, small_locations)
+            encoded = time.perf_counter()
+            names, distances = self._identify(matcher, face_encodings)
+            self.stats['encode'].record(encoded - detected)
+            self.stats['match'].record(time.perf_counter() - encoded)
+            for name in names:
+                if name != "Unknown":
+                    self._mark_attendance(name)
+        else:
+            with self.tracker_lock:
+                # Workers can finish detection out of order; an older frame must
+                # not move tracks backwards
+                if seq < self.tracker.frame:
+                    return
+                tracks = self.tracker.update(face_locations, seq)
+                pending = [track for track in tracks if self.tracker.needs_encoding(track)]
+            if pending:
+                boxes = [tuple(int(v * scale) for v in track.box) for track in pending]
+                face_encodings = face_recognition.face_encodings(rgb_small_frame, boxes)
+                encoded = time.perf_counter()
+                pending_names, pending_distances = self._identify(matcher, face_encodings)
+                self.stats['encode'].record(encoded - detected)
+                self.stats['match'].record(time.perf_counter() - encoded)
+                with self.tracker_lock:
+                    for track, name, distance in zip(pending, pending_names, pending_distances):
+                        if self.tracker.assign(track, name, distance):
+                            self._mark_attendance(name)
+            face_locations = [track.box for track in tracks]
+            names = [track.name if track.confirmed else "Unknown" for track in tracks]
+            distances = [track.distance for track in tracks]
+
+        if self.controller is not None:
+            # End-to-end, so queueing behind busy workers counts against the budget
+            self.controller.observe(time.perf_counter() - captured_at,
+                                    [bottom - top for top, _, bottom, _ in face_locations])
+        with self.result_lock:
+            # Workers can finish out of order; never replace a newer result
+            if seq > self.result.seq:
+                self.result = FrameResult(seq, captured_at, face_locations, names, distances)
+        self.stats['end_to_end'].record(time.perf_counter() - captured_at)
+
+    # Every recognition goes to the sink; its dedup policy decides whether it is
+    # a new attendance row (first of the day, after a cooldown, an exit...)
+    def _mark_attendance(self, name):
+        with self.result_lock:
+            first = name not in self.recognized_faces
+            self.recognized_faces.add(name)
+        if first:
+            RECOGNITIONS.labels(self.camera).inc()
+        if self.sink.record(name, camera=self.camera):
+            logging.info(f"Recognized {name}")
+
+# Worker threads shared by several pipelines (one per camera) in one process.
+# Each pipeline keeps only its latest frame; workers visit cameras round-robin so
+# a busy camera cannot starve the others, and frames that are overwritten before
+# a worker gets to them are counted as drops on their own camera.
+class SharedWorkerPool:
+    def __init__(self, size=4):
+        self.size = size
+        self.cond = threading.Condition()
+        self.pipelines = []
+        self.next_index = 0
+        self.stop_event = threading.Event()
+        self.threads = [threading.Thread(target=self._worker_loop, name=f'shared-recognition-{i}', daemon=True)
+                        for i in range(size)]
+        for thread in self.threads:
+            thread.start()
+
+    def add(self, pipeline):
+        with self.cond:
+            self.pipelines.append(pipeline)
+
+    def remove(self, pipeline):
+        with self.cond:
+            if pipeline in self.pipelines:
+                self.pipelines.remove(pipeline)
+
+    def notify(self):
+        with self.cond:
+            self.cond.notify()
+
+    def close(self, timeout=5):
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _next_job(self):
+        count = len(self.pipelines)
+        for offset in range(count):
+            pipeline = self.pipelines[(self.next_index + offset) % count]
+            try:
+                item = pipeline.frames.queue.get_nowait()
+            except queue.Empty:
+                continue
+            self.next_index = (self.next_index + offset + 1) % count
+            return pipeline, item
+        return None
+
+    def _worker_loop(self):
+        while not self.stop_event.is_set():
+            with self.cond:
+                job = self._next_job()
+                if job is None:
+                    self.cond.wait(0.5)
+                    continue
+            pipeline, (seq, captured_at, frame) = job
+            try:
+                pipeline._process(seq, captured_at, frame)
+            except Exception as e:
+                throttled_log.error(f"worker-{pipeline.camera}",
+                                    f"Recognition worker error on camera {pipeline.camera}: {e}")
@@ -0,0 +1,237 @@
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+SERVICE_ADDRESS = os.path.abspath('smartface_recognition.sock') if hasattr(os, 'fork') else ('127.0.0.1', 50052)
+SERVICE_KEY_FILE = os.path.abspath('smartface_recognition.key')
+
+# Anyone holding the key can drive the service, and the manager protocol is
+# pickle-based, so the key is as good as code execution in the service. It comes
+# from SMARTFACE_SERVICE_KEY, or else a random per-install key generated on
+# first use and kept in an owner-only (0600) file next to the socket.
+def service_authkey(key_file=SERVICE_KEY_FILE):
+    key = os.environ.get('SMARTFACE_SERVICE_KEY')
+    if key:
+        return key.encode()
+    if not os.path.exists(key_file):
+        # Written in full to a private temporary file, then linked into place:
+        # a concurrent first start never reads a half-written key
+        tmp = f"{key_file}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp, key_file)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+    with open(key_file) as f:
+        return f.read().strip().encode()
+
+# Long-running process that owns the cameras. Models, gallery, the attendance
+# sink and the detection worker pool are loaded once and shared by one
+# RecognitionPipeline per camera (device index or a name from cameras.json, see
+# camera_config.resolve_camera); the Flask app drives it through a
+# RecognitionManager proxy over a local socket.
+class RecognitionService:
+    def __init__(self, db_path='smartface.db', images_path='images', workers=4):
+        self.db_path = db_path
+        self.images_path = images_path
+        self.workers = workers
+        self.lock = threading.RLock()
+        self.cameras = {}
+        self.started_at = {}
+        self.matcher = None
+        self.sink = None
+        self.pool = None
+        self.write_cond = threading.Condition()
+        self.batches_written = 0
+
+    def warm_up(self):
+        from attendance_sink import AttendanceSink
+        from face_detectors import warm_up_models
+        from face_recognition_live import init_attendance_db
+        from recognition_pipeline import SharedWorkerPool
+
+        init_attendance_db()
+        self.sink = AttendanceSink(self.db_path, on_write=self._attendance_written)
+        self.pool = SharedWorkerPool(self.workers)
+        # First call loads the dlib detector pyramids; pay for it before the first camera
+        warm_up_models()
+        self.reload_gallery()
+
+    def reload_gallery(self):
+        from face_recognition_live import load_known_faces
+        from gallery_index import build_gallery_index
+
+        start = time.perf_counter()
+        matcher = build_gallery_index(*load_known_faces(self.images_path))
+        with self.lock:
+            self.matcher = matcher
+            # Running pipelines pick up the new gallery on their next frame
+            for pipeline in self.cameras.values():
+                pipeline.matcher = matcher
+        logging.info(f"Gallery reloaded with {len(matcher)} faces in {time.perf_counter() - start:.2f}s")
+        return len(matcher)
+
+    def start(self, camera=0, max_fps=None):
+        from adaptive_control import AdaptiveController
+        from face_tracker import FaceTracker
+        from camera_config import resolve_camera
+        from multi_camera import open_source
+        from recognition_pipeline import RecognitionPipeline
+
+        camera, source = resolve_camera(camera)
+        with self.lock:
+            pipeline = self.cameras.get(camera)
+            if pipeline is not None and pipeline.running:
+                return False
+            if len(self.matcher) == 0:
+                raise RuntimeError("No known faces loaded")
+            cap = open_source(source)
+            if cap is None:
+                raise RuntimeError(f"Could not open camera {camera}")
+            self.cameras[camera] = RecognitionPipeline(cap, self.matcher, db_path=self.db_path,
+                                                       sink=self.sink, pool=self.pool, camera=camera,
+                                                       max_fps=max_fps, tracker=FaceTracker(),
+                                                       controller=AdaptiveController(workers=self.workers,
+                                                                                     detection_interval=2)).start()
+            self.started_at[camera] = time.time()
+            logging.info(f"Recognition started on camera {camera}")
+            return True
+
+    def stop(self, camera=0):
+        camera = str(camera)
+        with self.lock:
+            pipeline = self.cameras.pop(camera, None)
+            self.started_at.pop(camera, None)
+        if pipeline is None:
+            return False
+        pipeline.stop()
+        pipeline.cap.release()
+        logging.info(f"Recognition stopped on camera {camera}")
+        return True
+
+    def stop_all(self):
+        for camera in list(self.cameras):
+            self.stop(camera)
+        if self.pool:
+            self.pool.close()
+        if self.sink:
+            self.sink.close()
+
+    def status(self):
+        with self.lock:
+            cameras = dict(self.cameras)
+            started_at = dict(self.started_at)
+            gallery_size = len(self.matcher) if self.matcher is not None else 0
+        return {
+            'pid': os.getpid(),
+            'gallery_size': gallery_size,
+            'cameras': {camera: {'running': pipeline.running,
+                                 'started_at': started_at.get(camera),
+                                 'attendees': len(pipeline.recognized_faces),
+                                 'stats': pipeline.stats_snapshot()}
+                        for camera, pipeline in cameras.items()},
+        }
+
+    def _attendance_written(self, seconds, rows):
+        with self.write_cond:
+            self.batches_written += 1
+            self.write_cond.notify_all()
+
+    # Long poll for the web app's live feed: attendance rows after after_id,
+    # returned as soon as the sink commits a batch (or after `timeout` seconds,
+    # which also picks up rows written by other processes).
+    def wait_attendance(self, after_id, timeout=15.0):
+        from smartface_db import attendance_since, get_database
+
+        with self.write_cond:
+            seen = self.batches_written
+        with get_database(self.db_path).connection() as conn:
+            records = attendance_since(conn, after_id)
+        if records:
+            return records
+        with self.write_cond:
+            self.write_cond.wait_for(lambda: self.batches_written != seen, timeout)
+        with get_database(self.db_path).connection() as conn:
+            return attendance_since(conn, after_id)
+
+    # Prometheus text for this process (pipelines, sink), scraped through the web app
+    def metrics(self):
+        from metrics import REGISTRY
+        return REGISTRY.render()
+
+class RecognitionManager(BaseManager):
+    pass
+
+RecognitionManager.register('get_service')
+
+def connect(address=SERVICE_ADDRESS, authkey=None):
+    manager = RecognitionManager(address=address, authkey=authkey or service_authkey())
+    manager.connect()
+    return manager.get_service()
+
+# Returns a proxy to the running service, spawning it first if nothing is
+# listening. `process` is the Popen from an earlier call, so repeated calls
+# wait for the same process instead of starting duplicates.
+def ensure_service(process=None, log_file='face_recognition_log.txt', timeout=60):
+    try:
+        return connect(), process
+    except (FileNotFoundError, ConnectionRefusedError, EOFError):
+        pass
+    if process is None or process.poll() is not None:
+        with open(log_file, 'a') as f:
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__)], stdout=f, stderr=f)
+        logging.info(f"Recognition service started with PID {process.pid}")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Recognition service exited with code {process.returncode}")
+        try:
+            return connect(), process
+        except (FileNotFoundError, ConnectionRefusedError, EOFError):
+            time.sleep(0.2)
+    raise TimeoutError("Recognition service did not come up in time")
+
+def serve(address=SERVICE_ADDRESS, authkey=None, metrics_port=None):
+    authkey = authkey or service_authkey()
+    try:
+        connect(address, authkey)
+        logging.error(f"A recognition service is already listening on {address}")
+        return
+    except (FileNotFoundError, ConnectionRefusedError, EOFError):
+        pass
+    service = RecognitionService()
+    service.warm_up()
+    if metrics_port:
+        from metrics import start_metrics_server
+        start_metrics_server(metrics_port)
+    RecognitionManager.register('get_service', callable=lambda: service)
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)  # Stale socket from a previous run
+    # Socket created owner-only (0600): other local users cannot even connect
+    umask = os.umask(0o177)
+    try:
+        server = RecognitionManager(address=address, authkey=authkey).get_server()
+    finally:
+        os.umask(umask)
+    logging.info(f"Recognition service listening on {address}")
+    try:
+        server.serve_forever()
+    finally:
+        service.stop_all()
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Optional direct scrape target; the web app's /metrics includes these anyway
+    metrics_port = os.environ.get('SMARTFACE_METRICS_PORT')
+    serve(metrics_port=int(metrics_port) if metrics_port else None)
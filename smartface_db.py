@@ -0,0 +1,480 @@
+import contextlib
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+DB_PATH = 'smartface.db'
+
+# Schema history, tracked with PRAGMA user_version:
+#   0  legacy: attendance(name TEXT, time TEXT, date TEXT), no keys or indexes
+#   1  people(id, name) + attendance(id, person_id, ts, day, camera) with one row
+#      per person and day, covering indexes for the dashboard and exports, and
+#      the attendance_log view that presents rows in the legacy name/time/date shape
+#   2  batch_progress: completed work units of batch_recognition.py, for resuming
+#   3  attendance.event ('entry'/'exit') and attendance.dedup_key; uniqueness moves
+#      from (person_id, day) to (person_id, dedup_key) so the dedup policy
+#      (attendance_policy.py) decides how often a person is logged. Existing rows
+#      keep dedup_key = day, i.e. once per day.
+#   4  users(username, password_hash, role), shared by web_app.py and
+#      streamlit_app.py; tables created by the Streamlit app before it had a role
+#      column get one ('admin' for the admin user, 'user' for everyone else)
+#   5  attendance_daily (one row per person and day: first/last sighting, event
+#      counts) and attendance_day_totals (headcount and events per day), kept up
+#      to date by triggers on attendance and backfilled from existing rows. A
+#      later migration that rebuilds attendance must recreate the triggers.
+#   6  batch_progress.every and .segment: the sampling a video unit was planned
+#      with, so a resume with different settings is refused instead of skipping
+#      or repeating frames (NULL for rows written before, and for images)
+def _migrate_v1(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS people
+                    (id INTEGER PRIMARY KEY,
+                     name TEXT NOT NULL UNIQUE)''')
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(attendance)")]
+    legacy = 'name' in columns
+    if legacy:
+        conn.execute("ALTER TABLE attendance RENAME TO attendance_legacy")
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS attendance
+                    (id INTEGER PRIMARY KEY,
+                     person_id INTEGER NOT NULL REFERENCES people(id),
+                     ts INTEGER NOT NULL,
+                     day TEXT NOT NULL,
+                     camera TEXT NOT NULL DEFAULT 'default',
+                     UNIQUE (person_id, day))''')
+    # Dashboard / export order (newest first, date ranges). id is listed explicitly
+    # so ORDER BY ts, id and keyset pagination on (ts, id) are index-only.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_ts ON attendance (ts, id, person_id, camera)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_person_ts ON attendance (person_id, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_camera_ts ON attendance (camera, ts)")
+    conn.execute('''CREATE VIEW IF NOT EXISTS attendance_log AS
+                    SELECT a.id AS id, p.name AS name,
+                           strftime('%H:%M:%S', a.ts, 'unixepoch', 'localtime') AS time,
+                           a.day AS date, a.camera AS camera, a.ts AS ts
+                    FROM attendance a JOIN people p ON p.id = a.person_id''')
+
+    if legacy:
+        conn.execute('''INSERT OR IGNORE INTO people (name)
+                        SELECT DISTINCT name FROM attendance_legacy WHERE name IS NOT NULL''')
+        # Legacy rows hold local wall-clock time; 'utc' converts it to a real epoch.
+        # Ordered so the earliest row of a person's day wins the (person, day) slot.
+        conn.execute('''INSERT OR IGNORE INTO attendance (person_id, ts, day, camera)
+                        SELECT p.id, CAST(strftime('%s', l.date || ' ' || l.time, 'utc') AS INTEGER),
+                               l.date, 'default'
+                        FROM attendance_legacy l JOIN people p ON p.name = l.name
+                        WHERE strftime('%s', l.date || ' ' || l.time) IS NOT NULL
+                        ORDER BY l.date, l.time''')
+        migrated = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+        total = conn.execute("SELECT COUNT(*) FROM attendance_legacy").fetchone()[0]
+        logging.info(f"Migrated {migrated} of {total} legacy attendance rows "
+                     f"({total - migrated} duplicates or invalid rows dropped)")
+        conn.execute("DROP TABLE attendance_legacy")
+
+def _migrate_v2(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS batch_progress
+                    (source TEXT NOT NULL,
+                     unit INTEGER NOT NULL,
+                     frames INTEGER NOT NULL,
+                     faces INTEGER NOT NULL,
+                     PRIMARY KEY (source, unit))''')
+
+# SQLite cannot drop a table constraint, so the table is rebuilt (ids kept)
+def _migrate_v3(conn):
+    conn.execute("DROP VIEW IF EXISTS attendance_log")
+    conn.execute('''CREATE TABLE attendance_v3
+                    (id INTEGER PRIMARY KEY,
+                     person_id INTEGER NOT NULL REFERENCES people(id),
+                     ts INTEGER NOT NULL,
+                     day TEXT NOT NULL,
+                     camera TEXT NOT NULL DEFAULT 'default',
+                     event TEXT NOT NULL DEFAULT 'entry',
+                     dedup_key TEXT NOT NULL,
+                     UNIQUE (person_id, dedup_key))''')
+    conn.execute('''INSERT INTO attendance_v3 (id, person_id, ts, day, camera, event, dedup_key)
+                    SELECT id, person_id, ts, day, camera, 'entry', day FROM attendance''')
+    conn.execute("DROP TABLE attendance")
+    conn.execute("ALTER TABLE attendance_v3 RENAME TO attendance")
+    conn.execute("CREATE INDEX idx_attendance_ts ON attendance (ts, id, person_id, camera)")
+    conn.execute("CREATE INDEX idx_attendance_person_ts ON attendance (person_id, ts)")
+    conn.execute("CREATE INDEX idx_attendance_camera_ts ON attendance (camera, ts)")
+    conn.execute('''CREATE VIEW attendance_log AS
+                    SELECT a.id AS id, p.name AS name,
+                           strftime('%H:%M:%S', a.ts, 'unixepoch', 'localtime') AS time,
+                           a.day AS date, a.camera AS camera, a.event AS event, a.ts AS ts
+                    FROM attendance a JOIN people p ON p.id = a.person_id''')
+
+def _migrate_v4(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS users
+                    (username TEXT PRIMARY KEY,
+                     password_hash TEXT,
+                     role TEXT NOT NULL DEFAULT 'user')''')
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    if 'role' not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN role TEXT NOT NULL DEFAULT 'user'")
+        conn.execute("UPDATE users SET role = 'admin' WHERE username = 'admin'")
+
+# Rollups for reports (attendance_summary.py), so per-day, per-person and
+# per-week questions read one row per person and day instead of every sighting.
+# The insert trigger counts the person into the day's headcount on their first
+# row of the day; the delete trigger recomputes first/last from the remaining
+# rows of that person and day (idx_attendance_person_ts) and drops the rollup
+# when none are left. Attendance rows are never updated in place.
+def _migrate_v5(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS attendance_daily
+                    (person_id INTEGER NOT NULL REFERENCES people(id),
+                     day TEXT NOT NULL,
+                     first_ts INTEGER NOT NULL,
+                     last_ts INTEGER NOT NULL,
+                     events INTEGER NOT NULL,
+                     entries INTEGER NOT NULL,
+                     exits INTEGER NOT NULL,
+                     PRIMARY KEY (day, person_id)) WITHOUT ROWID''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_daily_person ON attendance_daily (person_id, day)")
+    conn.execute('''CREATE TABLE IF NOT EXISTS attendance_day_totals
+                    (day TEXT PRIMARY KEY,
+                     people INTEGER NOT NULL,
+                     events INTEGER NOT NULL) WITHOUT ROWID''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS attendance_rollup_insert AFTER INSERT ON attendance
+                    BEGIN
+                        INSERT OR IGNORE INTO attendance_day_totals (day, people, events) VALUES (NEW.day, 0, 0);
+                        UPDATE attendance_day_totals
+                        SET people = people + NOT EXISTS (SELECT 1 FROM attendance_daily
+                                                          WHERE day = NEW.day AND person_id = NEW.person_id),
+                            events = events + 1
+                        WHERE day = NEW.day;
+                        INSERT OR IGNORE INTO attendance_daily
+                            (person_id, day, first_ts, last_ts, events, entries, exits)
+                            VALUES (NEW.person_id, NEW.day, NEW.ts, NEW.ts, 0, 0, 0);
+                        UPDATE attendance_daily
+                        SET first_ts = MIN(first_ts, NEW.ts), last_ts = MAX(last_ts, NEW.ts),
+                            events = events + 1,
+                            entries = entries + (NEW.event = 'entry'), exits = exits + (NEW.event = 'exit')
+                        WHERE day = NEW.day AND person_id = NEW.person_id;
+                    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS attendance_rollup_delete AFTER DELETE ON attendance
+                    BEGIN
+                        UPDATE attendance_daily
+                        SET first_ts = COALESCE((SELECT MIN(ts) FROM attendance
+                                                 WHERE person_id = OLD.person_id AND day = OLD.day), first_ts),
+                            last_ts = COALESCE((SELECT MAX(ts) FROM attendance
+                                                WHERE person_id = OLD.person_id AND day = OLD.day), last_ts),
+                            events = events - 1,
+                            entries = entries - (OLD.event = 'entry'), exits = exits - (OLD.event = 'exit')
+                        WHERE day = OLD.day AND person_id = OLD.person_id;
+                        UPDATE attendance_day_totals
+                        SET people = people - EXISTS (SELECT 1 FROM attendance_daily
+                                                      WHERE day = OLD.day AND person_id = OLD.person_id
+                                                            AND events = 0),
+                            events = events - 1
+                        WHERE day = OLD.day;
+                        DELETE FROM attendance_daily WHERE day = OLD.day AND person_id = OLD.person_id AND events = 0;
+                        DELETE FROM attendance_day_totals WHERE day = OLD.day AND events = 0;
+                    END''')
+    rebuild_attendance_rollups(conn)
+
+def _migrate_v6(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(batch_progress)")]
+    for column in ('every', 'segment'):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE batch_progress ADD COLUMN {column} INTEGER")
+
+MIGRATIONS = [
+    (1, _migrate_v1),
+    (2, _migrate_v2),
+    (3, _migrate_v3),
+    (4, _migrate_v4),
+    (5, _migrate_v5),
+    (6, _migrate_v6),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# Brings the database up to SCHEMA_VERSION in place. Safe to call on every start
+# and from several processes at once: each step runs in its own IMMEDIATE
+# transaction and the version is re-read after the write lock is taken.
+def migrate(conn):
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return
+    if conn.in_transaction:
+        conn.commit()
+    for version, step in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+            logging.info(f"Database schema migrated to version {version}")
+        except Exception:
+            conn.rollback()
+            raise
+
+# ---------------------- Connections ----------------------
+# Every connection to smartface.db is opened through SQLiteBackend, which
+# applies the same settings everywhere: WAL (readers never block the writer), synchronous=
+# NORMAL (safe with WAL, one fsync per checkpoint instead of per commit), a
+# memory-mapped read path and a busy timeout instead of immediate "database is
+# locked" errors. Connections may be handed between threads (pools, Flask,
+# Streamlit), but only one thread uses a connection at a time.
+#
+# SQLite is the only backend: the schema, the migrations and the helpers below
+# use its SQL (PRAGMA user_version, triggers, INSERT OR IGNORE) directly.
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('busy_timeout', 30000),
+)
+
+class SQLiteBackend:
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, cached_statements=256)
+        for pragma, value in SQLITE_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}={value}")
+        return conn
+
+# 'smartface.db' and 'sqlite:///smartface.db' both mean the SQLite file
+def make_backend(url=DB_PATH):
+    scheme, separator, rest = url.partition('://')
+    if not separator:
+        return SQLiteBackend(url)
+    if scheme != 'sqlite':
+        raise ValueError(f"Unsupported database URL: {url} (only sqlite:/// is supported)")
+    return SQLiteBackend(rest[1:])
+
+# One configured connection, for code that keeps its own (e.g. a writer thread)
+def connect(url=DB_PATH):
+    return make_backend(url).connect()
+
+# Up to `size` connections shared by all threads of a process. connection()
+# lends one out for the duration of a with-block (waiting up to `timeout`
+# seconds when all are busy) and rolls back anything left uncommitted when it
+# comes back, so a failed request cannot leak an open transaction into the next.
+class ConnectionPool:
+    def __init__(self, backend, size=4, timeout=30.0):
+        self.backend = backend
+        self.size = size
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.created = 0
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.created < self.size:
+                self.created += 1
+                try:
+                    return self.backend.connect()
+                except Exception:
+                    self.created -= 1
+                    raise
+        try:
+            return self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"No database connection free after {self.timeout:.0f}s")
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self.lock:
+                self.created -= 1
+
+# The pool plus the query helpers the apps use. The schema is migrated when the
+# Database is created. Statements are run with parameters only, so sqlite3
+# reuses its prepared statement for each of them.
+class Database:
+    def __init__(self, url=DB_PATH, pool_size=4):
+        self.url = url
+        self.backend = make_backend(url)
+        self.pool = ConnectionPool(self.backend, pool_size)
+        with self.pool.connection() as conn:
+            migrate(conn)
+
+    def connection(self):
+        return self.pool.connection()
+
+    # Commits when the block succeeds, rolls back when it raises
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.pool.connection() as conn:
+            with conn:
+                yield conn
+
+    def query(self, statement, params=()):
+        with self.pool.connection() as conn:
+            return conn.execute(statement, params).fetchall()
+
+    def query_one(self, statement, params=()):
+        with self.pool.connection() as conn:
+            return conn.execute(statement, params).fetchone()
+
+    # -> number of rows changed
+    def execute(self, statement, params=()):
+        with self.transaction() as conn:
+            return conn.execute(statement, params).rowcount
+
+    def executemany(self, statement, rows):
+        with self.transaction() as conn:
+            return conn.executemany(statement, rows).rowcount
+
+    def close(self):
+        self.pool.close()
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+# The process-wide Database for a path or URL, created on first use
+def get_database(url=DB_PATH):
+    with _databases_lock:
+        database = _databases.get(url)
+        if database is None:
+            database = _databases[url] = Database(url)
+        return database
+
+def init_db(db_path=DB_PATH):
+    get_database(db_path)
+
+# Recomputes the rollups from the attendance rows, for all days or for
+# start_day..end_day (inclusive). Caller commits.
+def rebuild_attendance_rollups(conn, start_day=None, end_day=None):
+    clauses, params = [], []
+    if start_day:
+        clauses.append("day >= ?")
+        params.append(start_day)
+    if end_day:
+        clauses.append("day <= ?")
+        params.append(end_day)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    conn.execute(f"DELETE FROM attendance_daily {where}", params)
+    conn.execute(f"DELETE FROM attendance_day_totals {where}", params)
+    conn.execute(f'''INSERT INTO attendance_daily (person_id, day, first_ts, last_ts, events, entries, exits)
+                     SELECT person_id, day, MIN(ts), MAX(ts), COUNT(*),
+                            SUM(event = 'entry'), SUM(event = 'exit')
+                     FROM attendance {where}
+                     GROUP BY day, person_id''', params)
+    conn.execute(f'''INSERT INTO attendance_day_totals (day, people, events)
+                     SELECT day, COUNT(*), SUM(events) FROM attendance_daily {where}
+                     GROUP BY day''', params)
+    return conn.execute(f"SELECT COUNT(*) FROM attendance_daily {where}", params).fetchone()[0]
+
+def attendance_day(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+
+# rows: iterable of (name, ts, camera) or (name, ts, camera, event, dedup_key).
+# Unknown names are added to people; a row whose (person, dedup_key) already
+# exists is ignored by the UNIQUE constraint. Without a dedup_key the day is
+# used, i.e. once per person and day. Returns the number of rows actually
+# inserted. Caller commits.
+def insert_attendance(conn, rows):
+    rows = [(row[0], int(row[1]), attendance_day(row[1]), row[2],
+             row[3] if len(row) > 3 else 'entry', row[4] if len(row) > 4 else attendance_day(row[1]))
+            for row in rows]
+    conn.executemany("INSERT OR IGNORE INTO people (name) VALUES (?)", {(row[0],) for row in rows})
+    # rowcount leaves out the rollup triggers' changes, unlike total_changes
+    cursor = conn.executemany('''INSERT OR IGNORE INTO attendance (person_id, ts, day, camera, event, dedup_key)
+                                 VALUES ((SELECT id FROM people WHERE name = ?), ?, ?, ?, ?, ?)''', rows)
+    return cursor.rowcount
+
+# Latest attendance row of a person as (ts, day, event, rows that day), or None
+def last_attendance(conn, name):
+    row = conn.execute('''SELECT a.ts, a.day, a.event FROM attendance a
+                          WHERE a.person_id = (SELECT id FROM people WHERE name = ?)
+                          ORDER BY a.ts DESC LIMIT 1''', (name,)).fetchone()
+    if row is None:
+        return None
+    count = conn.execute('''SELECT COUNT(*) FROM attendance
+                            WHERE person_id = (SELECT id FROM people WHERE name = ?) AND day = ?''',
+                         (name, row[1])).fetchone()[0]
+    return row + (count,)
+
+def now_ts():
+    return int(time.time())
+
+def day_start_ts(day):
+    return int(datetime.strptime(day, "%Y-%m-%d").timestamp())
+
+def latest_attendance_id(conn):
+    return conn.execute("SELECT MAX(id) FROM attendance").fetchone()[0] or 0
+
+def encode_cursor(row):
+    return f"{row['ts']}:{row['id']}"
+
+def decode_cursor(cursor):
+    ts, row_id = cursor.split(':')
+    return int(ts), int(row_id)
+
+def _attendance_record(row_id, person, ts, day, camera, event):
+    return {'id': row_id, 'name': person, 'ts': ts, 'time': datetime.fromtimestamp(ts).strftime("%H:%M:%S"),
+            'date': day, 'camera': camera, 'event': event}
+
+# Keyset (seek) pagination, newest first. Filters map onto the indexes created
+# in _migrate_v1: date range -> idx_attendance_ts, name -> idx_attendance_person_ts,
+# camera -> idx_attendance_camera_ts; `before` is the cursor of the last row of
+# the previous page. Returns (rows, next_cursor or None).
+def query_attendance(conn, start_day=None, end_day=None, name=None, camera=None,
+                     before=None, limit=50):
+    clauses = []
+    params = []
+    if start_day:
+        clauses.append("a.ts >= ?")
+        params.append(day_start_ts(start_day))
+    if end_day:
+        clauses.append("a.ts < ?")
+        params.append(day_start_ts(end_day) + 86400)
+    if name:
+        clauses.append("a.person_id = (SELECT id FROM people WHERE name = ?)")
+        params.append(name)
+    if camera:
+        clauses.append("a.camera = ?")
+        params.append(camera)
+    if before:
+        clauses.append("(a.ts, a.id) < (?, ?)")
+        params.extend(decode_cursor(before))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cursor = conn.execute(f'''SELECT a.id, p.name, a.ts, a.day, a.camera, a.event
+                              FROM attendance a JOIN people p ON p.id = a.person_id
+                              {where}
+                              ORDER BY a.ts DESC, a.id DESC
+                              LIMIT ?''', params + [limit + 1])
+    rows = [_attendance_record(*row) for row in cursor]
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+# Rows written after the row with id after_id, oldest first (the live feed's
+# tail query; a range scan on the primary key). Same dicts as query_attendance.
+def attendance_since(conn, after_id, limit=500):
+    cursor = conn.execute('''SELECT a.id, p.name, a.ts, a.day, a.camera, a.event
+                            FROM attendance a JOIN people p ON p.id = a.person_id
+                            WHERE a.id > ?
+                            ORDER BY a.id
+                            LIMIT ?''', (after_id, limit))
+    return [_attendance_record(*row) for row in cursor]
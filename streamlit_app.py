@@ -1,59 +1,63 @@
 import streamlit as st
-import sqlite3
 import face_recognition
 import cv2
 import numpy as np
 import pandas as pd
-from datetime import datetime
 import os
 import logging
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
-import bcrypt
+from urllib.parse import urlencode
+import attendance_export
+from attendance_sink import AttendanceSink
+from auth_service import AuthService, init_users_table
+from face_cache import IMAGE_EXTENSIONS, encode_image_bytes, gallery_signature, load_known_faces_cached
+from gallery_index import build_gallery_index
+from smartface_db import get_database, query_attendance
 
 # ---------------------- Logging Setup ----------------------
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # ---------------------- Database Setup ----------------------
+# Streamlit reruns the whole script on every widget interaction; everything
+# expensive (schema setup, DB connection, gallery, worker pool) is created once
+# per process with st.cache_resource and shared by all sessions. Sessions
+# borrow connections from the process-wide pool in smartface_db.
+def get_db():
+    return get_database('smartface.db')
+
+@st.cache_resource
 def init_db():
-    conn = sqlite3.connect('smartface.db', check_same_thread=False)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-                    username TEXT PRIMARY KEY,
-                    password_hash TEXT
-                )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS attendance (
-                    name TEXT,
-                    time TEXT,
-                    date TEXT
-                )''')
-
-    # Insert default admin user if not exists
-    c.execute("SELECT * FROM users WHERE username = ?", ("admin",))
-    if not c.fetchone():
-        hashed_pw = bcrypt.hashpw("admin123".encode(), bcrypt.gensalt())
-        c.execute("INSERT INTO users VALUES (?, ?)", ("admin", hashed_pw))
-    conn.commit()
-    conn.close()
+    with get_db().connection() as conn:
+        # Default admin user is only hashed and inserted when missing
+        init_users_table(conn, scheme='bcrypt')
 
 # ---------------------- Face Recognition ----------------------
 def load_known_faces(images_path='images'):
-    known_encodings = []
-    known_names = []
-
     if not os.path.exists(images_path):
         os.makedirs(images_path)
         return [], []
+    return load_known_faces_cached(images_path, extensions=IMAGE_EXTENSIONS)
+
+# Keyed by the images/ signature: adding, replacing or removing a photo changes
+# it and the next rerun builds a new gallery; otherwise the cached one is reused.
+@st.cache_resource(max_entries=1)
+def load_gallery(images_path, signature):
+    start = time.perf_counter()
+    matcher = build_gallery_index(*load_known_faces(images_path))
+    logging.info(f"Gallery {signature[:8]} with {len(matcher)} faces built in {time.perf_counter() - start:.2f}s")
+    return matcher
 
-    for file in os.listdir(images_path):
-        if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-            image = face_recognition.load_image_file(os.path.join(images_path, file))
-            encodings = face_recognition.face_encodings(image)
-            if encodings:
-                known_encodings.append(encodings[0])
-                known_names.append(os.path.splitext(file)[0])
-    return known_encodings, known_names
+def current_gallery(images_path='images'):
+    return load_gallery(images_path, gallery_signature(images_path, IMAGE_EXTENSIONS))
 
-def recognize_faces(image, known_encodings, known_names):
+@st.cache_resource
+def get_encoder_pool():
+    return ProcessPoolExecutor(max_workers=max(1, min(4, os.cpu_count() or 1)))
+
+def recognize_faces(image, matcher):
     rgb_image = np.array(image.convert('RGB'))
     small_image = cv2.resize(rgb_image, (0, 0), fx=0.25, fy=0.25)
 
@@ -61,57 +65,90 @@ def recognize_faces(image, known_encodings, known_names):
     encodings = face_recognition.face_encodings(small_image, locations)
     recognized = []
 
-    for encoding in encodings:
-        matches = face_recognition.compare_faces(known_encodings, encoding)
-        name = "Unknown"
-        if matches:
-            distances = face_recognition.face_distance(known_encodings, encoding)
-            best_match_index = np.argmin(distances)
-            if matches[best_match_index] and distances[best_match_index] < 0.6:
-                name = known_names[best_match_index]
-                recognized.append(name)
-                save_attendance(name)
+    names, _ = matcher.identify(encodings, tolerance=0.6)
+    for name in names:
+        if name != "Unknown":
+            recognized.append(name)
+            save_attendance(name)
+    if recognized:
+        # Make the rows visible to the Dashboard page on the next rerun
+        get_attendance_sink().flush()
     return recognized
 
+# Detection + encoding of every upload runs in the process pool; matching
+# against the cached gallery happens here. Returns one row per file with its
+# timings in milliseconds.
+def recognize_uploads(uploads, matcher):
+    start = time.perf_counter()
+    futures = [(upload.name, get_encoder_pool().submit(encode_image_bytes, upload.getvalue())) for upload in uploads]
+    results = []
+    for file_name, future in futures:
+        try:
+            locations, encodings, encode_seconds = future.result()
+        except Exception as e:
+            logging.error(f"Could not process {file_name}: {e}")
+            results.append({'file': file_name, 'faces': 0, 'recognized': f"error: {e}",
+                            'detect_encode_ms': None, 'match_ms': None})
+            continue
+        match_start = time.perf_counter()
+        names, _ = matcher.identify(encodings, tolerance=0.6)
+        recognized = [name for name in names if name != "Unknown"]
+        match_ms = (time.perf_counter() - match_start) * 1000
+        for name in recognized:
+            save_attendance(name)
+        results.append({'file': file_name, 'faces': len(locations), 'recognized': ", ".join(recognized),
+                        'detect_encode_ms': round(encode_seconds * 1000, 1), 'match_ms': round(match_ms, 2)})
+    get_attendance_sink().flush()
+    return results, time.perf_counter() - start
+
 def save_attendance(name):
-    conn = sqlite3.connect('smartface.db')
-    c = conn.cursor()
-    now = datetime.now()
-    c.execute("INSERT INTO attendance (name, time, date) VALUES (?, ?, ?)", 
-              (name, now.strftime("%H:%M:%S"), now.strftime("%Y-%m-%d")))
-    conn.commit()
-    conn.close()
+    get_attendance_sink().record(name)
+
+@st.cache_resource
+def get_attendance_sink():
+    return AttendanceSink('smartface.db')
 
 # ---------------------- Authentication ----------------------
+# Shared by all sessions: one users connection, the user cache, the bounded
+# bcrypt pool and the rate limits (see verify_user for their keys).
+@st.cache_resource
+def get_auth_service():
+    init_db()
+    return AuthService('smartface.db', scheme='bcrypt')
+
+# Failed logins are limited per username and client. The client is its IP where
+# Streamlit exposes one (st.context.ip_address, newer releases only), otherwise
+# the browser session, so one noisy session cannot lock a username for everyone.
+def login_client():
+    ip = getattr(getattr(st, 'context', None), 'ip_address', None)
+    if ip is not None:
+        return ip
+    if 'login_client' not in st.session_state:
+        st.session_state.login_client = f"session:{uuid.uuid4().hex}"
+    return st.session_state.login_client
+
+# -> 'ok', 'invalid', 'rate_limited' or 'busy'
 def verify_user(username, password):
-    conn = sqlite3.connect('smartface.db')
-    c = conn.cursor()
-    c.execute("SELECT password_hash FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-    conn.close()
-    if result:
-        return bcrypt.checkpw(password.encode(), result[0])
-    return False
+    result, _ = get_auth_service().authenticate(username, password, login_client())
+    return result
 
 def register_user(username, password):
-    conn = sqlite3.connect('smartface.db')
-    c = conn.cursor()
-    try:
-        hash_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-        c.execute("INSERT INTO users VALUES (?, ?)", (username, hash_pw))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    return get_auth_service().register(username, password)
 
 # ---------------------- Streamlit App ----------------------
-def export_attendance():
-    conn = sqlite3.connect('smartface.db')
-    df = pd.read_sql_query("SELECT * FROM attendance", conn)
-    conn.close()
-    return df
+DASHBOARD_ROWS = 1000
+
+def recent_attendance(limit=DASHBOARD_ROWS):
+    with get_db().connection() as conn:
+        rows, _ = query_attendance(conn, limit=limit)
+    return pd.DataFrame(rows, columns=['name', 'time', 'date', 'camera', 'event'])
+
+# st.download_button holds the whole file in the session's memory, so exports
+# link to the Flask app's /export route, which streams them in chunks
+WEB_APP_URL = os.environ.get('SMARTFACE_WEB_URL', 'http://localhost:8000')
+
+def export_url(fmt='csv'):
+    return f"{WEB_APP_URL.rstrip('/')}/export?{urlencode({'format': fmt})}"
 
 def main():
     st.set_page_config(page_title="Smart Face Attendance", layout="wide")
@@ -126,11 +163,16 @@ def main():
         password = st.text_input("Password", type="password")
 
         if st.button("Login"):
-            if verify_user(username, password):
+            result = verify_user(username, password)
+            if result == 'ok':
                 st.session_state.logged_in = True
                 st.session_state.username = username
                 st.success("Logged in successfully!")
                 st.experimental_rerun()
+            elif result == 'rate_limited':
+                st.error("Too many login attempts. Please wait a moment and try again.")
+            elif result == 'busy':
+                st.error("The server is busy. Please try again in a moment.")
             else:
                 st.error("Invalid credentials")
 
@@ -152,27 +194,42 @@ def main():
 
         elif option == "Face Recognition":
             st.title("Face Recognition")
-            uploaded = st.file_uploader("Upload an image", type=["jpg", "jpeg", "png"])
-            known_encodings, known_names = load_known_faces()
-
-            if uploaded:
-                image = Image.open(uploaded)
-                st.image(image, caption="Uploaded Image", use_column_width=True)
-                if known_encodings:
-                    results = recognize_faces(image, known_encodings, known_names)
+            uploads = st.file_uploader("Upload images", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+            matcher = current_gallery()
+
+            if uploads:
+                if len(matcher) == 0:
+                    st.warning("No known faces loaded. Please add face images to /images folder.")
+                elif len(uploads) == 1:
+                    image = Image.open(uploads[0])
+                    st.image(image, caption="Uploaded Image", use_column_width=True)
+                    start = time.perf_counter()
+                    results = recognize_faces(image, matcher)
+                    st.caption(f"Processed in {(time.perf_counter() - start) * 1000:.0f} ms")
                     if results:
                         st.success("Recognized: " + ", ".join(results))
                     else:
                         st.warning("No known faces detected.")
                 else:
-                    st.warning("No known faces loaded. Please add face images to /images folder.")
+                    results, elapsed = recognize_uploads(uploads, matcher)
+                    recognized = sorted({name for row in results for name in row['recognized'].split(", ")
+                                         if name and not name.startswith("error")})
+                    st.caption(f"{len(uploads)} images processed in {elapsed * 1000:.0f} ms")
+                    st.dataframe(pd.DataFrame(results))
+                    if recognized:
+                        st.success("Recognized: " + ", ".join(recognized))
+                    else:
+                        st.warning("No known faces detected.")
 
         elif option == "Dashboard":
             st.title("Attendance Records")
-            df = export_attendance()
+            df = recent_attendance()
             if not df.empty:
+                st.caption(f"Showing the latest {len(df)} records")
                 st.dataframe(df)
-                st.download_button("Download CSV", df.to_csv(index=False), "attendance.csv", "text/csv")
+                st.markdown(" · ".join(f"[Download {fmt.upper()}]({export_url(fmt)})"
+                                       for fmt in attendance_export.FORMATS))
+                st.caption("Downloads are served by the web dashboard; sign in there if asked.")
             else:
                 st.warning("No records found.")
 
@@ -0,0 +1,100 @@
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from smartface_db import Database, insert_attendance, query_attendance
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Concurrent readers (dashboard pages) and writers (attendance batches) against
+# one Database for `seconds`, reporting throughput, latency percentiles and any
+# errors such as "database is locked". Runs on a temporary copy of the schema
+# unless --db points at an existing file.
+def stress(database, writers=4, readers=8, seconds=5.0, batch_size=20, people=500):
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies = {'write': [], 'read': []}
+    errors = []
+    written = [0]
+    base = datetime(2025, 1, 1).timestamp()
+
+    def record(kind, seconds):
+        with lock:
+            latencies[kind].append(seconds)
+
+    def writer(worker):
+        batch = 0
+        while not stop.is_set():
+            # Cooldown-style keys so every row is new and really gets written
+            rows = [(f"person_{(worker * 7919 + batch * batch_size + i) % people}", base + batch, f"camera_{worker}",
+                     'entry', f"stress:{worker}:{batch}:{i}") for i in range(batch_size)]
+            start = time.perf_counter()
+            try:
+                with database.transaction() as conn:
+                    inserted = insert_attendance(conn, rows)
+            except sqlite3.Error as e:
+                errors.append(f"write: {e}")
+                continue
+            record('write', time.perf_counter() - start)
+            with lock:
+                written[0] += inserted
+            batch += 1
+
+    def reader(worker):
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with database.connection() as conn:
+                    query_attendance(conn, name=f"person_{worker % people}" if worker % 2 else None, limit=50)
+            except sqlite3.Error as e:
+                errors.append(f"read: {e}")
+                continue
+            record('read', time.perf_counter() - start)
+
+    threads = ([threading.Thread(target=writer, args=(i,)) for i in range(writers)] +
+               [threading.Thread(target=reader, args=(i,)) for i in range(readers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    report = {'rows_written': written[0], 'errors': errors}
+    for kind, samples in latencies.items():
+        samples = np.array(samples or [0.0]) * 1000
+        report[kind] = {'ops': len(latencies[kind]), 'ops_per_s': len(latencies[kind]) / seconds,
+                        'p50_ms': float(np.percentile(samples, 50)), 'p99_ms': float(np.percentile(samples, 99))}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent readers and writers against the smartface database")
+    parser.add_argument('--db', help="Database file or URL; stress rows are added to it "
+                                     "(default: a temporary database)")
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--pool-size', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Database(args.db or os.path.join(tmp, 'stress.db'), pool_size=args.pool_size)
+        report = stress(database, args.writers, args.readers, args.seconds)
+        database.close()
+    for kind in ('write', 'read'):
+        stats = report[kind]
+        print(f"{kind:<6} {stats['ops']:>7} ops  {stats['ops_per_s']:>9.1f} ops/s  "
+              f"p50 {stats['p50_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms")
+    print(f"rows written: {report['rows_written']}  errors: {len(report['errors'])}")
+    for error in sorted(set(report['errors']))[:10]:
+        logging.error(error)
+
+if __name__ == '__main__':
+    main()
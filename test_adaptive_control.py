@@ -0,0 +1,33 @@
+import logging
+
+from adaptive_control import AdaptiveController
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_adaptive_control():
+    controller = AdaptiveController(target_latency_ms=100, min_face_size=200, scale=0.5, upsample=1,
+                                    detection_interval=1, cooldown=1)
+    # Cost grows with the number of detector pixels
+    def latency():
+        scale, _, upsample = controller.settings()
+        return 0.25 * (scale * 2 ** upsample) ** 2
+
+    for _ in range(50):
+        controller.observe(latency(), [120])
+    snapshot = controller.snapshot()
+    logging.info(f"Settled at {snapshot}")
+    assert snapshot['latency_ewma_ms'] <= 100
+    # Resolution never drops below what finds a 200px face
+    assert controller.detectable_face_size() <= 200
+
+    # A load spike that resolution cannot absorb falls back to skipping frames
+    for _ in range(20):
+        controller.observe(0.5, [120])
+    assert controller.settings()[1] > 1
+    # and recovers once it is gone
+    for _ in range(50):
+        controller.observe(0.01, [120])
+    assert controller.settings()[1] == 1
+
+if __name__ == '__main__':
+    test_adaptive_control()
@@ -0,0 +1,63 @@
+import csv
+import importlib.util
+import logging
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+
+from attendance_export import COLUMNS, export_attendance
+from smartface_db import insert_attendance, migrate, query_attendance
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def read_export(path, fmt):
+    if fmt == 'csv':
+        with open(path, newline='') as f:
+            rows = list(csv.reader(f))
+    elif fmt == 'xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        rows = [list(row) for row in workbook['attendance'].iter_rows(values_only=True)]
+        workbook.close()
+    else:
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        rows = [table.column_names] + [list(row) for row in zip(*table.to_pydict().values())]
+    return rows
+
+def test_attendance_export():
+    formats = ('csv', 'xlsx', 'parquet')
+    if importlib.util.find_spec('pyarrow') is None:
+        logging.warning("pyarrow is not installed; Parquet export not tested")
+        formats = ('csv', 'xlsx')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'smartface.db')
+        conn = sqlite3.connect(db_path)
+        migrate(conn)
+        monday = datetime(2025, 3, 3, 9, 0).timestamp()
+        rows = []
+        for day in range(4):
+            for i, (name, camera) in enumerate([("Alice", 'front'), ("Bob", 'front'), ("Alice", 'back')]):
+                rows.append((name, monday + day * 86400 + i * 60, camera, 'entry', f"{name}-{camera}-{day}"))
+        with conn:
+            insert_attendance(conn, rows)
+
+        filter_sets = [{}, {'start_day': '2025-03-04', 'end_day': '2025-03-05'},
+                       {'name': 'Alice', 'camera': 'back'}, {'start_day': '2025-03-06', 'name': 'Bob'}]
+        for filters in filter_sets:
+            # Same rows as the dashboard query, oldest first
+            records, _ = query_attendance(conn, limit=1000, **filters)
+            expected = [list(COLUMNS)] + [[record[column] for column in COLUMNS] for record in reversed(records)]
+            assert len(expected) > 1
+            for fmt in formats:
+                path = export_attendance(os.path.join(tmp, f"attendance.{fmt}"), fmt, db_path, **filters)
+                assert read_export(path, fmt) == expected, (fmt, filters)
+        conn.close()
+    print("Attendance export test passed")
+
+if __name__ == '__main__':
+    test_attendance_export()
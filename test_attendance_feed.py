@@ -0,0 +1,51 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from attendance_feed import AttendanceFeed, DatabaseTail
+from smartface_db import get_database, insert_attendance
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_attendance_feed():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'smartface.db')
+        database = get_database(db_path)
+        feed = AttendanceFeed(DatabaseTail(db_path, poll_interval=0.05), buffer_size=5, wait_timeout=0.5)
+        reader = feed.subscribe(0)
+        slow = feed.subscribe(0)
+
+        def write(names, ts):
+            with database.transaction() as conn:
+                insert_attendance(conn, [(name, ts, 'door') for name in names])
+
+        threading.Thread(target=write, args=(["Alice", "Bob"], time.time())).start()
+        records, missed = reader.get(5.0)
+        while len(records) < 2:
+            more, missed = reader.get(5.0)
+            records += more
+        assert [record['name'] for record in records] == ["Alice", "Bob"] and missed == 0
+
+        # The slow client never reads; its buffer keeps the newest 5 and counts the rest
+        for batch in (["Carol", "Dave"], ["Eve", "Frank"], ["Grace", "Heidi"]):
+            write(batch, time.time())
+            received = []
+            while len(received) < 2:
+                more, missed = reader.get(5.0)
+                assert more and missed == 0
+                received += more
+        records, missed = slow.get(0)
+        assert [record['name'] for record in records] == ["Dave", "Eve", "Frank", "Grace", "Heidi"]
+        assert missed == 3
+
+        feed.unsubscribe(reader)
+        feed.unsubscribe(slow)
+        feed.thread.join(2.0)
+        assert feed.thread is None
+        database.close()
+    print("Attendance feed test passed")
+
+if __name__ == '__main__':
+    test_attendance_feed()
@@ -0,0 +1,53 @@
+import logging
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+
+from attendance_policy import CooldownPolicy, EntryExitPolicy, OncePerDayPolicy
+from attendance_sink import AttendanceSink
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_attendance_policy():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'smartface.db')
+        morning = datetime(2025, 3, 3, 9, 0).timestamp()
+
+        # A sighting every 10 seconds for an hour, then the process restarts
+        sink = AttendanceSink(db_path, policy=OncePerDayPolicy(db_path))
+        buffered = sum(sink.record("Alice", morning + i * 10) for i in range(360))
+        sink.close()
+        sink = AttendanceSink(db_path, policy=OncePerDayPolicy(db_path))
+        buffered += sink.record("Alice", morning + 7200)
+        buffered += sink.record("Alice", morning + 86400)
+        sink.close()
+        assert buffered == 2
+
+        # A sighting dropped by a full buffer does not count as logged
+        sink = AttendanceSink(db_path, max_pending=0, policy=OncePerDayPolicy(db_path))
+        assert not sink.record("Dave", morning)
+        sink.max_pending = 10
+        assert sink.record("Dave", morning + 60)
+        sink.close()
+
+        cooldown = CooldownPolicy(600, db_path=None)
+        admitted = [cooldown.admit("Bob", morning + i * 60) for i in range(60)]
+        assert sum(decision is not None for decision in admitted) == 6
+
+        doors = EntryExitPolicy(exit_cameras=['exit'], min_gap=60, db_path=None)
+        events = [doors.admit("Carol", morning + offset, camera)
+                  for offset, camera in [(0, 'front'), (5, 'front'), (3600, 'exit'), (3610, 'exit'),
+                                         (4000, 'front'), (9000, 'exit')]]
+        assert [event and event[0] for event in events] == ['entry', None, 'exit', None, 'entry', 'exit']
+        assert len({event[1] for event in events if event}) == 4
+
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT name, date, event FROM attendance_log ORDER BY ts").fetchall()
+        conn.close()
+        logging.info(f"Rows: {rows}")
+        assert rows == [("Alice", "2025-03-03", "entry"), ("Dave", "2025-03-03", "entry"),
+                        ("Alice", "2025-03-04", "entry")]
+
+if __name__ == '__main__':
+    test_attendance_policy()
@@ -0,0 +1,39 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+
+from attendance_sink import AttendanceSink
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_attendance_sink(writers=4, records_per_writer=250):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'smartface.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE attendance (name TEXT, time TEXT, date TEXT)")
+        conn.commit()
+
+        sink = AttendanceSink(db_path, batch_size=50, flush_interval=0.2)
+        threads = [threading.Thread(target=lambda w=w: [sink.record(f"Writer{w}_{i}") for i in range(records_per_writer)])
+                   for w in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sink.flush()
+        count = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+        logging.info(f"Records after flush: {count}")
+        assert count == writers * records_per_writer
+
+        # Rows still buffered at shutdown must be written by close()
+        sink.record("LastUser")
+        sink.close()
+        count = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+        logging.info(f"Records after close: {count}")
+        assert count == writers * records_per_writer + 1
+        conn.close()
+
+if __name__ == '__main__':
+    test_attendance_sink()
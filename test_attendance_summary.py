@@ -0,0 +1,71 @@
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+from attendance_summary import day_summary, people_summary, person_days, week_summary
+from smartface_db import get_database, insert_attendance, rebuild_attendance_rollups
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def rollups(conn):
+    return (conn.execute("SELECT * FROM attendance_daily ORDER BY day, person_id").fetchall(),
+            conn.execute("SELECT * FROM attendance_day_totals ORDER BY day").fetchall())
+
+def test_attendance_summary():
+    with tempfile.TemporaryDirectory() as tmp:
+        database = get_database(os.path.join(tmp, 'smartface.db'))
+        monday = datetime(2025, 3, 3)
+        rows = []
+        for day in range(10):
+            base = monday.timestamp() + day * 86400
+            rows += [("Alice", base + 8.5 * 3600, 'door', 'entry', 'a-in'),
+                     ("Alice", base + 17 * 3600, 'door', 'exit', 'a-out')]
+            if day % 2 == 0:
+                rows.append(("Bob", base + 9.5 * 3600, 'door', 'entry', 'b-in'))
+        rows = [row[:4] + (f"{datetime.fromtimestamp(row[1]):%Y-%m-%d}#{row[4]}",) for row in rows]
+        with database.transaction() as conn:
+            insert_attendance(conn, rows)
+            # Duplicates are ignored by the UNIQUE key and must not be counted
+            insert_attendance(conn, rows[:3])
+
+        with database.connection() as conn:
+            days = day_summary(conn)
+            assert len(days) == 10 and days[-1] == {'day': '2025-03-03', 'people': 2, 'events': 3, 'late': 1}
+            assert days[0] == {'day': '2025-03-12', 'people': 1, 'events': 2, 'late': 0}
+            weeks = week_summary(conn)
+            assert [(week['week'], week['first_day'], week['people'], week['person_days']) for week in weeks] == \
+                [('2025-03-10', '2025-03-10', 2, 4), ('2025-03-03', '2025-03-03', 2, 11)]
+            people = {row['name']: row for row in people_summary(conn)}
+            assert people['Alice']['days'] == 10 and people['Alice']['late'] == 0
+            assert people['Bob']['days'] == 5 and people['Bob']['late'] == 5
+            # Without a start day only the last `days` days up to the latest record count
+            assert {row['name']: row['days'] for row in people_summary(conn, days=3)} == {'Alice': 3, 'Bob': 1}
+            # An unpadded hour means the same as the padded one
+            assert day_summary(conn, late_after='9:00') == days
+            assert person_days(conn, 'Alice', limit=1)[0] == {
+                'day': '2025-03-12', 'first_seen': '08:30:00', 'last_seen': '17:00:00', 'events': 2,
+                'entries': 1, 'exits': 1, 'late': False}
+
+            # Triggers and a full rebuild agree, also after deletes
+            with conn:
+                conn.execute("DELETE FROM attendance WHERE ts = ?", (monday.timestamp() + 17 * 3600,))
+                conn.execute("DELETE FROM attendance WHERE ts = ?", (monday.timestamp() + 9.5 * 3600,))
+            maintained = rollups(conn)
+            assert day_summary(conn)[-1] == {'day': '2025-03-03', 'people': 1, 'events': 1, 'late': 0}
+            with conn:
+                rebuild_attendance_rollups(conn)
+            assert rollups(conn) == maintained
+
+            # A week that crosses the new year is one week, keyed by its Monday
+            with conn:
+                insert_attendance(conn, [("Carol", datetime(2025, 12, 31, 9).timestamp(), 'door'),
+                                         ("Carol", datetime(2026, 1, 2, 9).timestamp(), 'door')])
+            assert week_summary(conn, start_day='2025-12-01')[0] == {
+                'week': '2025-12-29', 'first_day': '2025-12-31', 'last_day': '2026-01-02', 'people': 1,
+                'person_days': 2, 'events': 2}
+        database.close()
+    print("Attendance summary test passed")
+
+if __name__ == '__main__':
+    test_attendance_summary()
@@ -0,0 +1,55 @@
+import logging
+import os
+import sqlite3
+import tempfile
+
+from auth_service import AuthService, RateLimiter, check_password, hash_password, init_users_table
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_auth_service():
+    limiter = RateLimiter(rate=1.0, burst=3)
+    assert [limiter.allow('10.0.0.1', now=0.0) for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow('10.0.0.2', now=0.0)
+    assert limiter.allow('10.0.0.1', now=1.0) and not limiter.allow('10.0.0.1', now=1.0)
+
+    assert check_password(hash_password('secret', 'bcrypt'), 'secret')
+    assert not check_password(hash_password('secret', 'pbkdf2'), 'wrong')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'smartface.db')
+        # A users table from before the role column, holding a bcrypt admin
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE users (username TEXT PRIMARY KEY, password_hash TEXT)")
+        conn.execute("INSERT INTO users VALUES (?, ?)", ('admin', hash_password('admin123', 'bcrypt')))
+        conn.commit()
+        init_users_table(conn)
+        admin_hash = conn.execute("SELECT password_hash FROM users WHERE username = 'admin'").fetchone()[0]
+        init_users_table(conn)
+        assert conn.execute("SELECT password_hash FROM users WHERE username = 'admin'").fetchone()[0] == admin_hash
+        conn.close()
+
+        auth = AuthService(db_path, hash_workers=1, user_rate=(0.0, 3))
+        assert auth.authenticate('admin', 'admin123', ip='10.0.0.1') == ('ok', 'admin')
+        assert auth.authenticate('alice', 'pw', ip='10.0.0.1') == ('invalid', None)
+        # The cached miss is dropped when the user registers
+        assert auth.register('alice', 'pw')
+        assert not auth.register('alice', 'other')
+        assert auth.authenticate('alice', 'pw', ip='10.0.0.1') == ('ok', 'user')
+        # Only failures use up the per-user bucket, and only for that client
+        assert auth.authenticate('admin', 'admin123', ip='10.0.0.1') == ('ok', 'admin')
+        for _ in range(3):
+            assert auth.authenticate('admin', 'wrong', ip='10.0.0.1') == ('invalid', None)
+        assert auth.authenticate('admin', 'admin123', ip='10.0.0.1') == ('rate_limited', None)
+        assert auth.authenticate('admin', 'admin123', ip='10.0.0.2') == ('ok', 'admin')
+        auth.close()
+
+        auth = AuthService(db_path, hash_workers=1, cache_size=2)
+        for name in ('a', 'b', 'c'):
+            auth.lookup(name)
+        assert list(auth.cache) == ['b', 'c']
+        auth.close()
+    print("Auth service test passed")
+
+if __name__ == '__main__':
+    test_auth_service()
@@ -0,0 +1,42 @@
+import logging
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+
+from attendance_policy import CooldownPolicy
+from batch_recognition import UnitOrder, commit_units
+from smartface_db import migrate
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_batch_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'smartface.db'))
+        migrate(conn)
+        morning = datetime(2025, 3, 3, 9, 0).timestamp()
+        first = [('cam.mp4', 0, [("Alice", morning)], 200, 1)]
+        second = [('cam.mp4', 1, [("Alice", morning + 5400)], 200, 1)]
+
+        # The 10:30 unit finishes first but is only committed after 09:00
+        policy = CooldownPolicy(600, db_path=None)
+        order = UnitOrder(['cam.mp4', 'cam.mp4'])
+        assert order.done(1, second) == ([], 0)
+        ready, deferred = order.done(0, first)
+        assert [index for index, _ in ready] == [0, 1] and deferred == 0
+        inserted = sum(commit_units(conn, policy, results)['inserted'] for _, results in ready)
+        assert inserted == 2
+        assert [row[0] for row in conn.execute("SELECT ts FROM attendance ORDER BY id")] == \
+            [int(morning), int(morning + 5400)]
+
+        # A failed unit holds back the later units of its stream, not other streams
+        order = UnitOrder(['a.mp4', 'a.mp4', 'b.mp4'])
+        assert order.done(2, [('b.mp4', 0, [], 1, 0)]) == ([], 0)
+        assert order.done(1, [('a.mp4', 1, [], 1, 0)]) == ([], 0)
+        ready, deferred = order.done(0, None)
+        assert [index for index, _ in ready] == [2] and deferred == 1
+        conn.close()
+    print("Batch order test passed")
+
+if __name__ == '__main__':
+    test_batch_order()
@@ -0,0 +1,61 @@
+import logging
+
+import numpy as np
+
+from face_detectors import CascadeDetector
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Records every image it is given and finds one face in full frames only
+class StubBase:
+    def __init__(self):
+        self.calls = []
+
+    def locate(self, rgb_frame, upsample=1):
+        self.calls.append((rgb_frame.shape, rgb_frame.flags['C_CONTIGUOUS']))
+        return [(20, 60, 60, 20)] if rgb_frame.shape[:2] == (240, 320) else []
+
+def frame(square=None):
+    image = np.zeros((240, 320, 3), dtype=np.uint8)
+    if square is not None:
+        top, left = square
+        image[top:top + 40, left:left + 40] = 255
+    return image
+
+def test_cascade_detector():
+    base = StubBase()
+    detector = CascadeDetector(base=base, cascade=None)
+
+    # First frame of a camera: full detection
+    assert detector.detect(frame(), seq=1, camera='front') == [(20, 60, 60, 20)]
+    assert base.calls == [((240, 320, 3), True)]
+    # Nothing moved: no detector call, the previous faces are kept
+    assert detector.detect(frame(), seq=2, camera='front') == [(20, 60, 60, 20)]
+    assert len(base.calls) == 1 and detector.stats.snapshot()['skipped'] == 1
+
+    # Motion away from the face: only the region around it is searched, as a
+    # contiguous copy of the slice
+    faces = detector.detect(frame((100, 200)), seq=3, camera='front')
+    assert faces == [(20, 60, 60, 20)]
+    shape, contiguous = base.calls[-1]
+    assert shape[:2] != (240, 320) and contiguous
+
+    # Another camera has its own state and starts with a full detection
+    calls = len(base.calls)
+    detector.detect(frame((100, 200)), seq=1, camera='side')
+    assert base.calls[calls][0] == (240, 320, 3)
+    assert detector.cameras['front'].seq == 3 and detector.cameras['side'].seq == 1
+
+    # A late, older frame neither moves the reference frame back nor replaces
+    # newer faces
+    previous = detector.cameras['front'].previous
+    detector.detect(frame((150, 20)), seq=2, camera='front')
+    state = detector.cameras['front']
+    assert state.seq == 3 and state.previous is previous and state.faces_seq == 3
+    # Frames without a sequence number continue from the last one
+    detector.detect(frame((100, 200)), camera='front')
+    assert detector.cameras['front'].seq == 4
+    print("Cascade detector test passed")
+
+if __name__ == '__main__':
+    test_cascade_detector()
@@ -0,0 +1,66 @@
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+import web_app
+from smartface_db import Database, insert_attendance
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def walk(client, query):
+    ids, cursor = [], None
+    while True:
+        response = client.get(f"/api/attendance?{query}" + (f"&before={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        body = response.get_json()
+        ids += [(record['ts'], record['id'], record['name'], record['camera']) for record in body['records']]
+        cursor = body['next']
+        if cursor is None:
+            return ids
+
+def test_dashboard_pagination():
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Database(os.path.join(tmp, 'smartface.db'))
+        noon = datetime(2025, 3, 3, 12, 0).timestamp()
+        # Five rows share one timestamp, so page boundaries fall between equal ts
+        rows = [("Alice", noon, 'front' if i % 2 else 'back', 'entry', f"alice-{i}") for i in range(5)]
+        rows += [("Bob", noon - 60 * i, 'front', 'entry', f"bob-{i}") for i in range(4)]
+        with database.transaction() as conn:
+            insert_attendance(conn, rows)
+
+        original = web_app.get_database
+        web_app.get_database = lambda url=None: database
+        try:
+            client = web_app.app.test_client()
+            with client.session_transaction() as session:
+                session['username'] = 'admin'
+                session['role'] = 'admin'
+
+            # Every row exactly once, newest first, ties broken by id
+            everything = walk(client, "limit=2")
+            assert len(everything) == 9 and len({row[1] for row in everything}) == 9
+            assert everything == sorted(everything, key=lambda row: (row[0], row[1]), reverse=True)
+
+            # The cursor keeps the filter's rows only
+            alice_front = walk(client, "limit=1&name=Alice&camera=front")
+            assert [row[2:] for row in alice_front] == [('Alice', 'front')] * 2
+            assert [row[:2] for row in alice_front] == [row[:2] for row in everything
+                                                        if row[2:] == ('Alice', 'front')]
+
+            # Unchanged data answers 304 to the ETag; a new row changes it
+            etags = {}
+            for path in ("/api/attendance?limit=2", "/dashboard"):
+                etags[path] = client.get(path).headers['ETag']
+                assert client.get(path, headers={'If-None-Match': etags[path]}).status_code == 304
+            with database.transaction() as conn:
+                insert_attendance(conn, [("Carol", noon + 60, 'front')])
+            for path, etag in etags.items():
+                assert client.get(path, headers={'If-None-Match': etag}).status_code == 200
+        finally:
+            web_app.get_database = original
+            database.close()
+    print("Dashboard pagination test passed")
+
+if __name__ == '__main__':
+    test_dashboard_pagination()
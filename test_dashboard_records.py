@@ -1,29 +1,24 @@
 import sqlite3
 import logging
 from datetime import datetime
+from smartface_db import get_database, insert_attendance
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def insert_test_records():
     try:
-        conn = sqlite3.connect('smartface.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS attendance
-                     (name TEXT, time TEXT, date TEXT)''')
+        database = get_database('smartface.db')
         test_records = [
-            ("Anurag", "10:00:00", "2025-05-04"),
-            ("TestUser", "10:01:00", "2025-05-04")
+            ("Anurag", datetime(2025, 5, 4, 10, 0, 0).timestamp(), 'default'),
+            ("TestUser", datetime(2025, 5, 4, 10, 1, 0).timestamp(), 'default')
         ]
-        c.executemany("INSERT INTO attendance (name, time, date) VALUES (?, ?, ?)", test_records)
-        conn.commit()
-        logging.info(f"Inserted {len(test_records)} test records")
-        c.execute("SELECT * FROM attendance")
-        records = c.fetchall()
+        with database.transaction() as conn:
+            inserted = insert_attendance(conn, test_records)
+        logging.info(f"Inserted {inserted} test records")
+        records = database.query("SELECT name, time, date, camera FROM attendance_log")
         logging.info(f"Records in attendance: {records}")
     except sqlite3.DatabaseError as e:
         logging.error(f"Database error: {e}")
-    finally:
-        conn.close()
 
 if __name__ == '__main__':
-    insert_test_records()
\ No newline at end of file
+    insert_test_records()
@@ -0,0 +1,58 @@
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from smartface_db import SCHEMA_VERSION, migrate, schema_version
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def make_legacy_db(db_path, days=200, people=500):
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE attendance (name TEXT, time TEXT, date TEXT)")
+    rows = [(f"Person{p}", f"{8 + p % 4:02d}:{p % 60:02d}:00", f"2025-{1 + d // 28:02d}-{1 + d % 28:02d}")
+            for d in range(days) for p in range(people)]
+    rows += [("Person0", "17:00:00", "2025-01-01"), (None, "09:00:00", "2025-01-01"), ("Broken", "", "")]
+    conn.executemany("INSERT INTO attendance VALUES (?, ?, ?)", rows)
+    conn.commit()
+    return conn, days * people
+
+def test_db_migration():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'smartface.db')
+        conn, expected = make_legacy_db(db_path)
+
+        migrate(conn)
+        migrate(conn)  # idempotent
+        assert schema_version(conn) == SCHEMA_VERSION
+        count = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+        logging.info(f"Migrated {count} rows")
+        assert count == expected
+        # The duplicate 17:00 row for Person0 on 2025-01-01 is dropped; the first one wins
+        assert conn.execute("SELECT time FROM attendance_log WHERE name = 'Person0' AND date = '2025-01-01'").fetchall() == [('08:00:00',)]
+
+        dashboard = "SELECT name, time, date FROM attendance_log ORDER BY ts DESC, id DESC LIMIT 50"
+        plan = ' '.join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + dashboard))
+        logging.info(f"Dashboard query plan: {plan}")
+        # Served in order by the ts index instead of sorting every row; timing is
+        # only logged, as it depends on the machine
+        assert 'TEMP B-TREE' not in plan and 'idx_attendance_ts' in plan
+        start = time.perf_counter()
+        conn.execute(dashboard).fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+        logging.info(f"Dashboard query over {count} rows: {elapsed:.2f} ms")
+        conn.close()
+
+        # The checked-in database upgrades in place as well
+        if os.path.exists('smartface.db'):
+            copy_path = os.path.join(tmp, 'copy.db')
+            shutil.copy('smartface.db', copy_path)
+            conn = sqlite3.connect(copy_path)
+            migrate(conn)
+            logging.info(f"smartface.db copy migrated: {conn.execute('SELECT COUNT(*) FROM attendance_log').fetchone()[0]} rows")
+            conn.close()
+
+if __name__ == '__main__':
+    test_db_migration()
@@ -0,0 +1,40 @@
+import logging
+import os
+import tempfile
+
+from smartface_db import SQLITE_PRAGMAS, Database, get_database, make_backend
+from stress_test_db import stress
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_db_pool():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'smartface.db')
+        assert make_backend(f"sqlite:///{db_path}").path == db_path
+        database = Database(db_path, pool_size=3)
+        assert get_database(db_path) is not database and get_database(db_path) is get_database(db_path)
+
+        with database.connection() as conn:
+            settings = {pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma, _ in SQLITE_PRAGMAS}
+        assert settings['journal_mode'] == 'wal' and settings['synchronous'] == 1
+        assert settings['busy_timeout'] == 30000
+
+        # A failed block is rolled back before the connection goes back to the pool
+        try:
+            with database.connection() as conn:
+                conn.execute("INSERT INTO people (name) VALUES ('Ghost')")
+                raise RuntimeError("request failed")
+        except RuntimeError:
+            pass
+        assert database.query_one("SELECT COUNT(*) FROM people WHERE name = 'Ghost'")[0] == 0
+
+        report = stress(database, writers=3, readers=4, seconds=1.0)
+        assert not report['errors'], report['errors'][:3]
+        assert report['rows_written'] == database.query_one("SELECT COUNT(*) FROM attendance")[0] > 0
+        assert database.pool.created <= 3
+        database.close()
+        get_database(db_path).close()
+    print("Connection pool test passed")
+
+if __name__ == '__main__':
+    test_db_pool()
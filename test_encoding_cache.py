@@ -0,0 +1,96 @@
+import logging
+import os
+import sqlite3
+import tempfile
+
+import numpy as np
+
+from face_cache import ENCODING_SIZE, sync_encoding_cache
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append((record.levelname, record.getMessage()))
+
+# Stands in for encode_image_job over a process pool: a photo's bytes say what
+# the detector would find, and every path handed over is recorded
+def stub_map(encoded):
+    def map_fn(fn, jobs):
+        for image_path, model in jobs:
+            encoded.append(os.path.basename(image_path))
+            with open(image_path, 'rb') as f:
+                content = f.read()
+            if content.startswith(b'unreadable'):
+                yield image_path, None, 0, 0.0, "cannot identify image file"
+            elif content.startswith(b'empty'):
+                yield image_path, None, 0, 0.0, None
+            else:
+                yield image_path, np.full(ENCODING_SIZE, len(content), dtype=np.float64), 1, 0.9, None
+    return map_fn
+
+def write(path, content, mtime=None):
+    with open(path, 'wb') as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+def test_encoding_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        images_path = os.path.join(tmp, 'images')
+        os.makedirs(os.path.join(images_path, 'carol'))
+        write(os.path.join(images_path, 'alice.jpg'), b'alice', 1000)
+        write(os.path.join(images_path, 'bob.jpg'), b'bob', 1000)
+        write(os.path.join(images_path, 'carol', 'one.jpg'), b'empty', 1000)
+        conn = sqlite3.connect(os.path.join(tmp, 'smartface.db'))
+
+        encoded = []
+        selected, report = sync_encoding_cache(conn, images_path, ('.jpg',), map_fn=stub_map(encoded))
+        assert sorted(encoded) == ['alice.jpg', 'bob.jpg', 'one.jpg']
+        assert sorted((name, status) for _, name, status, _ in report) == \
+            [('alice', 'ok'), ('bob', 'ok'), ('carol', 'no_face')]
+        assert len(selected) == 3
+
+        # Nothing changed: everything comes from the cache
+        encoded.clear()
+        _, report = sync_encoding_cache(conn, images_path, ('.jpg',), map_fn=stub_map(encoded))
+        assert encoded == [] and report == []
+
+        # Touched but identical content only refreshes the stat fields; new
+        # content is encoded again; a deleted photo loses its row
+        write(os.path.join(images_path, 'alice.jpg'), b'alice', 2000)
+        write(os.path.join(images_path, 'bob.jpg'), b'bob, new photo', 2000)
+        os.remove(os.path.join(images_path, 'carol', 'one.jpg'))
+        _, report = sync_encoding_cache(conn, images_path, ('.jpg',), map_fn=stub_map(encoded))
+        assert encoded == ['bob.jpg'] and [status for _, _, status, _ in report] == ['ok']
+        rows = dict(conn.execute("SELECT path, mtime FROM face_encodings"))
+        assert sorted(os.path.basename(path) for path in rows) == ['alice.jpg', 'bob.jpg']
+        assert rows[os.path.join(images_path, 'alice.jpg')] == 2000
+        bob = conn.execute("SELECT encoding FROM face_encodings WHERE path LIKE '%bob.jpg'").fetchone()[0]
+        assert np.frombuffer(bob, dtype=np.float64)[0] == len(b'bob, new photo')
+
+        # An unreadable photo is reported and logged, and not cached, so the
+        # next run tries it again
+        write(os.path.join(images_path, 'dave.jpg'), b'unreadable', 3000)
+        records = Records()
+        logging.getLogger().addHandler(records)
+        try:
+            encoded.clear()
+            _, report = sync_encoding_cache(conn, images_path, ('.jpg',), map_fn=stub_map(encoded))
+        finally:
+            logging.getLogger().removeHandler(records)
+        assert report == [(os.path.join(images_path, 'dave.jpg'), 'dave', 'error', "cannot identify image file")]
+        assert ('ERROR', f"Could not read {os.path.join(images_path, 'dave.jpg')}: cannot identify image file") \
+            in records.messages
+        encoded.clear()
+        sync_encoding_cache(conn, images_path, ('.jpg',), map_fn=stub_map(encoded))
+        assert encoded == ['dave.jpg']
+        conn.close()
+    print("Encoding cache test passed")
+
+if __name__ == '__main__':
+    test_encoding_cache()
@@ -0,0 +1,33 @@
+import logging
+
+from face_tracker import FaceTracker, iou
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_face_tracker():
+    assert iou((0, 10, 10, 0), (0, 10, 10, 0)) == 1.0
+    assert iou((0, 10, 10, 0), (20, 30, 30, 20)) == 0.0
+
+    tracker = FaceTracker(confirm_hits=2, reverify_interval=10)
+    encodings = 0
+    for frame in range(1, 41):
+        # Two people standing still, drifting by a pixel per frame
+        boxes = [(10, 60 + frame, 50, 20 + frame), (10, 160, 50, 120)]
+        for track in tracker.update(boxes, frame):
+            if tracker.needs_encoding(track):
+                encodings += 1
+                tracker.assign(track, "Alice" if track.box[3] < 100 else "Bob", 0.3)
+    names = sorted(track.name for track in tracker.tracks)
+    logging.info(f"Tracks: {names}, encodings: {encodings} for 80 face detections")
+    assert names == ["Alice", "Bob"]
+    assert all(track.confirmed for track in tracker.tracks)
+    assert len({track.id for track in tracker.tracks}) == 2
+    assert encodings <= 12
+
+    # A face that disappears is dropped after max_misses detection rounds
+    for frame in range(41, 45):
+        tracker.update([(10, 160, 50, 120)], frame)
+    assert [track.name for track in tracker.tracks] == ["Bob"]
+
+if __name__ == '__main__':
+    test_face_tracker()
@@ -0,0 +1,69 @@
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+from face_cache import (ENCODING_SIZE, MAX_TEMPLATES, MIN_QUALITY, gallery_signature, load_gallery_snapshot,
+                        load_known_faces_cached, save_gallery_snapshot, snapshot_paths)
+from face_matcher import FaceMatcher
+from gallery_index import build_gallery_index
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_gallery_snapshot():
+    with tempfile.TemporaryDirectory() as tmp:
+        images_path = os.path.join(tmp, 'images')
+        os.makedirs(images_path)
+        for name in ('alice', 'bob'):
+            with open(os.path.join(images_path, f"{name}.jpg"), 'wb') as f:
+                f.write(name.encode())
+        paths = snapshot_paths(images_path, ('.jpg',), os.path.join(tmp, 'smartface.db'), 'all')
+        signature = gallery_signature(images_path, ('.jpg',))
+        encodings = np.random.default_rng(0).normal(size=(2, ENCODING_SIZE))
+        save_gallery_snapshot(paths, signature, encodings, ['alice', 'bob'])
+
+        loaded, names = load_gallery_snapshot(paths, signature)
+        assert names == ['alice', 'bob']
+        assert isinstance(loaded, np.memmap) and np.array_equal(loaded, encodings.astype(np.float32))
+        # The matcher works on the mapped array directly instead of a converted copy
+        assert np.shares_memory(FaceMatcher(loaded, names).gallery, loaded)
+
+        # A trained IVF index is kept next to the snapshot and reused while the
+        # snapshot's signature holds
+        index_path = os.path.splitext(paths[0])[0] + '.ivf.npz'
+        first = build_gallery_index(loaded, names, kind='ivf', nlist=2)
+        assert os.path.exists(index_path)
+        os.utime(index_path, (0, 0))
+        second = build_gallery_index(loaded, names, kind='ivf', nlist=2)
+        assert os.stat(index_path).st_mtime == 0
+        assert np.array_equal(first.centroids, second.centroids)
+        assert second.identify(encodings)[0] == ['alice', 'bob']
+
+        # A new image changes the signature, so the snapshot is not used
+        with open(os.path.join(images_path, 'carol.jpg'), 'wb') as f:
+            f.write(b'carol')
+        assert load_gallery_snapshot(paths, gallery_signature(images_path, ('.jpg',))) is None
+        # Different load options use a different snapshot
+        assert snapshot_paths(images_path, ('.jpg',), os.path.join(tmp, 'smartface.db'), 'mean') != paths
+        # So does another detector model
+        signature = gallery_signature(images_path, ('.jpg',))
+        save_gallery_snapshot(paths, signature, encodings[:1], ['alice'])
+        assert load_gallery_snapshot(paths, gallery_signature(images_path, ('.jpg',), model='cnn')) is None
+        del loaded
+
+        # A photo that cannot be read leaves no snapshot behind, so the next
+        # start tries it again
+        for name in ('alice', 'bob', 'carol'):
+            os.remove(os.path.join(images_path, f"{name}.jpg"))
+        with open(os.path.join(images_path, 'dave.jpg'), 'wb') as f:
+            f.write(b'not an image')
+        db_path = os.path.join(tmp, 'faces.db')
+        encodings, names = load_known_faces_cached(images_path, ('.jpg',), db_path)
+        assert names == []
+        key = f"best{MAX_TEMPLATES}:{MIN_QUALITY}"
+        assert not any(os.path.exists(path) for path in snapshot_paths(images_path, ('.jpg',), db_path, key))
+    print("Gallery snapshot test passed")
+
+if __name__ == '__main__':
+    test_gallery_snapshot()
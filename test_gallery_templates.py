@@ -0,0 +1,45 @@
+import logging
+
+import numpy as np
+
+from face_cache import compact_templates, face_quality, pose_score, select_templates
+from face_matcher import FaceMatcher
+from gallery_index import IVFIndex
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_gallery_templates():
+    rng = np.random.default_rng(0)
+
+    # Quality: a sharp, large, frontal face scores high; a flat or turned one low
+    frontal = {'left_eye': [(40, 50), (50, 50)], 'right_eye': [(70, 50), (80, 50)], 'nose_tip': [(60, 80)]}
+    profile = {'left_eye': [(40, 50), (50, 50)], 'right_eye': [(70, 50), (80, 50)], 'nose_tip': [(85, 80)]}
+    assert pose_score(frontal) == 1.0 and pose_score(profile) < 0.2
+    sharp = rng.integers(0, 256, size=(200, 200, 3), dtype=np.uint8)
+    blurred = np.full((200, 200, 3), 128, dtype=np.uint8)
+    assert face_quality(sharp, (20, 180, 180, 20), frontal) > 0.9
+    assert face_quality(blurred, (20, 180, 180, 20), frontal) == 0.0
+    assert face_quality(sharp, (20, 60, 60, 20)) < 0.5
+
+    # Selection: low quality dropped, near-duplicates of the best photo skipped
+    base = rng.normal(scale=0.1, size=128)
+    encodings = np.array([base, base + 0.001, base + 0.002, base + 0.05, base - 0.05, base + 0.1])
+    qualities = np.array([0.9, 0.85, 0.8, 0.6, 0.6, 0.1])
+    assert select_templates(encodings, qualities, max_templates=3) == [0, 3, 4]
+    assert select_templates(encodings[5:], qualities[5:]) == [0]
+
+    # Per identity: bounded rows per person, and a person's second template is
+    # never their own runner-up
+    names = ['alice'] * 6 + ['bob']
+    encodings = np.vstack([encodings, rng.normal(scale=0.1, size=128)])
+    qualities = np.append(qualities, 0.7)
+    kept, kept_names = compact_templates(encodings, names, qualities, max_templates=3)
+    assert kept_names == ['alice'] * 3 + ['bob']
+    for matcher in (FaceMatcher(kept, kept_names), IVFIndex.build(kept, kept_names, nlist=2, nprobe=2)):
+        best_indices, best_distances, margins = matcher.match(base[None, :])
+        assert matcher.names[best_indices[0]] == 'alice' and best_distances[0] < 1e-3
+        assert abs(margins[0] - np.linalg.norm(kept[-1] - base)) < 1e-3
+    print("Gallery templates test passed")
+
+if __name__ == '__main__':
+    test_gallery_templates()
@@ -0,0 +1,33 @@
+import logging
+
+from metrics import Counter, Gauge, Histogram, Registry, ThrottledLog
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def test_metrics():
+    registry = Registry()
+    frames = Counter('frames_total', "Frames", ('camera',), registry=registry)
+    depth = Gauge('queue_depth', "Queue depth", registry=registry)
+    latency = Histogram('latency_seconds', "Latency", ('stage',), buckets=(0.01, 0.1), registry=registry)
+
+    frames.labels('front').inc()
+    frames.labels(camera='front').inc(2)
+    depth.set_function(lambda: 3)
+    for seconds in (0.005, 0.05, 0.05, 2.0):
+        latency.labels('detect').observe(seconds)
+
+    text = registry.render()
+    logging.info(f"Rendered metrics:\n{text}")
+    assert 'frames_total{camera="front"} 3' in text
+    assert 'queue_depth 3' in text
+    assert 'latency_seconds_bucket{stage="detect",le="0.01"} 1' in text
+    assert 'latency_seconds_bucket{stage="detect",le="0.1"} 3' in text
+    assert 'latency_seconds_bucket{stage="detect",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{stage="detect"} 4' in text
+
+    throttle = ThrottledLog(interval=60)
+    emitted = [throttle.warning('frame', f"Frame {i} failed") for i in range(100)]
+    assert emitted.count(True) == 1
+
+if __name__ == '__main__':
+    test_metrics()
@@ -0,0 +1,70 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from face_detectors import DetectorStats
+from face_matcher import FaceMatcher
+from recognition_pipeline import DropQueue, RecognitionPipeline
+
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# A camera that delivers `frames` blank frames and then fails, like an unplugged one
+class StubCamera:
+    def __init__(self, frames):
+        self.remaining = frames
+
+    def read(self):
+        time.sleep(0.001)
+        if self.remaining == 0:
+            return False, None
+        self.remaining -= 1
+        return True, np.zeros((120, 160, 3), dtype=np.uint8)
+
+# Slower than the camera, so the frame queue overflows
+class StubDetector:
+    def __init__(self):
+        self.stats = DetectorStats()
+        self.seqs = []
+        self.lock = threading.Lock()
+
+    def detect(self, rgb_frame, upsample=1, seq=None, camera='default'):
+        time.sleep(0.01)
+        with self.lock:
+            self.seqs.append(seq)
+        return []
+
+def test_recognition_pipeline():
+    # drop_oldest keeps the newest items, drop_newest refuses the new one
+    drops = []
+    frames = DropQueue(2, policy='drop_oldest', on_drop=lambda: drops.append(1))
+    assert all(frames.put(i) for i in range(5))
+    assert frames.dropped == 3 and len(drops) == 3
+    assert [frames.get(timeout=0), frames.get(timeout=0)] == [3, 4]
+    newest = DropQueue(2, policy='drop_newest')
+    assert [newest.put(i) for i in range(3)] == [True, True, False]
+    assert newest.dropped == 1 and [newest.get(timeout=0), newest.get(timeout=0)] == [0, 1]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        detector = StubDetector()
+        pipeline = RecognitionPipeline(StubCamera(100), FaceMatcher(np.empty((0, 128)), []),
+                                       db_path=os.path.join(tmp, 'smartface.db'), workers=2,
+                                       scale=1, detector=detector, camera='stub')
+        pipeline.start()
+        # The capture thread stops the pipeline when the camera runs dry
+        assert pipeline.stop_event.wait(10)
+        start = time.perf_counter()
+        pipeline.stop()
+        assert time.perf_counter() - start < 5
+        assert not any(thread.is_alive() for thread in pipeline.threads)
+        # Every captured frame was either processed, dropped or still queued
+        assert len(detector.seqs) + pipeline.frames.dropped + pipeline.frames.qsize() == 100
+        assert pipeline.frames.dropped > 0
+        assert pipeline.stats_snapshot()['frames_dropped'] == pipeline.frames.dropped
+    print("Recognition pipeline test passed")
+
+if __name__ == '__main__':
+    test_recognition_pipeline()
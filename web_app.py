@@ -1,12 +1,22 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response, Response, stream_with_context
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
-import subprocess
 import os
 import logging
 import socket
 import atexit
-import sys
+import threading
+import hashlib
+import json
+from datetime import datetime
+from multiprocessing import AuthenticationError
+from attendance_export import FORMATS as EXPORT_FORMATS, iter_export
+from attendance_feed import AttendanceFeed, DatabaseTail, ServiceTail, attendance_after, current_attendance_id
+from attendance_summary import LATE_AFTER, PEOPLE_SUMMARY_DAYS, clock_time, day_summary, people_summary, person_days, week_summary
+from auth_service import AuthService, init_users_table
+from camera_config import resolve_camera
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, throttled_log
+from recognition_service import connect, ensure_service
+from smartface_db import decode_cursor, get_database, latest_attendance_id, query_attendance
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,41 +32,24 @@ def is_port_available(port):
 # Database setup for users and attendance
 def init_users_db():
     db_path = 'smartface.db'
+    logging.info(f"Checking database: {db_path}")
+    # get_database() creates or migrates the schema on first use; a file that
+    # is not a database at all is removed and recreated
     try:
-        if os.path.exists(db_path):
-            logging.info(f"Checking database: {db_path}")
-            conn = sqlite3.connect(db_path)
-            c = conn.cursor()
-            c.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = c.fetchall()
-            conn.close()
-            if not tables:
-                logging.warning(f"Empty or invalid database detected. Removing {db_path}")
-                os.remove(db_path)
-        else:
-            logging.info(f"No existing database found at {db_path}. Creating new one.")
+        database = get_database(db_path)
     except sqlite3.DatabaseError as e:
         logging.error(f"Database error: {e}. Removing {db_path}")
         if os.path.exists(db_path):
             os.remove(db_path)
-    
-    try:
-        conn = sqlite3.connect(db_path, check_same_thread=False)
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS users
-                     (username TEXT PRIMARY KEY, password_hash TEXT, role TEXT)''')
-        admin_password = generate_password_hash('admin123', method='pbkdf2:sha256')
-        c.execute("INSERT OR IGNORE INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-                  ('admin', admin_password, 'admin'))
-        c.execute('''CREATE TABLE IF NOT EXISTS attendance
-                     (name TEXT, time TEXT, date TEXT)''')
-        conn.commit()
+        database = get_database(db_path)
+
+    try:
+        with database.connection() as conn:
+            init_users_table(conn)
         logging.info("Users and attendance tables initialized successfully")
     except sqlite3.DatabaseError as e:
         logging.error(f"Failed to initialize database: {e}")
         raise
-    finally:
-        conn.close()
 
 @app.route('/')
 def index():
@@ -65,30 +58,45 @@ def index():
         return redirect(url_for('dashboard'))
     return redirect(url_for('login'))
 
+# Created on first use, after init_users_db() has checked the database file
+auth_lock = threading.Lock()
+auth = None
+
+def auth_service():
+    global auth
+    with auth_lock:
+        if auth is None:
+            auth = AuthService('smartface.db')
+        return auth
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
+    status = 200
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
         try:
-            conn = sqlite3.connect('smartface.db', check_same_thread=False)
-            c = conn.cursor()
-            c.execute("SELECT password_hash, role FROM users WHERE username = ?", (username,))
-            user = c.fetchone()
-            conn.close()
-            if user and check_password_hash(user[0], password):
+            result, role = auth_service().authenticate(username, password, request.remote_addr)
+            if result == 'ok':
                 session['username'] = username
-                session['role'] = user[1]
+                session['role'] = role
                 flash('Login successful!', 'success')
                 logging.info(f"User {username} logged in")
                 return redirect(url_for('dashboard'))
-            flash('Invalid username or password', 'danger')
-            logging.warning(f"Failed login attempt for {username}")
+            if result == 'rate_limited':
+                flash('Too many login attempts. Please wait a moment and try again.', 'danger')
+                status = 429
+            elif result == 'busy':
+                flash('The server is busy. Please try again in a moment.', 'danger')
+                status = 503
+            else:
+                flash('Invalid username or password', 'danger')
+                logging.warning(f"Failed login attempt for {username}")
         except sqlite3.DatabaseError as e:
             flash(f"Database error: {e}. Please contact the administrator.", 'danger')
             logging.error(f"Login database error: {e}")
     logging.info("Rendering login page")
-    return render_template('login.html')
+    return render_template('login.html'), status
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -100,67 +108,350 @@ def register():
         username = request.form['username']
         password = request.form['password']
         role = request.form['role']
-        password_hash = generate_password_hash(password, method='pbkdf2:sha256')
         try:
-            conn = sqlite3.connect('smartface.db', check_same_thread=False)
-            c = conn.cursor()
-            c.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-                      (username, password_hash, role))
-            conn.commit()
-            flash('User registered successfully!', 'success')
-            logging.info(f"User {username} registered with role {role}")
-        except sqlite3.IntegrityError:
-            flash('Username already exists', 'danger')
-            logging.warning(f"Registration failed: Username {username} already exists")
+            if auth_service().register(username, password, role):
+                flash('User registered successfully!', 'success')
+                logging.info(f"User {username} registered with role {role}")
+            else:
+                flash('Username already exists', 'danger')
+                logging.warning(f"Registration failed: Username {username} already exists")
         except sqlite3.DatabaseError as e:
             flash(f"Database error: {e}", 'danger')
             logging.error(f"Registration database error: {e}")
-        finally:
-            conn.close()
         return redirect(url_for('register'))
     logging.info("Rendering register page")
     return render_template('register.html')
 
+DASHBOARD_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def attendance_filters():
+    filters = {key: request.args.get(key, '').strip() or None
+               for key in ('start', 'end', 'name', 'camera', 'before')}
+    for key in ('start', 'end'):
+        if filters[key]:
+            datetime.strptime(filters[key], "%Y-%m-%d")
+    if filters['before']:
+        decode_cursor(filters['before'])
+    return filters
+
+def fetch_attendance_page(filters, limit):
+    with get_database().connection() as conn:
+        latest_id = latest_attendance_id(conn)
+        rows, next_cursor = query_attendance(conn, start_day=filters['start'], end_day=filters['end'],
+                                             name=filters['name'], camera=filters['camera'],
+                                             before=filters['before'], limit=limit)
+    return latest_id, rows, next_cursor
+
+# Rows are only ever appended, so the newest row id plus everything else that
+# shapes the response identifies its content.
+def attendance_etag(latest_id, *parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:16]
+    return f"{latest_id}-{digest}"
+
+def not_modified(etag):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    return response
+
+def cacheable(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/dashboard')
 def dashboard():
     if 'username' not in session:
         logging.warning("Unauthorized dashboard access; redirecting to login")
         return redirect(url_for('login'))
     try:
-        conn = sqlite3.connect('smartface.db', check_same_thread=False)
-        c = conn.cursor()
-        c.execute("SELECT name, time, date FROM attendance ORDER BY date DESC, time DESC")
-        attendance = c.fetchall()
-        conn.close()
+        filters = attendance_filters()
+    except ValueError:
+        flash("Invalid filter; dates must be YYYY-MM-DD", 'danger')
+        return redirect(url_for('dashboard'))
+    attendance, next_cursor, etag, live_url = [], None, None, None
+    try:
+        latest_id, attendance, next_cursor = fetch_attendance_page(filters, DASHBOARD_PAGE_SIZE)
+        etag = attendance_etag(latest_id, session['username'], session['role'], request.query_string)
+        # Only the unfiltered newest page is kept up to date live
+        if not any(filters.values()):
+            live_url = url_for('attendance_stream', after=latest_id)
         logging.info("Attendance data fetched for dashboard")
     except sqlite3.DatabaseError as e:
         flash(f"Database error: {e}", 'danger')
         logging.error(f"Dashboard database error: {e}")
-        attendance = []
+    # Pending flash messages are part of the page, so never answer 304 with them
+    if etag and '_flashes' not in session and etag in request.if_none_match:
+        return not_modified(etag)
     logging.info(f"Rendering dashboard for user {session['username']}")
-    return render_template('dashboard.html', attendance=attendance, username=session['username'], role=session['role'])
+    filter_args = {key: value for key, value in filters.items() if value and key != 'before'}
+    response = make_response(render_template('dashboard.html', attendance=attendance, username=session['username'],
+                                             role=session['role'], filters=filter_args, next_cursor=next_cursor,
+                                             paged=bool(filters['before']), live_url=live_url,
+                                             page_size=DASHBOARD_PAGE_SIZE))
+    return cacheable(response, etag) if etag else response
+
+@app.route('/api/attendance')
+def api_attendance():
+    if 'username' not in session:
+        return jsonify({'error': 'authentication required'}), 401
+    try:
+        filters = attendance_filters()
+        limit = min(max(int(request.args.get('limit', DASHBOARD_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'invalid filter; dates must be YYYY-MM-DD'}), 400
+    try:
+        latest_id, records, next_cursor = fetch_attendance_page(filters, limit)
+    except sqlite3.DatabaseError as e:
+        logging.error(f"Attendance API database error: {e}")
+        return jsonify({'error': 'database error'}), 500
+    etag = attendance_etag(latest_id, request.query_string)
+    if etag in request.if_none_match:
+        return not_modified(etag)
+    return cacheable(jsonify({'records': records, 'next': next_cursor}), etag)
+
+# Live attendance as server-sent events. The feed tails the recognition
+# service (or the database when no service is running) and each client gets
+# only rows newer than the page it loaded, or than Last-Event-ID after a
+# reconnect. A client that fell further behind than its buffer gets a 'resync'
+# event and reloads. Comments every FEED_HEARTBEAT seconds keep proxies from
+# closing the stream and notice clients that went away.
+FEED_HEARTBEAT = 15
+attendance_feed = AttendanceFeed(ServiceTail(DatabaseTail('smartface.db')))
+
+def sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{head}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/attendance/stream')
+def attendance_stream():
+    if 'username' not in session:
+        return jsonify({'error': 'authentication required'}), 401
+    try:
+        start_id = current_attendance_id()
+        after_id = int(request.headers.get('Last-Event-ID') or request.args.get('after') or start_id)
+    except ValueError:
+        return jsonify({'error': 'invalid event id'}), 400
+    except sqlite3.DatabaseError as e:
+        logging.error(f"Attendance stream database error: {e}")
+        return jsonify({'error': 'database error'}), 500
+    if attendance_feed.full():
+        return jsonify({'error': 'too many live feed clients'}), 503
+
+    # Subscribed only once the response is being sent: a response that is never
+    # iterated (client gone before the first chunk) never holds a slot
+    def stream():
+        sent_id = after_id
+        client = attendance_feed.subscribe(start_id)
+        if client is None:
+            yield sse('busy', {'error': 'too many live feed clients'})
+            return
+        try:
+            # Rows written since the client's page, before its subscription started
+            backlog = attendance_after('smartface.db', after_id, attendance_feed.buffer_size + 1)
+            if len(backlog) > attendance_feed.buffer_size:
+                yield sse('resync', {'missed': len(backlog)})
+                return
+            yield 'retry: 3000\n\n'
+            records, missed = backlog, 0
+            while True:
+                if missed:
+                    yield sse('resync', {'missed': missed})
+                    return
+                for record in records:
+                    if record['id'] > sent_id:
+                        sent_id = record['id']
+                        yield sse('attendance', record, record['id'])
+                records, missed = client.get(FEED_HEARTBEAT)
+                if not records and not missed:
+                    yield ': keep-alive\n\n'
+        finally:
+            attendance_feed.unsubscribe(client)
+
+    response = Response(stream_with_context(stream()), content_type='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Unbuffered behind nginx
+    return response
+
+# Summaries come from the rollup tables, so they stay cheap however many
+# sightings are logged. Like the attendance pages, they only change when a row is
+# added, which keeps the newest row id usable in the ETag.
+SUMMARY_VIEWS = ('days', 'weeks', 'people', 'person')
+
+def summary_args():
+    filters = attendance_filters()
+    late_after = clock_time(request.args.get('late_after') or LATE_AFTER)
+    return filters, late_after
+
+def fetch_summary(view, filters, late_after):
+    with get_database().connection() as conn:
+        latest_id = latest_attendance_id(conn)
+        if view == 'days':
+            rows = day_summary(conn, filters['start'], filters['end'], late_after)
+        elif view == 'weeks':
+            rows = week_summary(conn, filters['start'], filters['end'])
+        elif view == 'people':
+            rows = people_summary(conn, filters['start'], filters['end'], late_after)
+        else:
+            rows = person_days(conn, filters['name'], filters['start'], filters['end'], late_after)
+    return latest_id, rows
+
+@app.route('/api/summary/<view>')
+def api_summary(view):
+    if 'username' not in session:
+        return jsonify({'error': 'authentication required'}), 401
+    if view not in SUMMARY_VIEWS:
+        return jsonify({'error': f"unknown view; choose from {', '.join(SUMMARY_VIEWS)}"}), 404
+    try:
+        filters, late_after = summary_args()
+    except ValueError:
+        return jsonify({'error': 'invalid filter; dates must be YYYY-MM-DD and late_after HH:MM'}), 400
+    if view == 'person' and not filters['name']:
+        return jsonify({'error': 'the person view needs a name'}), 400
+    try:
+        latest_id, rows = fetch_summary(view, filters, late_after)
+    except sqlite3.DatabaseError as e:
+        logging.error(f"Summary API database error: {e}")
+        return jsonify({'error': 'database error'}), 500
+    etag = attendance_etag(latest_id, view, request.query_string)
+    if etag in request.if_none_match:
+        return not_modified(etag)
+    return cacheable(jsonify({'view': view, 'late_after': late_after, 'rows': rows}), etag)
+
+@app.route('/summary')
+def summary():
+    if 'username' not in session:
+        logging.warning("Unauthorized summary access; redirecting to login")
+        return redirect(url_for('login'))
+    try:
+        filters, late_after = summary_args()
+    except ValueError:
+        flash("Invalid filter; dates must be YYYY-MM-DD and late_after HH:MM", 'danger')
+        return redirect(url_for('summary'))
+    views = {}
+    try:
+        for view in ('days', 'weeks', 'people') + (('person',) if filters['name'] else ()):
+            _, views[view] = fetch_summary(view, filters, late_after)
+    except sqlite3.DatabaseError as e:
+        flash(f"Database error: {e}", 'danger')
+        logging.error(f"Summary database error: {e}")
+    return render_template('summary.html', views=views, late_after=late_after, username=session['username'],
+                           filters={key: value for key, value in filters.items() if value},
+                           date_range={key: filters[key] for key in ('start', 'end') if filters[key]},
+                           people_days=PEOPLE_SUMMARY_DAYS)
+
+@app.route('/export')
+def export():
+    if 'username' not in session:
+        logging.warning("Unauthorized export access; redirecting to login")
+        return redirect(url_for('login'))
+    fmt = request.args.get('format', 'csv')
+    try:
+        filters = attendance_filters()
+    except ValueError:
+        flash("Invalid filter; dates must be YYYY-MM-DD", 'danger')
+        return redirect(url_for('dashboard'))
+    if fmt not in EXPORT_FORMATS:
+        flash(f"Unknown export format: {fmt}", 'danger')
+        return redirect(url_for('dashboard'))
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    logging.info(f"Streaming {fmt} attendance export for {session['username']}")
+    response = Response(stream_with_context(iter_export(fmt, start_day=filters['start'], end_day=filters['end'],
+                                                        name=filters['name'], camera=filters['camera'])),
+                        mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="attendance{extension}"'
+    return response
+
+recognition_process = None
+recognition_lock = threading.Lock()
+
+def recognition_service():
+    global recognition_process
+    with recognition_lock:
+        service, recognition_process = ensure_service(recognition_process)
+    return service
+
+# Device index or a camera name configured in cameras.json; raw files and
+# URLs are refused so users cannot make the server open them
+def requested_camera():
+    camera, _ = resolve_camera(request.args.get('camera', '0'))
+    return camera
 
 @app.route('/start_recognition')
 def start_recognition():
     if 'username' not in session:
         logging.warning("Unauthorized access to start_recognition; redirecting to login")
         return redirect(url_for('login'))
+    if session['role'] != 'admin':
+        flash('Only admins can start face recognition', 'danger')
+        return redirect(url_for('dashboard'))
     try:
-        # Run face_recognition_live.py as a subprocess with full Python path
-        python_path = sys.executable  # Use the same Python as the Flask app
-        script_path = os.path.join(os.getcwd(), 'face_recognition_live.py')
-        if not os.path.exists(script_path):
-            raise FileNotFoundError(f"face_recognition_live.py not found at {script_path}")
-        log_file = 'face_recognition_log.txt'
-        with open(log_file, 'a') as f:
-            process = subprocess.Popen([python_path, script_path], stdout=f, stderr=f)
-            logging.info(f"Face recognition started via subprocess with PID {process.pid}")
-        flash('Face recognition started', 'success')
+        camera = requested_camera()
+        if recognition_service().start(camera):
+            flash(f'Face recognition started on camera {camera}', 'success')
+            logging.info(f"Face recognition started on camera {camera}")
+        else:
+            flash(f'Face recognition is already running on camera {camera}', 'info')
     except Exception as e:
         flash(f"Failed to start face recognition: {e}", 'danger')
-        logging.error(f"Subprocess error: {e}")
+        logging.error(f"Recognition service error: {e}")
+    return redirect(url_for('dashboard'))
+
+@app.route('/stop_recognition')
+def stop_recognition():
+    if 'username' not in session:
+        logging.warning("Unauthorized access to stop_recognition; redirecting to login")
+        return redirect(url_for('login'))
+    if session['role'] != 'admin':
+        flash('Only admins can stop face recognition', 'danger')
+        return redirect(url_for('dashboard'))
+    try:
+        camera = requested_camera()
+        if recognition_service().stop(camera):
+            flash(f'Face recognition stopped on camera {camera}', 'success')
+        else:
+            flash(f'Face recognition is not running on camera {camera}', 'info')
+    except Exception as e:
+        flash(f"Failed to stop face recognition: {e}", 'danger')
+        logging.error(f"Recognition service error: {e}")
     return redirect(url_for('dashboard'))
 
+@app.route('/recognition/status')
+def recognition_status():
+    if 'username' not in session:
+        return jsonify({'error': 'authentication required'}), 401
+    try:
+        return jsonify(connect().status())
+    except (OSError, EOFError, AuthenticationError) as e:
+        if not isinstance(e, (FileNotFoundError, ConnectionRefusedError)):
+            throttled_log.error('service-status', f"Recognition service unreachable: {e!r}")
+        return jsonify({'running': False, 'cameras': {}})
+
+@app.route('/recognition/reload', methods=['POST'])
+def reload_gallery():
+    if 'username' not in session or session['role'] != 'admin':
+        return jsonify({'error': 'admin required'}), 403
+    try:
+        return jsonify({'gallery_size': recognition_service().reload_gallery()})
+    except Exception as e:
+        logging.error(f"Gallery reload error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# Prometheus scrape target: this process's metrics followed by the recognition
+# service's (capture/detect/encode/match/DB-write latency, drops, queue depths)
+# when it is running. Nothing is started just to be scraped, and a service that
+# is down or unreachable (wrong key, socket permissions) only drops its part.
+# Cameras are labelled by index or configured name, never by source URL.
+@app.route('/metrics')
+def metrics():
+    body = REGISTRY.render()
+    try:
+        body += connect().metrics()
+    except (OSError, EOFError, AuthenticationError) as e:
+        if not isinstance(e, (FileNotFoundError, ConnectionRefusedError)):
+            throttled_log.error('metrics-scrape', f"Could not scrape the recognition service: {e!r}")
+    return Response(body, content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/logout')
 def logout():
     username = session.get('username', 'unknown')